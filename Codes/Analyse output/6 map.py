@@ -19,6 +19,10 @@ from rasterio.plot import plotting_extent
 from rasterio.warp import reproject, Resampling
 from rasterio.features import geometry_mask
 
+from pwtl.cache import LRUCache, grid_key, path_key
+from pwtl.render import decimate_for_display
+from pwtl.trace import Tracer
+
 
 # =========================================================
 # ====================== USER INPUT =======================
@@ -157,6 +161,15 @@ RESAMPLING_METHOD = Resampling.bilinear
 MASK_TO_BOUNDARY = True
 MASK_TO_WATERSHED = False
 
+# Decoded rasters, masks and reprojected shapes are shared by all panels
+# (interior years appear in two panels); least recently used entries
+# are dropped once this budget is exceeded
+RASTER_CACHE_MAX_MB = 4096
+
+# per-stage wall/CPU/I-O trace (JSON; Chrome trace too if TRACE_CHROME)
+TRACE_DIR = os.path.join(os.path.dirname(OUTPUT_PNG), "traces")
+TRACE_CHROME = False
+
 # ---------------- Map domain ----------------
 LON_MIN = -180
 LON_MAX = -7
@@ -334,6 +347,8 @@ mpl.rcParams["axes.labelsize"] = 10
 # =================== HELPER FUNCTIONS ====================
 # =========================================================
 
+RASTER_CACHE = LRUCache(RASTER_CACHE_MAX_MB * 1024 ** 2)
+
 def ensure_output_dir(path):
     folder = os.path.dirname(path)
     if folder:
@@ -447,13 +462,21 @@ def reproject_to_match(source_arr, source_transform, source_crs,
     return dst
 
 
-def mask_array_to_shape(arr, transform, shape_gdf):
-    mask_inside = geometry_mask(
-        shape_gdf.geometry,
-        transform=transform,
-        invert=True,
-        out_shape=arr.shape
-    )
+def mask_array_to_shape(arr, transform, shape_gdf, cache_key=None):
+    def build_mask():
+        return geometry_mask(
+            shape_gdf.geometry,
+            transform=transform,
+            invert=True,
+            out_shape=arr.shape
+        )
+
+    if cache_key is None:
+        mask_inside = build_mask()
+    else:
+        mask_inside = RASTER_CACHE.get(
+            ("mask",) + cache_key + (grid_key(arr.shape, transform, None),), build_mask
+        )
     out = arr.copy()
     out[~mask_inside] = np.nan
     return out
@@ -467,19 +490,36 @@ def prepare_shape_to_raster_crs(gdf, raster_crs):
     return gdf
 
 
+def cached_shape_to_raster_crs(gdf, raster_crs):
+    # keyed on the object: the shapefiles are read once in main() and live for the whole run
+    if gdf is None:
+        return gdf
+    return RASTER_CACHE.get(
+        ("shape", id(gdf), str(raster_crs)),
+        lambda: prepare_shape_to_raster_crs(gdf, raster_crs)
+    )
+
+
 def calculate_difference_map(map1_path, map2_path, boundary_gdf=None, watershed_gdf=None):
-    arr1, profile1, transform1, crs1, bounds1, extent1, nodata1 = read_raster(map1_path)
-    arr2, profile2, transform2, crs2, bounds2, extent2, nodata2 = read_raster(map2_path)
+    arr1, profile1, transform1, crs1, bounds1, extent1, nodata1 = RASTER_CACHE.get(
+        ("raster", path_key(map1_path)), lambda: read_raster(map1_path)
+    )
+    arr2, profile2, transform2, crs2, bounds2, extent2, nodata2 = RASTER_CACHE.get(
+        ("raster", path_key(map2_path)), lambda: read_raster(map2_path)
+    )
 
     if arr1.shape != arr2.shape or transform1 != transform2 or crs1 != crs2:
-        arr2_match = reproject_to_match(
-            source_arr=arr2,
-            source_transform=transform2,
-            source_crs=crs2,
-            target_shape=arr1.shape,
-            target_transform=transform1,
-            target_crs=crs1,
-            src_nodata=np.nan
+        arr2_match = RASTER_CACHE.get(
+            ("reprojected", path_key(map2_path), grid_key(arr1.shape, transform1, crs1)),
+            lambda: reproject_to_match(
+                source_arr=arr2,
+                source_transform=transform2,
+                source_crs=crs2,
+                target_shape=arr1.shape,
+                target_transform=transform1,
+                target_crs=crs1,
+                src_nodata=np.nan
+            )
         )
     else:
         arr2_match = arr2
@@ -487,14 +527,14 @@ def calculate_difference_map(map1_path, map2_path, boundary_gdf=None, watershed_
     diff = DIFF_SIGN * (arr2_match - arr1) * DIFF_MULTIPLIER
     diff = diff.astype(np.float32)
 
-    boundary_use = prepare_shape_to_raster_crs(boundary_gdf, crs1)
-    watershed_use = prepare_shape_to_raster_crs(watershed_gdf, crs1)
+    boundary_use = cached_shape_to_raster_crs(boundary_gdf, crs1)
+    watershed_use = cached_shape_to_raster_crs(watershed_gdf, crs1)
 
     if MASK_TO_BOUNDARY and boundary_use is not None and not boundary_use.empty:
-        diff = mask_array_to_shape(diff, transform1, boundary_use)
+        diff = mask_array_to_shape(diff, transform1, boundary_use, cache_key=(id(boundary_gdf), str(crs1)))
 
     if MASK_TO_WATERSHED and watershed_use is not None and not watershed_use.empty:
-        diff = mask_array_to_shape(diff, transform1, watershed_use)
+        diff = mask_array_to_shape(diff, transform1, watershed_use, cache_key=(id(watershed_gdf), str(crs1)))
 
     return diff, extent1, bounds1, transform1, crs1, boundary_use, watershed_use
 
@@ -705,7 +745,8 @@ def plot_panel_map(ax_map, ax_right, ax_bottom, panel_cfg, cmap, norm,
     label = panel_cfg["label"]
     pie_values = panel_cfg["pie_values"]
 
-    diff_ma = np.ma.masked_invalid(diff_arr)
+    # profiles use the full-resolution diff; the map only needs what OUTPUT_DPI can show
+    diff_ma = np.ma.masked_invalid(decimate_for_display(diff_arr, ax_map, OUTPUT_DPI))
 
     im = ax_map.imshow(
         diff_ma,
@@ -719,7 +760,7 @@ def plot_panel_map(ax_map, ax_right, ax_bottom, panel_cfg, cmap, norm,
     )
 
     if SHOW_GREENLAND and greenland_gdf is not None and not greenland_gdf.empty:
-        greenland_use = greenland_gdf.to_crs(crs) if greenland_gdf.crs != crs else greenland_gdf
+        greenland_use = cached_shape_to_raster_crs(greenland_gdf, crs)
         greenland_use.plot(
             ax=ax_map,
             facecolor=GREENLAND_FACE,
@@ -950,6 +991,8 @@ def check_required_files():
 # =========================================================
 
 def main():
+    trace = Tracer(os.path.splitext(os.path.basename(__file__))[0])
+    trace.begin("setup")
     check_required_files()
 
     df, annual = load_csv_data(CSV_FILE)
@@ -978,6 +1021,7 @@ def main():
     axA1 = fig.add_subplot(outer[0, :])
     axA2 = fig.add_subplot(outer[1, :])
 
+    trace.begin("panel a")
     shared_lines = plot_panel_a(axA1, axA2, df, annual)
 
     positions = [
@@ -989,6 +1033,7 @@ def main():
     panel_axes = []
 
     for panel_cfg, pos in zip(MAP_PANELS, positions):
+        trace.begin(f"panel {panel_cfg['label']}")
         sub = pos.subgridspec(
             2, 2,
             width_ratios=[MAP_WIDTH_RATIO, RIGHT_PROFILE_WIDTH_RATIO],
@@ -1021,6 +1066,7 @@ def main():
         scale_axes_box(ax_right, sx=RIGHT_PROFILE_WIDTH_SCALE, sy=RIGHT_PROFILE_HEIGHT_SCALE)
         scale_axes_box(ax_bottom, sx=BOTTOM_PROFILE_WIDTH_SCALE, sy=BOTTOM_PROFILE_HEIGHT_SCALE)
 
+    trace.begin("saving")
     cax = fig.add_axes([CBAR_X, CBAR_Y, CBAR_W, CBAR_H])
     cb = fig.colorbar(
         sm_cbar,
@@ -1042,6 +1088,7 @@ def main():
     add_shared_y_axis_titles(fig)
 
     save_figure_outputs(fig)
+    trace.finish(TRACE_DIR, chrome=TRACE_CHROME)
 
     plt.show()
 
@@ -1049,6 +1096,7 @@ def main():
         print(f"PNG figure saved to:\n{OUTPUT_PNG}")
     if SAVE_PDF:
         print(f"PDF figure saved to:\n{OUTPUT_PDF}")
+    print(f"Raster {RASTER_CACHE.summary()}")
 
 
 if __name__ == "__main__":
@@ -17,22 +17,50 @@ Your requested changes:
 Outputs:
 - GeoTIFF per year:  IQR_WB12Z_YYYY.tif   (masked outside NA boundary)
 - ONE combined figure: IQR_WB12Z_all_years.png and .pdf (dpi=1500)
+
+Long runs checkpoint the baseline accumulators every CHECKPOINT_INTERVAL_S
+and after each finished year; `python IQR.py --resume` continues an
+interrupted run (a checkpoint whose inputs or settings changed is ignored).
+
+Monthly updates: a full run saves the last 12 P-E months, their running sum
+and the current year's monthly z maps in STATE_DIR. `python IQR.py --update`
+then reads only the new month(s), rewrites that year's IQR tif and redraws
+the figure. Months inside the baseline years change the baseline and every
+past z score, so --update refuses them and needs a full run. For monthly
+updates, pick a baseline that ends before them, e.g.
+`python IQR.py --baseline-end 2020` for the full run and the same
+--baseline-start/--baseline-end for every --update.
+
+`python IQR.py --preview-factor 8` runs everything at 1/8 resolution into
+OUT_DIR/preview_x8, for checking the figure layout quickly.
 """
 
 import os
 import re
 import glob
 import math
-from collections import deque
+import argparse
+from collections import deque, defaultdict
+from functools import partial
 
 import numpy as np
 import rasterio
-from rasterio.windows import Window
-from rasterio.features import geometry_mask
 
 import geopandas as gpd
 import matplotlib.pyplot as plt
 
+from pwtl.blocks import auto_block_size, describe_budget, parse_memory, raster_block_shape
+from pwtl.checkpoint import Checkpoint, input_signature
+from pwtl.cog import open_cog
+from pwtl.incremental import RollingState, check_outside_baseline, months_after
+from pwtl.prefetch import DEFAULT_DEPTH, prefetch
+from pwtl.preview import open_raster, preview_dir, preview_dpi, set_preview_factor
+from pwtl.quantiles import nan_quartiles
+from pwtl.sketch import HistogramSketch
+from pwtl.storage import encode, read_decoded, set_scaling, storage_profile
+from pwtl.tilemask import TileMaskCache
+from pwtl.trace import Tracer
+
 
 # =========================
 # USER SETTINGS
@@ -44,15 +72,50 @@ OUT_DIR  = "/home/mohammad/Desktop/1"
 START_YEAR = 2001
 END_YEAR   = 2025
 
+# climatology the z scores refer to (or --baseline-start/--baseline-end);
+# --update only ingests months after the baseline end
 BASELINE_START = 2001
 BASELINE_END   = 2025
 
 BLOCK_SIZE = 512
+# memory budget, e.g. "8G" (or --max-memory 8G): when set, the block size is the
+# largest window that fits, aligned to the input GeoTIFF tiles, and BLOCK_SIZE is ignored
+MAX_MEMORY = None
+# inside-boundary tile masks (packed bits) are built once per grid/boundary/block here
+MASK_CACHE_DIR = os.path.join(OUT_DIR, "mask_cache")
+# IQR values are binned into a histogram sketch while the tifs are written
+# (saved next to them); the colour-scale vmax is its VMAX_PERCENTILE
+IQR_SKETCH_RANGE = (0.0, 20.0)
+IQR_SKETCH_BINS = 20000
+VMAX_PERCENTILE = 99
 DPI = 1500
 
+# yearly IQR GeoTIFF storage: "float32", "float16" or "int16" (value = stored * IQR_INT16_SCALE);
+# the compact profiles halve disk use and read bandwidth, readers decode transparently
+IQR_STORAGE = "float32"
+IQR_INT16_SCALE = 0.001
+
+# rolling state for --update (last 12 P-E months, running sum, current year's z maps)
+STATE_DIR = os.path.join(OUT_DIR, "state", "IQR_WB12Z")
+# --resume checkpoints: baseline accumulators (at most every CHECKPOINT_INTERVAL_S) and finished years
+CHECKPOINT_DIR = os.path.join(OUT_DIR, "checkpoints")
+CHECKPOINT_INTERVAL_S = 600
+
+# per-stage wall/CPU/I-O trace (JSON; Chrome trace too if TRACE_CHROME)
+TRACE_DIR = os.path.join(OUT_DIR, "traces")
+TRACE_CHROME = False
+
 NA_BOUNDARY_SHP = "/home/mohammad/Desktop/N_America_shapefile/N_America_boundery_without_greenland.shp"
 GREENLAND_SHP   = "/home/mohammad/Desktop/N_America_shapefile/N_America_level2_watershed_without_greenland.shp"
 
+# Working set for MAX_MEMORY, as (count, dtype) per pixel:
+# per window: 12-month deque + its stack, 12 z maps + sorted copy, ~8 temporaries, masks,
+# P-E months read ahead
+WINDOW_TERMS = [(12, "float32"), (12, "float32"), (12, "float32"), (12, "float32"),
+                (8, "float32"), (4, "bool"), (DEFAULT_DEPTH, "float32")]
+# whole grid: baseline mean, m2, std + count
+GRID_TERMS = [(3, "float32"), (1, "int32")]
+
 # Plot look
 COLORMAP = "Greens"         # close to your example
 # =========================
@@ -88,17 +151,9 @@ def list_common_months(prec_dir, evap_dir):
     return common
 
 
-def iter_windows(width, height, block):
-    for r in range(0, height, block):
-        h = min(block, height - r)
-        for c in range(0, width, block):
-            w = min(block, width - c)
-            yield Window(c, r, w, h)
-
-
 def read_block(path, window, nodata):
-    with rasterio.open(path) as src:
-        a = src.read(1, window=window).astype(np.float32)
+    with open_raster(path) as src:
+        a = read_decoded(src, 1, window=window)
     if nodata is not None:
         a[(a == nodata) | (~np.isfinite(a))] = np.nan
     else:
@@ -106,19 +161,11 @@ def read_block(path, window, nodata):
     return a
 
 
-def make_inside_mask_for_window(window: Window, window_transform, shapes):
-    """
-    Returns boolean array True for pixels INSIDE shapes.
-    """
-    # geometry_mask returns True for OUTSIDE by default; use invert=True for inside
-    inside = geometry_mask(
-        shapes,
-        out_shape=(int(window.height), int(window.width)),
-        transform=window_transform,
-        invert=True,
-        all_touched=False
-    )
-    return inside
+def read_pe(yyyymm, prec_dir, evap_dir, window, nodata):
+    """P - E of one month for `window` (the prefetch() loader)."""
+    p = read_block(os.path.join(prec_dir, f"N_America_{yyyymm}_precipitation.tif"), window, nodata)
+    e = read_block(os.path.join(evap_dir, f"N_America_{yyyymm}_evaporation.tif"), window, nodata)
+    return p - e
 
 
 def welford_update(mean, m2, count, x):
@@ -134,10 +181,10 @@ def welford_update(mean, m2, count, x):
 
 
 def compute_baseline_mean_std(months, prec_dir, evap_dir, baseline_start, baseline_end,
-                              block, na_shapes):
+                              tiles, ckpt=None, resume=None):
     # reference raster
     ref_p = os.path.join(prec_dir, f"N_America_{months[0]}_precipitation.tif")
-    with rasterio.open(ref_p) as ref:
+    with open_raster(ref_p) as ref:
         profile = ref.profile.copy()
         nodata = ref.nodata
         height, width = ref.height, ref.width
@@ -146,13 +193,23 @@ def compute_baseline_mean_std(months, prec_dir, evap_dir, baseline_start, baseli
     m2   = np.full((height, width), 0.0, dtype=np.float32)
     cnt  = np.zeros((height, width), dtype=np.int32)
 
-    for win in iter_windows(width, height, block):
+    start = 0
+    if resume is not None and resume.stage == "baseline":
+        mean[...] = resume.arrays["mean"]
+        m2[...]   = resume.arrays["m2"]
+        cnt[...]  = resume.arrays["cnt"]
+        start = int(resume.meta["next_window"])
+
+    for i, win in enumerate(tiles.all_windows()):
+        # finished before the interruption
+        if i < start:
+            continue
+        # fully outside the boundary: mean/m2/cnt stay 0 as for masked pixels
+        if tiles.is_outside(win):
+            continue
         wh, ww = int(win.height), int(win.width)
 
-        # window transform for correct masking
-        with rasterio.open(ref_p) as ref:
-            w_transform = ref.window_transform(win)
-        inside_na = make_inside_mask_for_window(win, w_transform, na_shapes)
+        inside_na = tiles.window_mask(win)
 
         w_mean = np.zeros((wh, ww), dtype=np.float32)
         w_m2   = np.zeros((wh, ww), dtype=np.float32)
@@ -160,16 +217,11 @@ def compute_baseline_mean_std(months, prec_dir, evap_dir, baseline_start, baseli
 
         pe_deque = deque(maxlen=12)
 
-        for yyyymm in months:
+        # next months are read in the background while this one is processed
+        read = partial(read_pe, prec_dir=prec_dir, evap_dir=evap_dir, window=win, nodata=nodata)
+        for yyyymm, pe in prefetch(months, read):
             y, _ = yyyymm_to_year_month(yyyymm)
 
-            p_path = os.path.join(prec_dir, f"N_America_{yyyymm}_precipitation.tif")
-            e_path = os.path.join(evap_dir, f"N_America_{yyyymm}_evaporation.tif")
-
-            p = read_block(p_path, win, nodata)
-            e = read_block(e_path, win, nodata)
-            pe = p - e
-
             # restrict computation to NA boundary only
             pe[~inside_na] = np.nan
 
@@ -188,6 +240,9 @@ def compute_baseline_mean_std(months, prec_dir, evap_dir, baseline_start, baseli
         m2[r0:r1, c0:c1]   = w_m2
         cnt[r0:r1, c0:c1]  = w_cnt
 
+        if ckpt is not None and ckpt.due():
+            ckpt.save("baseline", {"mean": mean, "m2": m2, "cnt": cnt}, next_window=i + 1)
+
     std = np.full_like(mean, np.nan, dtype=np.float32)
     ok = cnt > 1
     std[ok] = np.sqrt(m2[ok] / (cnt[ok].astype(np.float32) - 1.0))
@@ -197,26 +252,34 @@ def compute_baseline_mean_std(months, prec_dir, evap_dir, baseline_start, baseli
 
 
 def compute_yearly_iqr_tifs(months, years, prec_dir, evap_dir, mean, std, profile, nodata,
-                            out_dir, block, na_shapes):
+                            out_dir, tiles, state=None, ckpt=None, done_years=()):
 
     height, width = mean.shape
 
-    profile_out = profile.copy()
-    profile_out.update(dtype="float32", count=1, nodata=np.nan, compress="deflate")
-
-    # reference raster for window transforms
-    ref_p = os.path.join(prec_dir, f"N_America_{months[0]}_precipitation.tif")
+    profile_out = storage_profile(dict(profile, count=1), IQR_STORAGE)
+    sketch = HistogramSketch(*IQR_SKETCH_RANGE, n_bins=IQR_SKETCH_BINS)
+    done_years = list(done_years)
 
     for year in years:
         out_tif = os.path.join(out_dir, f"IQR_WB12Z_{year}.tif")
+        if year in done_years and os.path.exists(out_tif):
+            print(f"\nYear {year}: finished before the interruption, skipped.")
+            sketch.merge(HistogramSketch.load(ckpt.file(f"sketch_{year}.npz")))
+            continue
         print(f"\nYear {year}: computing IQR tif...")
+        year_sketch = HistogramSketch(*IQR_SKETCH_RANGE, n_bins=IQR_SKETCH_BINS)
 
-        with rasterio.open(ref_p) as ref, rasterio.open(out_tif, "w", **profile_out) as dst:
-            for win in iter_windows(width, height, block):
+        with open_cog(out_tif, profile_out) as dst:
+            set_scaling(dst, IQR_STORAGE, IQR_INT16_SCALE)
+            for win in tiles.all_windows():
                 wh, ww = int(win.height), int(win.width)
 
-                w_transform = ref.window_transform(win)
-                inside_na = make_inside_mask_for_window(win, w_transform, na_shapes)
+                if tiles.is_outside(win):
+                    dst.write(encode(np.full((wh, ww), np.nan, dtype=np.float32), IQR_STORAGE, IQR_INT16_SCALE),
+                              1, window=win)
+                    continue
+
+                inside_na = tiles.window_mask(win)
 
                 r0, c0 = int(win.row_off), int(win.col_off)
                 r1, c1 = r0 + wh, c0 + ww
@@ -227,15 +290,9 @@ def compute_yearly_iqr_tifs(months, years, prec_dir, evap_dir, mean, std, profil
                 pe_deque = deque(maxlen=12)
                 z_months = []
 
-                for yyyymm in months:
+                read = partial(read_pe, prec_dir=prec_dir, evap_dir=evap_dir, window=win, nodata=nodata)
+                for yyyymm, pe in prefetch(months, read):
                     y, _ = yyyymm_to_year_month(yyyymm)
-
-                    p_path = os.path.join(prec_dir, f"N_America_{yyyymm}_precipitation.tif")
-                    e_path = os.path.join(evap_dir, f"N_America_{yyyymm}_evaporation.tif")
-
-                    p = read_block(p_path, win, nodata)
-                    e = read_block(e_path, win, nodata)
-                    pe = p - e
                     pe[~inside_na] = np.nan
 
                     pe_deque.append(pe)
@@ -257,36 +314,160 @@ def compute_yearly_iqr_tifs(months, years, prec_dir, evap_dir, mean, std, profil
                 if len(z_months) == 0:
                     iqr = np.full((wh, ww), np.nan, dtype=np.float32)
                 else:
-                    stack = np.stack(z_months, axis=0)
-                    q25 = np.nanpercentile(stack, 25, axis=0)
-                    q75 = np.nanpercentile(stack, 75, axis=0)
+                    q25, q75 = nan_quartiles(np.stack(z_months, axis=0), overwrite_input=True)
                     iqr = (q75 - q25).astype(np.float32)
                     iqr[~inside_na] = np.nan
 
-                dst.write(iqr, 1, window=win)
-
+                dst.write(encode(iqr, IQR_STORAGE, IQR_INT16_SCALE), 1, window=win)
+                year_sketch.update(iqr)
+
+        sketch.merge(year_sketch)
+        if state is not None:
+            # per-year, so an update can replace the current year's values
+            year_sketch.save(state.file(f"sketch_{year}.npz"))
+        if ckpt is not None:
+            year_sketch.save(ckpt.file(f"sketch_{year}.npz"))
+            done_years.append(year)
+            ckpt.save("yearly", done_years=done_years)
         print(f"Saved tif: {out_tif}")
 
+    return sketch
 
-def robust_global_vmax(tif_paths, sample_step=8):
+
+def seed_rolling_state(months, prec_dir, evap_dir, mean, std, nodata, tiles, state):
     """
-    Estimate a single vmax for all panels using a robust percentile across all years.
-    Uses subsampling to stay fast.
+    Save what --update needs to continue the series: the last 12 P-E months
+    and their sum per pixel, and the z maps of the last year's months.
+    Reads only those months (at most 23), not the archive.
     """
-    vals = []
-    for p in tif_paths:
-        with rasterio.open(p) as src:
-            a = src.read(1)
-        a = a[np.isfinite(a)]
-        if a.size == 0:
+    height, width = mean.shape
+    last_year, _ = yyyymm_to_year_month(months[-1])
+    n_year = sum(1 for m in months if yyyymm_to_year_month(m)[0] == last_year)
+    tail = months[-(11 + n_year):]
+
+    ring  = state.open_array("ring", shape=(12, height, width), dtype="float32", fill=np.nan)
+    rsum  = state.open_array("rsum", shape=(height, width), dtype="float64", fill=0.0)
+    zyear = state.open_array("zyear", shape=(12, height, width), dtype="float32", fill=np.nan)
+
+    for win in tiles.all_windows():
+        if tiles.is_outside(win):
             continue
-        # subsample
-        a = a[::sample_step]
-        vals.append(a)
-    if not vals:
-        return 1.0
-    allv = np.concatenate(vals)
-    return float(np.nanpercentile(allv, 99))  # robust upper limit
+        wh, ww = int(win.height), int(win.width)
+        inside_na = tiles.window_mask(win)
+
+        r0, c0 = int(win.row_off), int(win.col_off)
+        r1, c1 = r0 + wh, c0 + ww
+        w_mean = mean[r0:r1, c0:c1]
+        w_std  = std[r0:r1, c0:c1]
+
+        pe_deque = deque(maxlen=12)
+        read = partial(read_pe, prec_dir=prec_dir, evap_dir=evap_dir, window=win, nodata=nodata)
+        for yyyymm, pe in prefetch(tail, read):
+            y, mo = yyyymm_to_year_month(yyyymm)
+            pe[~inside_na] = np.nan
+
+            pe_deque.append(pe)
+            if len(pe_deque) < 12 or y != last_year:
+                continue
+
+            wb12 = np.nansum(np.stack(pe_deque, axis=0), axis=0).astype(np.float32)
+            valid = np.isfinite(wb12) & np.isfinite(w_mean) & np.isfinite(w_std)
+            z = np.full((wh, ww), np.nan, dtype=np.float32)
+            z[valid] = (wb12[valid] - w_mean[valid]) / w_std[valid]
+            z[~inside_na] = np.nan
+            zyear[mo - 1, r0:r1, c0:c1] = z
+
+        # oldest month first, so the ring slot to overwrite next is 0
+        stack = np.stack(pe_deque, axis=0)
+        ring[:, r0:r1, c0:c1] = stack
+        rsum[r0:r1, c0:c1] = np.nansum(stack.astype(np.float64), axis=0)
+
+    for a in (ring, rsum, zyear):
+        a.flush()
+    return last_year
+
+
+def update_yearly_iqr(state, new_months, prec_dir, evap_dir, profile, nodata, out_dir, tiles):
+    """
+    Ingest `new_months` into the saved state and rewrite the IQR tif of each
+    year they fall in. One read of each new month per window; the year's
+    other z maps come from the state.
+    """
+    mean  = state.load_array("mean")
+    std   = state.load_array("std")
+    ring  = state.open_array("ring")
+    rsum  = state.open_array("rsum")
+    zyear = state.open_array("zyear")
+    slot = int(state.meta["slot"])
+    cur_year = int(state.meta["year"])
+
+    profile_out = storage_profile(dict(profile, count=1), IQR_STORAGE)
+
+    by_year = defaultdict(list)
+    for yyyymm in new_months:
+        by_year[yyyymm_to_year_month(yyyymm)[0]].append(yyyymm)
+
+    for year in sorted(by_year):
+        ym = by_year[year]
+        out_tif = os.path.join(out_dir, f"IQR_WB12Z_{year}.tif")
+        print(f"\nYear {year}: adding {', '.join(ym)} and rewriting IQR tif...")
+        year_sketch = HistogramSketch(*IQR_SKETCH_RANGE, n_bins=IQR_SKETCH_BINS)
+
+        with open_cog(out_tif, profile_out) as dst:
+            set_scaling(dst, IQR_STORAGE, IQR_INT16_SCALE)
+            for win in tiles.all_windows():
+                wh, ww = int(win.height), int(win.width)
+
+                if tiles.is_outside(win):
+                    dst.write(encode(np.full((wh, ww), np.nan, dtype=np.float32), IQR_STORAGE, IQR_INT16_SCALE),
+                              1, window=win)
+                    continue
+
+                inside_na = tiles.window_mask(win)
+
+                r0, c0 = int(win.row_off), int(win.col_off)
+                r1, c1 = r0 + wh, c0 + ww
+                w_mean = np.asarray(mean[r0:r1, c0:c1])
+                w_std  = np.asarray(std[r0:r1, c0:c1])
+                acc = np.array(rsum[r0:r1, c0:c1], dtype=np.float64)
+
+                if year != cur_year:
+                    zyear[:, r0:r1, c0:c1] = np.nan
+
+                read = partial(read_pe, prec_dir=prec_dir, evap_dir=evap_dir, window=win, nodata=nodata)
+                for i, (yyyymm, pe) in enumerate(prefetch(ym, read)):
+                    _, mo = yyyymm_to_year_month(yyyymm)
+                    s = (slot + i) % 12
+                    pe[~inside_na] = np.nan
+
+                    # running nansum: NaN months contribute 0, as np.nansum over the deque
+                    acc += np.nan_to_num(pe, nan=0.0) - np.nan_to_num(ring[s, r0:r1, c0:c1], nan=0.0)
+                    ring[s, r0:r1, c0:c1] = pe
+                    wb12 = acc.astype(np.float32)
+
+                    valid = np.isfinite(wb12) & np.isfinite(w_mean) & np.isfinite(w_std)
+                    z = np.full((wh, ww), np.nan, dtype=np.float32)
+                    z[valid] = (wb12[valid] - w_mean[valid]) / w_std[valid]
+                    z[~inside_na] = np.nan
+                    zyear[mo - 1, r0:r1, c0:c1] = z
+
+                rsum[r0:r1, c0:c1] = acc
+
+                q25, q75 = nan_quartiles(np.array(zyear[:, r0:r1, c0:c1]), overwrite_input=True)
+                iqr = (q75 - q25).astype(np.float32)
+                iqr[~inside_na] = np.nan
+
+                dst.write(encode(iqr, IQR_STORAGE, IQR_INT16_SCALE), 1, window=win)
+                year_sketch.update(iqr)
+
+        year_sketch.save(state.file(f"sketch_{year}.npz"))
+        slot = (slot + len(ym)) % 12
+        cur_year = year
+        print(f"Saved tif: {out_tif}")
+
+    for a in (ring, rsum, zyear):
+        a.flush()
+    state.meta.update(slot=slot, year=cur_year)
 
 
 def plot_all_years_one_figure(years, tif_paths, out_png, out_pdf,
@@ -317,7 +498,7 @@ def plot_all_years_one_figure(years, tif_paths, out_png, out_pdf,
         ax = axes[r, c]
 
         with rasterio.open(tif_paths[i]) as src:
-            arr = src.read(1)
+            arr = read_decoded(src, 1)
 
         im = ax.imshow(arr, extent=extent, origin="upper", cmap=cmap, vmin=vmin, vmax=vmax)
         mappable = im
@@ -351,12 +532,33 @@ def plot_all_years_one_figure(years, tif_paths, out_png, out_pdf,
 
 
 def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--max-memory", default=MAX_MEMORY, help="memory budget, e.g. 8G (sets the block size)")
+    ap.add_argument("--baseline-start", type=int, default=BASELINE_START, help="baseline start year")
+    ap.add_argument("--baseline-end", type=int, default=BASELINE_END, help="baseline end year")
+    ap.add_argument("--update", action="store_true",
+                    help="ingest only the months after the saved state (see STATE_DIR)")
+    ap.add_argument("--resume", action="store_true",
+                    help="continue an interrupted full run from its last checkpoint (see CHECKPOINT_DIR)")
+    ap.add_argument("--preview-factor", type=int, default=1,
+                    help="read inputs at 1/N resolution (~N^2 faster) to check the figure; outputs go to preview_xN")
+    args = ap.parse_args()
+
+    # a preview keeps its outputs, state and checkpoints apart from the full-resolution ones
+    set_preview_factor(args.preview_factor)
+    out_dir = preview_dir(OUT_DIR)
+    state_dir = preview_dir(STATE_DIR)
+    ckpt_dir = preview_dir(CHECKPOINT_DIR)
+
     # Checks
     if not os.path.isdir(PREC_DIR):
         raise SystemExit(f"Precip folder not found: {PREC_DIR}")
     if not os.path.isdir(EVAP_DIR):
         raise SystemExit(f"Evap folder not found: {EVAP_DIR}")
-    os.makedirs(OUT_DIR, exist_ok=True)
+    os.makedirs(out_dir, exist_ok=True)
+
+    trace = Tracer("IQR")
+    trace.begin("setup")
 
     months = list_common_months(PREC_DIR, EVAP_DIR)
     print(f"Found {len(months)} common months.")
@@ -364,8 +566,10 @@ def main():
 
     # Reference CRS
     ref_p = os.path.join(PREC_DIR, f"N_America_{months[0]}_precipitation.tif")
-    with rasterio.open(ref_p) as ref:
+    with open_raster(ref_p) as ref:
         raster_crs = ref.crs
+        ref_transform = ref.transform
+        ref_width, ref_height = ref.width, ref.height
 
     # Load shapefiles and reproject to raster CRS
     if not os.path.exists(NA_BOUNDARY_SHP):
@@ -386,35 +590,113 @@ def main():
 
     # For masking computations: use NA boundary geometries
     na_shapes = [geom for geom in na_gdf.geometry if geom is not None]
-
-    years = list(range(START_YEAR, END_YEAR + 1))
-
-    print("\nPASS 1: computing baseline mean/std of WB12 (masked to NA boundary) ...")
-    mean, std, profile, nodata = compute_baseline_mean_std(
-        months, PREC_DIR, EVAP_DIR, BASELINE_START, BASELINE_END, BLOCK_SIZE, na_shapes
+    block = BLOCK_SIZE
+    if args.max_memory:
+        budget = parse_memory(args.max_memory)
+        block = auto_block_size(
+            budget, WINDOW_TERMS, GRID_TERMS, shape=(ref_height, ref_width),
+            block_shape=raster_block_shape(ref_p)
+        )
+        print("Memory budget:", describe_budget(block, budget, WINDOW_TERMS, GRID_TERMS, (ref_height, ref_width)))
+
+    tiles = TileMaskCache(
+        na_shapes, ref_width, ref_height, ref_transform, block,
+        crs=raster_crs, cache_dir=MASK_CACHE_DIR
     )
+    print(f"Boundary mask: {tiles.summary()}")
 
-    print("\nPASS 2: computing yearly IQR GeoTIFFs (masked to NA boundary) ...")
-    compute_yearly_iqr_tifs(
-        months, years, PREC_DIR, EVAP_DIR, mean, std, profile, nodata,
-        out_dir=OUT_DIR, block=BLOCK_SIZE, na_shapes=na_shapes
-    )
+    years = list(range(START_YEAR, END_YEAR + 1))
+    state = RollingState(state_dir)
+
+    if args.update:
+        trace.begin("incremental update")
+        state.load(baseline=[args.baseline_start, args.baseline_end], shape=[ref_height, ref_width])
+        new_months = months_after(months, state.meta["last"])
+        if new_months:
+            check_outside_baseline(new_months, args.baseline_start, args.baseline_end)
+            print(f"\nUPDATE: ingesting {len(new_months)} new month(s): {new_months[0]} -> {new_months[-1]}")
+            with open_raster(ref_p) as ref:
+                profile, nodata = ref.profile.copy(), ref.nodata
+            state.begin_update()
+            update_yearly_iqr(state, new_months, PREC_DIR, EVAP_DIR, profile, nodata, out_dir, tiles)
+            state.commit(last=new_months[-1])
+        else:
+            print(f"\nUPDATE: state is current (last month {state.meta['last']}), redrawing only.")
+
+        years = list(range(START_YEAR, max(END_YEAR, int(state.meta["year"])) + 1))
+        sketch = HistogramSketch(*IQR_SKETCH_RANGE, n_bins=IQR_SKETCH_BINS)
+        for y in years:
+            if os.path.exists(state.file(f"sketch_{y}.npz")):
+                sketch.merge(HistogramSketch.load(state.file(f"sketch_{y}.npz")))
+    else:
+        if len(months) < 12:
+            raise RuntimeError(f"Need at least 12 months for WB12, found {len(months)}.")
+
+        inputs = [os.path.join(d, f"N_America_{m}_{v}.tif")
+                  for m in months for d, v in ((PREC_DIR, "precipitation"), (EVAP_DIR, "evaporation"))]
+        ckpt = Checkpoint(
+            ckpt_dir, "IQR_WB12Z",
+            input_signature(inputs, START_YEAR, END_YEAR, args.baseline_start, args.baseline_end, block,
+                            NA_BOUNDARY_SHP, IQR_STORAGE, IQR_INT16_SCALE),
+            interval_s=CHECKPOINT_INTERVAL_S,
+        )
+        resume = ckpt.load() if args.resume else None
+        if resume is None:
+            ckpt.clear()
+
+        trace.begin("baseline pass")
+        if resume is not None and resume.stage == "yearly":
+            print("\nPASS 1: baseline mean/std restored from checkpoint.")
+            mean, std = resume.arrays["mean"], resume.arrays["std"]
+            with open_raster(ref_p) as ref:
+                profile, nodata = ref.profile.copy(), ref.nodata
+            done_years = resume.meta["done_years"]
+        else:
+            print("\nPASS 1: computing baseline mean/std of WB12 (masked to NA boundary) ...")
+            mean, std, profile, nodata = compute_baseline_mean_std(
+                months, PREC_DIR, EVAP_DIR, args.baseline_start, args.baseline_end, tiles,
+                ckpt=ckpt, resume=resume
+            )
+            ckpt.save("yearly", {"mean": mean, "std": std}, done_years=[])
+            done_years = []
+        state.create(keep_arrays=resume is not None,
+                     baseline=[args.baseline_start, args.baseline_end], shape=[ref_height, ref_width])
+        state.save_array("mean", mean)
+        state.save_array("std", std)
+
+        trace.begin("yearly IQR pass")
+        print("\nPASS 2: computing yearly IQR GeoTIFFs (masked to NA boundary) ...")
+        sketch = compute_yearly_iqr_tifs(
+            months, years, PREC_DIR, EVAP_DIR, mean, std, profile, nodata,
+            out_dir=out_dir, tiles=tiles, state=state, ckpt=ckpt, done_years=done_years
+        )
+
+        trace.begin("rolling state")
+        last_year = seed_rolling_state(months, PREC_DIR, EVAP_DIR, mean, std, nodata, tiles, state)
+        state.commit(last=months[-1], slot=0, year=last_year)
+        print(f"Saved rolling state for --update: {state_dir}")
+        ckpt.clear()
 
     # Build combined figure (all years)
-    tif_paths = [os.path.join(OUT_DIR, f"IQR_WB12Z_{y}.tif") for y in years]
+    sketch_path = os.path.join(out_dir, "IQR_WB12Z_sketch.npz")
+    sketch.save(sketch_path)
+    print(f"Saved IQR sketch ({sketch.count} values): {sketch_path}")
+
+    tif_paths = [os.path.join(out_dir, f"IQR_WB12Z_{y}.tif") for y in years]
     missing = [p for p in tif_paths if not os.path.exists(p)]
     if missing:
         raise SystemExit(f"Some output tifs are missing (first few):\n" + "\n".join(missing[:5]))
 
     # Choose a consistent color range across all panels
     vmin = 0.0
-    vmax = robust_global_vmax(tif_paths, sample_step=8)
+    vmax = sketch.percentile(VMAX_PERCENTILE) if sketch.count else 1.0
     if vmax <= vmin:
         vmax = vmin + 1.0
 
-    out_png = os.path.join(OUT_DIR, "IQR_WB12Z_all_years.png")
-    out_pdf = os.path.join(OUT_DIR, "IQR_WB12Z_all_years.pdf")
+    out_png = os.path.join(out_dir, "IQR_WB12Z_all_years.png")
+    out_pdf = os.path.join(out_dir, "IQR_WB12Z_all_years.pdf")
 
+    trace.begin("rendering")
     print(f"\nPlotting ONE combined figure for {len(years)} years...")
     plot_all_years_one_figure(
         years=years,
@@ -423,12 +705,13 @@ def main():
         out_pdf=out_pdf,
         na_gdf=na_gdf,
         greenland_gdf=greenland_gdf,
-        dpi=DPI,
+        dpi=preview_dpi(DPI),
         cmap=COLORMAP,
         vmin=vmin,
         vmax=vmax,
     )
 
+    trace.finish(TRACE_DIR, chrome=TRACE_CHROME)
     print("\nDone.")
     print(f"Combined figure saved:\n  {out_png}\n  {out_pdf}")
 
@@ -16,22 +16,34 @@ Greenland overlay (light gray fill + black edge) using:
 Outputs:
 - GeoTIFF per year:  IQR_WTD12Z_YYYY.tif   (masked outside NA boundary)
 - ONE combined figure: IQR_WTD12Z_all_years.png and .pdf (dpi=1500)
+
+--preview-factor N runs at 1/N resolution into OUT_DIR/preview_xN (layout checks).
 """
 
 import os
 import re
 import glob
 import math
+import argparse
 from collections import deque
+from functools import partial
 
 import numpy as np
 import rasterio
-from rasterio.windows import Window
-from rasterio.features import geometry_mask
 
 import geopandas as gpd
 import matplotlib.pyplot as plt
 
+from pwtl.blocks import auto_block_size, describe_budget, parse_memory, raster_block_shape
+from pwtl.cog import open_cog
+from pwtl.prefetch import DEFAULT_DEPTH, prefetch
+from pwtl.preview import open_raster, preview_dir, preview_dpi, set_preview_factor
+from pwtl.quantiles import nan_quartiles
+from pwtl.sketch import HistogramSketch
+from pwtl.storage import encode, read_decoded, set_scaling, storage_profile
+from pwtl.tilemask import TileMaskCache
+from pwtl.trace import Tracer
+
 
 # =========================
 # USER SETTINGS
@@ -46,11 +58,38 @@ BASELINE_START = 2000
 BASELINE_END   = 2025
 
 BLOCK_SIZE = 512
+# memory budget, e.g. "8G" (or --max-memory 8G): when set, the block size is the
+# largest window that fits, aligned to the input GeoTIFF tiles, and BLOCK_SIZE is ignored
+MAX_MEMORY = None
+# inside-boundary tile masks (packed bits) are built once per grid/boundary/block here
+MASK_CACHE_DIR = os.path.join(OUT_DIR, "mask_cache")
+# IQR values are binned into a histogram sketch while the tifs are written
+# (saved next to them); the colour-scale vmax is its VMAX_PERCENTILE
+IQR_SKETCH_RANGE = (0.0, 20.0)
+IQR_SKETCH_BINS = 20000
+VMAX_PERCENTILE = 99
 DPI = 1500
 
+# yearly IQR GeoTIFF storage: "float32", "float16" or "int16" (value = stored * IQR_INT16_SCALE);
+# the compact profiles halve disk use and read bandwidth, readers decode transparently
+IQR_STORAGE = "float32"
+IQR_INT16_SCALE = 0.001
+
+# per-stage wall/CPU/I-O trace (JSON; Chrome trace too if TRACE_CHROME)
+TRACE_DIR = os.path.join(OUT_DIR, "traces")
+TRACE_CHROME = False
+
 NA_BOUNDARY_SHP = "/home/mohammad/Desktop/N_America_shapefile/N_America_boundery_without_greenland.shp"
 GREENLAND_SHP   = "/home/mohammad/Desktop/N_America_shapefile/N_America_level2_watershed_without_greenland.shp"
 
+# Working set for MAX_MEMORY, as (count, dtype) per pixel:
+# per window: 12-month deque + its stack, 12 z maps + sorted copy, ~8 temporaries, masks,
+# months read ahead
+WINDOW_TERMS = [(12, "float32"), (12, "float32"), (12, "float32"), (12, "float32"),
+                (8, "float32"), (4, "bool"), (DEFAULT_DEPTH, "float32")]
+# whole grid: baseline mean, m2, std + count
+GRID_TERMS = [(3, "float32"), (1, "int32")]
+
 # Colorbar similar to your example figure
 COLORMAP = "Blues"
 # =========================
@@ -90,17 +129,9 @@ def list_monthly_wtd_files(wtd_dir):
     return items
 
 
-def iter_windows(width, height, block):
-    for r in range(0, height, block):
-        h = min(block, height - r)
-        for c in range(0, width, block):
-            w = min(block, width - c)
-            yield Window(c, r, w, h)
-
-
 def read_block(path, window, nodata):
-    with rasterio.open(path) as src:
-        a = src.read(1, window=window).astype(np.float32)
+    with open_raster(path) as src:
+        a = read_decoded(src, 1, window=window)
     if nodata is not None:
         a[(a == nodata) | (~np.isfinite(a))] = np.nan
     else:
@@ -108,16 +139,9 @@ def read_block(path, window, nodata):
     return a
 
 
-def make_inside_mask_for_window(window: Window, window_transform, shapes):
-    """Returns boolean array True for pixels INSIDE shapes."""
-    inside = geometry_mask(
-        shapes,
-        out_shape=(int(window.height), int(window.width)),
-        transform=window_transform,
-        invert=True,
-        all_touched=False
-    )
-    return inside
+def read_item(item, window, nodata):
+    """read_block for a (yyyymm, path) entry of wtd_items (the prefetch() loader)."""
+    return read_block(item[1], window, nodata)
 
 
 def welford_update(mean, m2, count, x):
@@ -132,12 +156,12 @@ def welford_update(mean, m2, count, x):
     m2[valid] += delta * delta2
 
 
-def compute_baseline_mean_std(wtd_items, baseline_start, baseline_end, block, na_shapes):
+def compute_baseline_mean_std(wtd_items, baseline_start, baseline_end, tiles):
     """
     Baseline mean/std of WTD12 (rolling 12-month mean), per pixel.
     """
     ref_path = wtd_items[0][1]
-    with rasterio.open(ref_path) as ref:
+    with open_raster(ref_path) as ref:
         profile = ref.profile.copy()
         nodata = ref.nodata
         height, width = ref.height, ref.width
@@ -146,12 +170,13 @@ def compute_baseline_mean_std(wtd_items, baseline_start, baseline_end, block, na
     m2   = np.full((height, width), 0.0, dtype=np.float32)
     cnt  = np.zeros((height, width), dtype=np.int32)
 
-    for win in iter_windows(width, height, block):
+    for win in tiles.all_windows():
+        # fully outside the boundary: mean/m2/cnt stay 0 as for masked pixels
+        if tiles.is_outside(win):
+            continue
         wh, ww = int(win.height), int(win.width)
 
-        with rasterio.open(ref_path) as ref:
-            w_transform = ref.window_transform(win)
-        inside_na = make_inside_mask_for_window(win, w_transform, na_shapes)
+        inside_na = tiles.window_mask(win)
 
         w_mean = np.zeros((wh, ww), dtype=np.float32)
         w_m2   = np.zeros((wh, ww), dtype=np.float32)
@@ -159,10 +184,10 @@ def compute_baseline_mean_std(wtd_items, baseline_start, baseline_end, block, na
 
         wtd_deque = deque(maxlen=12)
 
-        for yyyymm, fpath in wtd_items:
+        # next months are read in the background while this one is processed
+        read = partial(read_item, window=win, nodata=nodata)
+        for (yyyymm, _), wtd in prefetch(wtd_items, read):
             y, _ = yyyymm_to_year_month(yyyymm)
-
-            wtd = read_block(fpath, win, nodata)
             wtd[~inside_na] = np.nan
 
             wtd_deque.append(wtd)
@@ -189,7 +214,7 @@ def compute_baseline_mean_std(wtd_items, baseline_start, baseline_end, block, na
     return mean, std, profile, nodata
 
 
-def compute_yearly_iqr_tifs(wtd_items, years, mean, std, profile, nodata, out_dir, block, na_shapes):
+def compute_yearly_iqr_tifs(wtd_items, years, mean, std, profile, nodata, out_dir, tiles):
     """
     For each year:
       - build Z for each month of that year (from WTD12),
@@ -198,21 +223,24 @@ def compute_yearly_iqr_tifs(wtd_items, years, mean, std, profile, nodata, out_di
     """
     height, width = mean.shape
 
-    profile_out = profile.copy()
-    profile_out.update(dtype="float32", count=1, nodata=np.nan, compress="deflate")
-
-    ref_path = wtd_items[0][1]
+    profile_out = storage_profile(dict(profile, count=1), IQR_STORAGE)
+    sketch = HistogramSketch(*IQR_SKETCH_RANGE, n_bins=IQR_SKETCH_BINS)
 
     for year in years:
         out_tif = os.path.join(out_dir, f"IQR_WTD12Z_{year}.tif")
         print(f"\nYear {year}: computing IQR tif...")
 
-        with rasterio.open(ref_path) as ref, rasterio.open(out_tif, "w", **profile_out) as dst:
-            for win in iter_windows(width, height, block):
+        with open_cog(out_tif, profile_out) as dst:
+            set_scaling(dst, IQR_STORAGE, IQR_INT16_SCALE)
+            for win in tiles.all_windows():
                 wh, ww = int(win.height), int(win.width)
 
-                w_transform = ref.window_transform(win)
-                inside_na = make_inside_mask_for_window(win, w_transform, na_shapes)
+                if tiles.is_outside(win):
+                    dst.write(encode(np.full((wh, ww), np.nan, dtype=np.float32), IQR_STORAGE, IQR_INT16_SCALE),
+                              1, window=win)
+                    continue
+
+                inside_na = tiles.window_mask(win)
 
                 r0, c0 = int(win.row_off), int(win.col_off)
                 r1, c1 = r0 + wh, c0 + ww
@@ -223,10 +251,9 @@ def compute_yearly_iqr_tifs(wtd_items, years, mean, std, profile, nodata, out_di
                 wtd_deque = deque(maxlen=12)
                 z_months = []
 
-                for yyyymm, fpath in wtd_items:
+                read = partial(read_item, window=win, nodata=nodata)
+                for (yyyymm, _), wtd in prefetch(wtd_items, read):
                     y, _ = yyyymm_to_year_month(yyyymm)
-
-                    wtd = read_block(fpath, win, nodata)
                     wtd[~inside_na] = np.nan
 
                     wtd_deque.append(wtd)
@@ -248,31 +275,16 @@ def compute_yearly_iqr_tifs(wtd_items, years, mean, std, profile, nodata, out_di
                 if len(z_months) == 0:
                     iqr = np.full((wh, ww), np.nan, dtype=np.float32)
                 else:
-                    stack = np.stack(z_months, axis=0)
-                    q25 = np.nanpercentile(stack, 25, axis=0)
-                    q75 = np.nanpercentile(stack, 75, axis=0)
+                    q25, q75 = nan_quartiles(np.stack(z_months, axis=0), overwrite_input=True)
                     iqr = (q75 - q25).astype(np.float32)
                     iqr[~inside_na] = np.nan
 
-                dst.write(iqr, 1, window=win)
+                dst.write(encode(iqr, IQR_STORAGE, IQR_INT16_SCALE), 1, window=win)
+                sketch.update(iqr)
 
         print(f"Saved tif: {out_tif}")
 
-
-def robust_global_vmax(tif_paths, sample_step=8):
-    vals = []
-    for p in tif_paths:
-        with rasterio.open(p) as src:
-            a = src.read(1)
-        a = a[np.isfinite(a)]
-        if a.size == 0:
-            continue
-        a = a[::sample_step]
-        vals.append(a)
-    if not vals:
-        return 1.0
-    allv = np.concatenate(vals)
-    return float(np.nanpercentile(allv, 99))
+    return sketch
 
 
 def plot_all_years_one_figure(years, tif_paths, out_png, out_pdf,
@@ -301,7 +313,7 @@ def plot_all_years_one_figure(years, tif_paths, out_png, out_pdf,
         ax = axes[r, c]
 
         with rasterio.open(tif_paths[i]) as src:
-            arr = src.read(1)
+            arr = read_decoded(src, 1)
 
         im = ax.imshow(arr, extent=extent, origin="upper", cmap=cmap, vmin=vmin, vmax=vmax)
         mappable = im
@@ -331,9 +343,21 @@ def plot_all_years_one_figure(years, tif_paths, out_png, out_pdf,
 
 
 def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--max-memory", default=MAX_MEMORY, help="memory budget, e.g. 8G (sets the block size)")
+    ap.add_argument("--preview-factor", type=int, default=1,
+                    help="read inputs at 1/N resolution (~N^2 faster) to check the figure; outputs go to preview_xN")
+    args = ap.parse_args()
+
+    set_preview_factor(args.preview_factor)
+    out_dir = preview_dir(OUT_DIR)
+
     if not os.path.isdir(WTD_DIR):
         raise SystemExit(f"WTD folder not found: {WTD_DIR}")
-    os.makedirs(OUT_DIR, exist_ok=True)
+    os.makedirs(out_dir, exist_ok=True)
+
+    trace = Tracer("IQR_WTM")
+    trace.begin("setup")
 
     wtd_items = list_monthly_wtd_files(WTD_DIR)
     print(f"Found {len(wtd_items)} monthly WTD files.")
@@ -341,8 +365,10 @@ def main():
 
     # Reference CRS from first WTD raster
     ref_path = wtd_items[0][1]
-    with rasterio.open(ref_path) as ref:
+    with open_raster(ref_path) as ref:
         raster_crs = ref.crs
+        ref_transform = ref.transform
+        ref_width, ref_height = ref.width, ref.height
 
     # Load shapefiles and reproject to raster CRS
     if not os.path.exists(NA_BOUNDARY_SHP):
@@ -362,31 +388,52 @@ def main():
     greenland_gdf = greenland_gdf.to_crs(raster_crs)
 
     na_shapes = [geom for geom in na_gdf.geometry if geom is not None]
+    block = BLOCK_SIZE
+    if args.max_memory:
+        budget = parse_memory(args.max_memory)
+        block = auto_block_size(
+            budget, WINDOW_TERMS, GRID_TERMS, shape=(ref_height, ref_width),
+            block_shape=raster_block_shape(ref_path)
+        )
+        print("Memory budget:", describe_budget(block, budget, WINDOW_TERMS, GRID_TERMS, (ref_height, ref_width)))
+
+    tiles = TileMaskCache(
+        na_shapes, ref_width, ref_height, ref_transform, block,
+        crs=raster_crs, cache_dir=MASK_CACHE_DIR
+    )
+    print(f"Boundary mask: {tiles.summary()}")
     years = list(range(START_YEAR, END_YEAR + 1))
 
+    trace.begin("baseline pass")
     print("\nPASS 1: computing baseline mean/std of WTD12 (masked to NA boundary) ...")
     mean, std, profile, nodata = compute_baseline_mean_std(
-        wtd_items, BASELINE_START, BASELINE_END, BLOCK_SIZE, na_shapes
+        wtd_items, BASELINE_START, BASELINE_END, tiles
     )
 
+    trace.begin("yearly IQR pass")
     print("\nPASS 2: computing yearly IQR GeoTIFFs (masked to NA boundary) ...")
-    compute_yearly_iqr_tifs(
-        wtd_items, years, mean, std, profile, nodata, OUT_DIR, BLOCK_SIZE, na_shapes
+    sketch = compute_yearly_iqr_tifs(
+        wtd_items, years, mean, std, profile, nodata, out_dir, tiles
     )
 
-    tif_paths = [os.path.join(OUT_DIR, f"IQR_WTD12Z_{y}.tif") for y in years]
+    sketch_path = os.path.join(out_dir, "IQR_WTD12Z_sketch.npz")
+    sketch.save(sketch_path)
+    print(f"Saved IQR sketch ({sketch.count} values): {sketch_path}")
+
+    tif_paths = [os.path.join(out_dir, f"IQR_WTD12Z_{y}.tif") for y in years]
     missing = [p for p in tif_paths if not os.path.exists(p)]
     if missing:
         raise SystemExit(f"Some output tifs are missing (first few):\n" + "\n".join(missing[:5]))
 
     vmin = 0.0
-    vmax = robust_global_vmax(tif_paths, sample_step=8)
+    vmax = sketch.percentile(VMAX_PERCENTILE) if sketch.count else 1.0
     if vmax <= vmin:
         vmax = vmin + 1.0
 
-    out_png = os.path.join(OUT_DIR, "IQR_WTD12Z_all_years.png")
-    out_pdf = os.path.join(OUT_DIR, "IQR_WTD12Z_all_years.pdf")
+    out_png = os.path.join(out_dir, "IQR_WTD12Z_all_years.png")
+    out_pdf = os.path.join(out_dir, "IQR_WTD12Z_all_years.pdf")
 
+    trace.begin("rendering")
     print(f"\nPlotting ONE combined figure for {len(years)} years...")
     plot_all_years_one_figure(
         years=years,
@@ -395,12 +442,13 @@ def main():
         out_pdf=out_pdf,
         na_gdf=na_gdf,
         greenland_gdf=greenland_gdf,
-        dpi=DPI,
+        dpi=preview_dpi(DPI),
         cmap=COLORMAP,
         vmin=vmin,
         vmax=vmax,
     )
 
+    trace.finish(TRACE_DIR, chrome=TRACE_CHROME)
     print("\nDone.")
     print(f"Combined figure saved:\n  {out_png}\n  {out_pdf}")
 
@@ -18,13 +18,15 @@ import os
 import re
 import glob
 import numpy as np
-import geopandas as gpd
 import rasterio
 from rasterio.features import geometry_mask
 import matplotlib.pyplot as plt
 import matplotlib as mpl
 from matplotlib.ticker import FormatStrFormatter
 
+from pwtl.render import read_for_display
+from pwtl.overlays import read_overlay
+
 # =========================
 # USER PATHS
 # =========================
@@ -39,6 +41,12 @@ os.makedirs(OUT_DIR, exist_ok=True)
 OUT_PNG = os.path.join(OUT_DIR, "IQR_WTD12Z_2001_2025_panel.png")
 OUT_PDF = os.path.join(OUT_DIR, "IQR_WTD12Z_2001_2025_panel.pdf")
 
+# Maps are read at the resolution this DPI can show (decimated / overview reads)
+SAVE_DPI = 1500
+
+# Shapefiles reprojected to the raster CRS are cached here between runs
+OVERLAY_CACHE_DIR = os.path.join(OUT_DIR, "overlay_cache")
+
 # =========================
 # FIND + SORT FILES
 # =========================
@@ -65,12 +73,6 @@ pairs = [(y, p) for (y, p) in pairs if 2001 <= y <= 2025]
 if not pairs:
     raise FileNotFoundError("Found TIFFs, but none in the year range 2001–2025.")
 
-# =========================
-# READ SHAPEFILES ONCE
-# =========================
-g_green = gpd.read_file(GREENLAND_SHP)
-g_na = gpd.read_file(NA_BOUNDARY_SHP)
-
 # =========================
 # COLORBAR DOMAIN (FIXED)
 # =========================
@@ -109,23 +111,19 @@ for i, (year, tif) in enumerate(pairs):
     ax = fig.add_subplot(gs[r, c])
 
     with rasterio.open(tif) as src:
-        band = src.read(1).astype("float32")
-        nodata = src.nodata
-        if nodata is not None:
-            band[band == nodata] = np.nan
-        band[~np.isfinite(band)] = np.nan
+        band, display_transform = read_for_display(src, ax, SAVE_DPI)
 
         raster_crs = src.crs
         if raster_crs is None:
             raise RuntimeError(f"Raster has no CRS: {tif}")
 
-        na = g_na.to_crs(raster_crs)
-        green = g_green.to_crs(raster_crs)
+        na = read_overlay(NA_BOUNDARY_SHP, raster_crs, cache_dir=OVERLAY_CACHE_DIR)
+        green = read_overlay(GREENLAND_SHP, raster_crs, cache_dir=OVERLAY_CACHE_DIR)
 
         mask_in = geometry_mask(
             geometries=na.geometry,
-            out_shape=(src.height, src.width),
-            transform=src.transform,
+            out_shape=band.shape,
+            transform=display_transform,
             invert=True
         )
         band[~mask_in] = np.nan
@@ -171,8 +169,8 @@ cb.ax.tick_params(labelsize=11)
 # =========================
 # SAVE
 # =========================
-fig.savefig(OUT_PNG, dpi=1500, bbox_inches="tight")
-fig.savefig(OUT_PDF, dpi=1500, bbox_inches="tight")
+fig.savefig(OUT_PNG, dpi=SAVE_DPI, bbox_inches="tight")
+fig.savefig(OUT_PDF, dpi=SAVE_DPI, bbox_inches="tight")
 plt.close(fig)
 
 print("Saved:")
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Per-pixel SPI / SPEI maps (2000-2025) at 1, 3, 6 and 12-month scales.
+
+SPI_SPEI_monthly_2000_2025.py z-scores the domain-mean series. Here every
+pixel inside the NA boundary gets its own index, fitted per calendar month
+over the calibration years (pwtl/spi.py):
+- SPI  : gamma distribution of the P accumulations
+- SPEI : log-logistic distribution of the P - E accumulations
+
+Tiles are independent, so they are computed in WORKERS processes (each
+reads its P and E months, accumulates and fits the whole tile with
+vectorized L-moments) while the main process writes the finished
+tiles.
+
+Outputs (GeoTIFF stacks, one band per month, band descriptions YYYYMM,
+masked outside NA boundary):
+- SPI_<scale>_<start>_<end>.tif    e.g. SPI_03_2000_2025.tif
+- SPEI_<scale>_<start>_<end>.tif
+The first scale-1 months of each stack are NaN. The stacks can be read back
+as cubes (trend_maps.py --cube, extract_point_series.py --archive).
+
+Examples:
+  python SPI_SPEI_maps.py
+  python SPI_SPEI_maps.py --scales 3 12 --workers 8 --max-memory 32G
+  python SPI_SPEI_maps.py --preview-factor 8
+"""
+
+import os
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import ExitStack
+from functools import partial
+
+import numpy as np
+
+import geopandas as gpd
+
+from pwtl.blocks import auto_block_size, describe_budget, parse_memory, raster_block_shape
+from pwtl.cog import COG_BLOCK, open_cog
+from pwtl.points import ARCHIVE_PATTERNS, monthly_files
+from pwtl.prefetch import prefetch
+from pwtl.preview import open_raster, preview_dir, preview_factor, set_preview_factor
+from pwtl.spi import DISTRIBUTIONS, SCALES, rolling_sum, standardize
+from pwtl.storage import encode, read_decoded, set_scaling, storage_profile
+from pwtl.tilemask import TileMaskCache
+from pwtl.trace import Tracer
+
+
+# =========================
+# USER SETTINGS
+# =========================
+PREC_DIR = "/media/mohammad/My Book/0-2025/Monthly/pr/CMIP6/monthly/downscaled/N_America/1"
+EVAP_DIR = "/media/mohammad/My Book/0-2025/Monthly/evap/CMIP6/monthly/downscaled/N_America/1"
+OUT_DIR  = "/home/mohammad/Desktop/1"
+
+START_YEAR = 2000
+END_YEAR   = 2025
+
+# years the distributions are fitted on
+CALIB_START = 2000
+CALIB_END   = 2025
+
+# index stacks storage: "float32", "float16" or "int16" (value = stored * INDEX_INT16_SCALE)
+INDEX_STORAGE = "float32"
+INDEX_INT16_SCALE = 0.001
+
+# tiles computed in parallel processes (0 or 1 = in this process); a 512x512 tile of
+# 26 years at four scales holds ~3 GB, and up to 2 * WORKERS tiles are in flight
+WORKERS = 2
+
+# a multiple of the 512x512 output tiles (COG_BLOCK), so every tile of the
+# compressed work files is written once, whole
+BLOCK_SIZE = 512
+# memory budget, e.g. "8G" (or --max-memory 8G): when set, the block size is the
+# largest multiple of 512 that fits 2 * WORKERS tiles in flight, and BLOCK_SIZE is ignored
+MAX_MEMORY = None
+# inside-boundary tile masks (packed bits) are built once per grid/boundary/block here
+MASK_CACHE_DIR = os.path.join(OUT_DIR, "mask_cache")
+
+NA_BOUNDARY_SHP = "/home/mohammad/Desktop/N_America_shapefile/N_America_boundery_without_greenland.shp"
+
+# per-stage wall/CPU/I-O trace (JSON; Chrome trace too if TRACE_CHROME); worker
+# processes are not counted, so CPU and I/O of the tile pass are the main process's
+TRACE_DIR = os.path.join(OUT_DIR, "traces")
+TRACE_CHROME = False
+# =========================
+
+
+def list_months(start, end):
+    """Sorted [(yyyymm, p_path, e_path)] of the months both archives have in start..end."""
+    prec = dict(monthly_files(PREC_DIR, ARCHIVE_PATTERNS["P"]))
+    evap = dict(monthly_files(EVAP_DIR, ARCHIVE_PATTERNS["E"]))
+    common = sorted(m for m in set(prec) & set(evap) if start <= int(m[:4]) <= end)
+    if not common:
+        raise RuntimeError(f"No common YYYYMM in {start}-{end} between precip and evaporation folders.")
+    return [(m, prec[m], evap[m]) for m in common]
+
+
+def read_block(path, window, nodata, factor):
+    with open_raster(path, factor=factor) as src:
+        a = read_decoded(src, 1, window=window)
+    if nodata is not None:
+        a[(a == nodata) | (~np.isfinite(a))] = np.nan
+    else:
+        a[~np.isfinite(a)] = np.nan
+    return a
+
+
+def read_pe_pair(item, window, nodata, factor):
+    """(P, E) of one month for `window` (the prefetch() loader)."""
+    _, p_path, e_path = item
+    return read_block(p_path, window, nodata, factor), read_block(e_path, window, nodata, factor)
+
+
+def tile_indices(window, inside, months, calib, scales, nodata, factor):
+    """
+    All index stacks of one tile (runs in a worker process):
+    ({(name, scale): encoded (T, rows, cols) array}, {(name, scale): unfit pixel count}).
+    """
+    wh, ww = int(window.height), int(window.width)
+    p = np.full((len(months), wh, ww), np.nan, dtype=np.float32)
+    e = np.full((len(months), wh, ww), np.nan, dtype=np.float32)
+    read = partial(read_pe_pair, window=window, nodata=nodata, factor=factor)
+    for k, (_, (pk, ek)) in enumerate(prefetch(months, read)):
+        p[k], e[k] = pk, ek
+    p[:, ~inside] = np.nan
+    e[:, ~inside] = np.nan
+    # P - E into e, no third stack
+    np.subtract(p, e, out=e)
+
+    cal_months = np.array([int(m[0][4:6]) for m in months])
+    out, unfit_counts = {}, {}
+    for name, dist in DISTRIBUTIONS.items():
+        src = p if name == "SPI" else e
+        for scale in scales:
+            unfit = np.zeros((wh, ww), dtype=bool)
+            z = standardize(rolling_sum(src, scale), cal_months, dist, calib, unfit=unfit)
+            z[:, ~inside] = np.nan
+            out[(name, scale)] = encode(z, INDEX_STORAGE, INDEX_INT16_SCALE)
+            unfit_counts[(name, scale)] = int(np.count_nonzero(unfit & inside))
+    return out, unfit_counts
+
+
+def run_tiles(jobs, func, workers):
+    """
+    Yield (window, func(window, *args)) for jobs [(window, args)], computed in
+    `workers` processes with at most 2 * workers tiles in flight.
+    """
+    if workers <= 1:
+        for win, args in jobs:
+            yield win, func(win, *args)
+        return
+
+    jobs = iter(jobs)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        for win, args in jobs:
+            pending[pool.submit(func, win, *args)] = win
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                win = pending.pop(fut)
+                nxt = next(jobs, None)
+                if nxt is not None:
+                    pending[pool.submit(func, nxt[0], *nxt[1])] = nxt[0]
+                yield win, fut.result()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--start", type=int, default=START_YEAR, help="first year")
+    ap.add_argument("--end", type=int, default=END_YEAR, help="last year")
+    ap.add_argument("--scales", type=int, nargs="+", default=list(SCALES), help="accumulation scales in months")
+    ap.add_argument("--workers", type=int, default=WORKERS, help="tiles computed in parallel processes")
+    ap.add_argument("--max-memory", default=MAX_MEMORY, help="memory budget, e.g. 8G (sets the block size)")
+    ap.add_argument("--preview-factor", type=int, default=1,
+                    help="read inputs at 1/N resolution (~N^2 faster); outputs go to preview_xN")
+    args = ap.parse_args()
+
+    set_preview_factor(args.preview_factor)
+    out_dir = preview_dir(OUT_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+
+    trace = Tracer("SPI_SPEI_maps")
+    trace.begin("setup")
+    months = list_months(args.start, args.end)
+    calib = np.array([CALIB_START <= int(m[0][:4]) <= CALIB_END for m in months])
+    n_t = len(months)
+    print(f"Found {n_t} common months: {months[0][0]} -> {months[-1][0]} "
+          f"(calibration {CALIB_START}-{CALIB_END}: {int(calib.sum())} months)")
+    if max(args.scales) > n_t:
+        raise SystemExit(f"Scale {max(args.scales)} is longer than the {n_t}-month series.")
+
+    with open_raster(months[0][1]) as ref:
+        profile = ref.profile.copy()
+        nodata = ref.nodata
+        raster_crs, ref_transform = ref.crs, ref.transform
+        ref_width, ref_height = ref.width, ref.height
+
+    if not os.path.exists(NA_BOUNDARY_SHP):
+        raise SystemExit(f"NA boundary shapefile not found: {NA_BOUNDARY_SHP}")
+    na_gdf = gpd.read_file(NA_BOUNDARY_SHP)
+    if na_gdf.crs is None:
+        raise SystemExit("NA boundary shapefile has no CRS. Please define it (e.g., EPSG:4326) then rerun.")
+    na_shapes = [geom for geom in na_gdf.to_crs(raster_crs).geometry if geom is not None]
+
+    workers = max(1, args.workers)
+    products = [(name, scale) for name in DISTRIBUTIONS for scale in args.scales]
+    block = BLOCK_SIZE
+    if args.max_memory:
+        budget = parse_memory(args.max_memory)
+        # per tile, as (count, dtype) per pixel: P and P - E stacks, rolling sums + a
+        # per-month fit copy, the finished index stacks; up to 2 * workers tiles in flight
+        terms = [(2 * n_t, "float32"), (2 * n_t, "float64"), (len(products) * n_t, "float32")]
+        block = auto_block_size(
+            budget // (2 * workers), terms, (), shape=(ref_height, ref_width),
+            block_shape=raster_block_shape(months[0][1]), multiple=COG_BLOCK
+        )
+        print(f"Memory budget ({2 * workers} tiles in flight):",
+              describe_budget(block, budget // (2 * workers), terms, (), (ref_height, ref_width)))
+
+    trace.begin("boundary mask")
+    tiles = TileMaskCache(
+        na_shapes, ref_width, ref_height, ref_transform, block,
+        crs=raster_crs, cache_dir=MASK_CACHE_DIR
+    )
+    print(f"Boundary mask: {tiles.summary()}")
+
+    profile_out = storage_profile(dict(profile, count=n_t), INDEX_STORAGE)
+    paths = {(name, scale): os.path.join(out_dir, f"{name}_{scale:02d}_{args.start}_{args.end}.tif")
+             for name, scale in products}
+
+    # masks are unpacked as tiles are submitted, not all up front
+    outside = [win for win in tiles.all_windows() if tiles.is_outside(win)]
+    n_jobs = sum(1 for _ in tiles.all_windows()) - len(outside)
+    jobs = ((win, (tiles.window_mask(win), months, calib, args.scales, nodata, preview_factor()))
+            for win in tiles.all_windows() if not tiles.is_outside(win))
+    print(f"Computing {n_jobs} tiles in {workers} process(es) ...")
+    trace.begin("index tiles")
+
+    with ExitStack() as stack:
+        # band-interleaved: readers of one month (or one window of all months) decode only that
+        dsts = {key: stack.enter_context(open_cog(path, profile_out, interleave="band"))
+                for key, path in paths.items()}
+        for dst in dsts.values():
+            set_scaling(dst, INDEX_STORAGE, INDEX_INT16_SCALE)
+            for b, (yyyymm, _, _) in enumerate(months, start=1):
+                dst.set_band_description(b, yyyymm)
+
+        for win in outside:
+            empty = encode(np.full((n_t, int(win.height), int(win.width)), np.nan, dtype=np.float32),
+                           INDEX_STORAGE, INDEX_INT16_SCALE)
+            for dst in dsts.values():
+                dst.write(empty, window=win)
+
+        unfit = dict.fromkeys(products, 0)
+        for i, (win, (out, tile_unfit)) in enumerate(run_tiles(jobs, tile_indices, workers), start=1):
+            for key, dst in dsts.items():
+                dst.write(out[key], window=win)
+                unfit[key] += tile_unfit[key]
+            if i % 20 == 0 or i == n_jobs:
+                print(f"  tile {i}/{n_jobs}")
+
+    for key, path in paths.items():
+        print(f"Saved tif: {path}")
+        if unfit[key]:
+            print(f"  {unfit[key]} pixel(s) with enough calibration data but no {DISTRIBUTIONS[key[0]]} fit "
+                  f"for at least one calendar month (NaN there)")
+    trace.finish(TRACE_DIR, chrome=TRACE_CHROME)
+    print("\nDone.")
+
+
+if __name__ == "__main__":
+    main()
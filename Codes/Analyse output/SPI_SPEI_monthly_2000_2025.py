@@ -24,6 +24,9 @@ Method
        SPI = z-score of rolling sum of P_dom over WINDOW months
 3) For SPEI:
        SPEI = z-score of rolling sum of climate over WINDOW months
+
+Per-pixel SPI (gamma) / SPEI (log-logistic) maps fitted per calendar month:
+SPI_SPEI_maps.py.
 """
 
 import os
@@ -36,6 +39,8 @@ import matplotlib.pyplot as plt
 from matplotlib import dates as mdates
 import pandas as pd
 
+from pwtl.trace import Tracer
+
 # =================== USER CONFIG ===================
 
 PRECIP_DIR = "/media/mohammad/My Book/1800/evap/downscaled/tif/N_America"
@@ -50,6 +55,10 @@ WINDOW     = 12             # aggregation window in months (12 = 1-year SPI/SPEI
 Y_LIM      = 3              # +/- limit for y-axis
 DPI_FIG    = 1500           # dpi for PNG (and for PDF export)
 
+# per-stage wall/CPU/I-O trace (JSON; Chrome trace too if TRACE_CHROME)
+TRACE_DIR    = os.path.join(os.path.dirname(OUT_PNG), "traces")
+TRACE_CHROME = False
+
 # =================== HELPERS ===================
 
 def build_file_list(folder, pattern="*.tif"):
@@ -172,6 +181,8 @@ def plot_spi_spei(dates, spi, spei, out_png, out_pdf, y_lim=3, dpi_fig=1500):
 # =================== MAIN ===================
 
 def main():
+    trace = Tracer("SPI_SPEI_monthly")
+    trace.begin("setup")
     # File lists
     P_files = build_file_list(PRECIP_DIR, "*.tif")
     E_files = build_file_list(EVAP_DIR, "*.tif")
@@ -189,6 +200,7 @@ def main():
     boundary = gpd.read_file(BOUNDARY_SHP)
 
     # Domain mean P and E
+    trace.begin("domain means")
     P_dom = domain_mean_series(P_files, boundary)
     E_dom = domain_mean_series(E_files, boundary)
 
@@ -196,6 +208,7 @@ def main():
     print("Domain-mean E (first 5 months):", E_dom[:5])
 
     # SPI from P only
+    trace.begin("indices")
     spi = rolling_z_index(P_dom, WINDOW)
 
     # SPEI from climate = P - E
@@ -203,7 +216,9 @@ def main():
     spei = rolling_z_index(climate, WINDOW)
 
     # Plot & save both formats
+    trace.begin("rendering")
     plot_spi_spei(dates, spi, spei, OUT_PNG, OUT_PDF, y_lim=Y_LIM, dpi_fig=DPI_FIG)
+    trace.finish(TRACE_DIR, chrome=TRACE_CHROME)
 
 
 if __name__ == "__main__":
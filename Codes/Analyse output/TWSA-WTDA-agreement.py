@@ -1,10 +1,11 @@
 #!/usr/bin/env python3
 
 import os
+import argparse
+import tempfile
 import re
 import glob
 import warnings
-from datetime import datetime
 
 import numpy as np
 import matplotlib.pyplot as plt
@@ -12,15 +13,21 @@ from matplotlib.colors import TwoSlopeNorm, ListedColormap, BoundaryNorm
 from matplotlib.patches import Patch
 from matplotlib.cm import ScalarMappable
 
-import geopandas as gpd
 import rasterio
 from rasterio.enums import Resampling
 from rasterio.transform import from_bounds
 from rasterio.warp import reproject
 from rasterio.features import geometry_mask, rasterize
 from rasterio.plot import plotting_extent
-from shapely.geometry import box
-from osgeo import gdal
+
+from pwtl.annual_cache import AnnualMeanCache, source_signature
+from pwtl.grace import read_grace_cube, annual_groups
+from pwtl.aggregate import aggregate_to_grid
+from pwtl.landcover import reclassify_landcover
+from pwtl.render import decimate_for_display
+from pwtl.overlays import read_overlay
+from pwtl.preview import open_raster, preview_dir, preview_dpi, preview_factor, set_preview_factor
+from pwtl.trace import Tracer
 
 warnings.filterwarnings("ignore", category=UserWarning)
 
@@ -39,15 +46,35 @@ greenland_shp = "/home/mohammad/Desktop/N_America_shapefile/N_America_shapefile1
 LANDCOVER_TIF = "/home/mohammad/Desktop/1/16/landcover/Land_Cover1.tif"
 
 out_dir = "/home/mohammad/Desktop/1/16"
+
+# --preview-factor N: WTDA and land cover read at 1/N resolution (~N^2 faster)
+# into out_dir/preview_xN, to check the figure layout before a full run
+ap = argparse.ArgumentParser()
+ap.add_argument("--preview-factor", type=int, default=1,
+                help="read rasters at 1/N resolution to check the figure; outputs go to preview_xN")
+set_preview_factor(ap.parse_args().preview_factor)
+out_dir = preview_dir(out_dir)
 os.makedirs(out_dir, exist_ok=True)
 
 out_png = os.path.join(out_dir, "WTDA_TWSA_panelAB_panelC_oldCond_panelD_newCond.png")
 out_pdf = os.path.join(out_dir, "WTDA_TWSA_panelAB_panelC_oldCond_panelD_newCond.pdf")
 
+# panel b (30 arc-second) is decimated to what this DPI can show
+PNG_DPI = preview_dpi(300)
+
 # optional outputs
 SAVE_GROUPED_TIF = False
 SAVE_DIFF_TIF = False
 
+# prepared (reprojected / clipped / simplified) shapefiles are cached here
+OVERLAY_CACHE_DIR = os.path.join(out_dir, "overlay_cache")
+# watershed outlines are only drawn, so they are simplified to well below a pixel
+WATERSHED_SIMPLIFY_DEG = 0.005
+
+# per-stage wall/CPU/I-O trace (JSON; Chrome trace too if TRACE_CHROME)
+TRACE_DIR = os.path.join(out_dir, "traces")
+TRACE_CHROME = False
+
 # =========================================================
 # SETTINGS FROM ORIGINAL CODE
 # =========================================================
@@ -57,12 +84,21 @@ baseline_end = 2009
 WTDA_M_TO_CM = 100.0
 TWSA_TO_CM = 1.0
 
+# Cropped annual WTDA means are kept here (.npy, memory-mapped) so each year is
+# read once; set to None to keep them in memory instead.
+ANNUAL_CACHE_DIR = os.path.join(out_dir, "annual_cache")
+
+# WTDA -> GRACE grid: "aggregate" = cell-area-weighted mean of the 30" pixels in
+# each 0.5 deg cell (storage-consistent), "bilinear" = previous point resampling
+WTDA_TO_TWSA_METHOD = "aggregate"
+
 LON_MIN = -180
 LON_MAX = -7
 LAT_MIN = 7
 LAT_MAX = 85
 
-PANEL_B_RES_DEG = 1.0 / 120.0
+# 30 arc-second (coarser by the preview factor)
+PANEL_B_RES_DEG = 1.0 / 120.0 * preview_factor()
 
 # panel a/b/d style from original code
 PANEL_A_VMIN = -150
@@ -251,71 +287,6 @@ def extract_year_from_filename(filename):
         return None
     return int(m.group(1)[-4:])
 
-def month_range(start_year, start_month, n):
-    dates = []
-    y, m = start_year, start_month
-    for _ in range(n):
-        dates.append(datetime(y, m, 1))
-        m += 1
-        if m > 12:
-            m = 1
-            y += 1
-    return dates
-
-def shift_lon_360_to_180(lon):
-    lon = np.asarray(lon).copy()
-    lon = np.where(lon > 180, lon - 360, lon)
-    return lon
-
-def nanmean_update(sum_arr, count_arr, new_arr):
-    valid = np.isfinite(new_arr)
-    sum_arr[valid] += new_arr[valid]
-    count_arr[valid] += 1
-
-def finalize_mean(sum_arr, count_arr):
-    out = np.full(sum_arr.shape, np.nan, dtype="float32")
-    mask = count_arr > 0
-    out[mask] = sum_arr[mask] / count_arr[mask]
-    return out
-
-def get_grace_subdataset(nc_path):
-    ds = gdal.Open(nc_path)
-    if ds is None:
-        raise RuntimeError("Could not open NetCDF file.")
-
-    subdatasets = ds.GetSubDatasets()
-    if not subdatasets:
-        return nc_path
-
-    preferred = [
-        "lwe_thickness", "lwe", "equivalent_water_thickness",
-        "water_thickness", "twsa", "tws"
-    ]
-
-    for name, desc in subdatasets:
-        text = (name + " " + desc).lower()
-        for key in preferred:
-            if key in text:
-                return name
-
-    for name, desc in subdatasets:
-        text = (name + " " + desc).lower()
-        if ("lat" not in text) and ("lon" not in text) and ("time" not in text):
-            return name
-
-    raise RuntimeError("Could not find GRACE data variable.")
-
-def make_transform_from_lonlat(lon, lat_ascending):
-    xres = np.mean(np.diff(lon))
-    yres = np.mean(np.abs(np.diff(lat_ascending)))
-
-    west = lon.min() - xres / 2.0
-    east = lon.max() + xres / 2.0
-    south = lat_ascending.min() - yres / 2.0
-    north = lat_ascending.max() + yres / 2.0
-
-    return from_bounds(west, south, east, north, len(lon), len(lat_ascending))
-
 def mask_array_with_boundary(arr2d, transform, boundary_gdf):
     geoms = [geom for geom in boundary_gdf.geometry if geom is not None and not geom.is_empty]
     mask = geometry_mask(geoms, out_shape=arr2d.shape, transform=transform, invert=True)
@@ -394,13 +365,6 @@ def reproject_to_match(src_array, src_transform, src_crs,
     )
     return dst_array
 
-def build_grouped_landcover(landcover):
-    grouped = np.full(landcover.shape, GROUPED_NODATA, dtype=np.uint8)
-    grouped[np.isin(landcover, HUMAN_CLASSES)] = 1
-    grouped[np.isin(landcover, MIXED_CLASSES)] = 2
-    grouped[np.isin(landcover, CLIMATE_CLASSES)] = 3
-    return grouped
-
 def rgb255_to_mpl(rgb):
     return tuple(v / 255.0 for v in rgb)
 
@@ -501,56 +465,23 @@ def add_vertical_colorbar_inside(ax, cmap, norm, ticks, ticklabels=None, label=N
 # =========================================================
 # READ SHAPEFILES FOR ORIGINAL-CODE PANELS
 # =========================================================
+trace = Tracer(os.path.splitext(os.path.basename(__file__))[0])
+trace.begin("shapefiles")
 print("Reading shapefiles...")
 
-boundary = gpd.read_file(boundary_shp)
-watersheds = gpd.read_file(watershed_shp)
-greenland = gpd.read_file(greenland_shp)
+domain_bounds = (LON_MIN, LAT_MIN, LON_MAX, LAT_MAX)
 
-if boundary.crs is None:
-    boundary = boundary.set_crs("EPSG:4326")
-else:
-    boundary = boundary.to_crs("EPSG:4326")
-
-if watersheds.crs is None:
-    watersheds = watersheds.set_crs("EPSG:4326")
-else:
-    watersheds = watersheds.to_crs("EPSG:4326")
-
-if greenland.crs is None:
-    greenland = greenland.set_crs("EPSG:4326")
-else:
-    greenland = greenland.to_crs("EPSG:4326")
-
-domain_box = box(LON_MIN, LAT_MIN, LON_MAX, LAT_MAX)
-domain_gdf = gpd.GeoDataFrame(geometry=[domain_box], crs="EPSG:4326")
-
-try:
-    boundary_plot = gpd.overlay(boundary, domain_gdf, how="intersection")
-except Exception:
-    boundary_plot = boundary.copy()
-
-try:
-    greenland_plot = gpd.overlay(greenland, domain_gdf, how="intersection")
-except Exception:
-    greenland_plot = greenland.copy()
-
-try:
-    watersheds_tmp = gpd.overlay(watersheds, domain_gdf, how="intersection")
-except Exception:
-    watersheds_tmp = watersheds.copy()
-
-try:
-    watersheds_plot = gpd.overlay(watersheds_tmp, boundary_plot, how="intersection")
-except Exception:
-    try:
-        watersheds_plot = gpd.clip(watersheds_tmp, boundary_plot)
-    except Exception:
-        watersheds_plot = watersheds_tmp.copy()
+boundary_plot = read_overlay(boundary_shp, "EPSG:4326", clip_box=domain_bounds, cache_dir=OVERLAY_CACHE_DIR)
+greenland_plot = read_overlay(greenland_shp, "EPSG:4326", clip_box=domain_bounds, cache_dir=OVERLAY_CACHE_DIR)
+watersheds_plot = read_overlay(
+    watershed_shp, "EPSG:4326", clip_box=domain_bounds, clip_with=boundary_shp,
+    simplify_tolerance=WATERSHED_SIMPLIFY_DEG, cache_dir=OVERLAY_CACHE_DIR
+)
 
 # =========================================================
 # PROCESS WTDA / TWSA FOR PANELS A, B, D BACKGROUND
 # =========================================================
+trace.begin("WTDA processing")
 print("Processing WTDA...")
 tif_files = sorted(glob.glob(os.path.join(tif_dir, "*.tif")))
 if not tif_files:
@@ -567,132 +498,69 @@ baseline_years_wtda = [y for y in years_wtda if baseline_start <= y <= baseline_
 if not baseline_years_wtda:
     raise RuntimeError(f"No WTDA baseline years found in {baseline_start}-{baseline_end}")
 
-with rasterio.open(annual_files[years_wtda[0]][0]) as src0:
+with open_raster(annual_files[years_wtda[0]][0]) as src0:
     ref_arr, ref_transform = crop_raster_to_domain(src0)
     ref_shape = ref_arr.shape
     ref_crs = src0.crs
 
-baseline_sum = np.zeros(ref_shape, dtype="float32")
-baseline_count = np.zeros(ref_shape, dtype="int32")
-
-for y in baseline_years_wtda:
-    yearly_sum = np.zeros(ref_shape, dtype="float32")
-    yearly_count = np.zeros(ref_shape, dtype="int32")
+def load_wtda_year(y):
     for tif in annual_files[y]:
-        with rasterio.open(tif) as src:
+        with open_raster(tif) as src:
             arr, _ = crop_raster_to_domain(src)
-            arr = arr * WTDA_M_TO_CM
-            nanmean_update(yearly_sum, yearly_count, arr)
-    yearly_mean = finalize_mean(yearly_sum, yearly_count)
-    nanmean_update(baseline_sum, baseline_count, yearly_mean)
-
-wtda_baseline = finalize_mean(baseline_sum, baseline_count)
-
-anom_sum = np.zeros(ref_shape, dtype="float32")
-anom_count = np.zeros(ref_shape, dtype="int32")
+        yield arr * WTDA_M_TO_CM
 
+wtda_cache = AnnualMeanCache(ref_shape, cache_dir=ANNUAL_CACHE_DIR, tag="wtda")
 for y in years_wtda:
-    yearly_sum = np.zeros(ref_shape, dtype="float32")
-    yearly_count = np.zeros(ref_shape, dtype="int32")
-    for tif in annual_files[y]:
-        with rasterio.open(tif) as src:
-            arr, _ = crop_raster_to_domain(src)
-            arr = arr * WTDA_M_TO_CM
-            nanmean_update(yearly_sum, yearly_count, arr)
-    yearly_mean = finalize_mean(yearly_sum, yearly_count)
-    yearly_anom = yearly_mean - wtda_baseline
-    nanmean_update(anom_sum, anom_count, yearly_anom)
+    wtda_cache.get(
+        y, lambda y=y: load_wtda_year(y),
+        signature=source_signature(annual_files[y], LON_MIN, LON_MAX, LAT_MIN, LAT_MAX, WTDA_M_TO_CM)
+    )
 
-wtda_mean_anom = finalize_mean(anom_sum, anom_count)
+wtda_baseline = wtda_cache.baseline(baseline_years_wtda)
+wtda_mean_anom = wtda_cache.mean_anomaly(years_wtda, wtda_baseline)
 
+trace.begin("TWSA processing")
 print("Processing TWSA...")
-subdataset = get_grace_subdataset(nc_file)
-ds = gdal.Open(subdataset)
-if ds is None:
-    raise RuntimeError("Could not open GRACE subdataset.")
-
-n_bands = ds.RasterCount
-n_cols = ds.RasterXSize
-n_rows = ds.RasterYSize
-gt = ds.GetGeoTransform()
-
-lon_all = gt[0] + (np.arange(n_cols) + 0.5) * gt[1]
-lat_all = gt[3] + (np.arange(n_rows) + 0.5) * gt[5]
-
-if np.nanmax(lon_all) > 180:
-    lon_all = shift_lon_360_to_180(lon_all)
-    lon_order = np.argsort(lon_all)
-    lon_all = lon_all[lon_order]
-else:
-    lon_order = None
-
-lon_mask = (lon_all >= LON_MIN) & (lon_all <= LON_MAX)
-lat_mask = (lat_all <= LAT_MAX) & (lat_all >= LAT_MIN)
+grace = read_grace_cube(nc_file, LON_MIN, LON_MAX, LAT_MIN, LAT_MAX,
+                        start_year=2002, start_month=4, scale=TWSA_TO_CM)
+twsa_shape = grace.data.shape[1:]
+twsa_transform = grace.transform
 
-lon = lon_all[lon_mask]
-lat = lat_all[lat_mask]
-
-twsa_shape = (len(lat), len(lon))
-twsa_transform = make_transform_from_lonlat(lon, lat[::-1])
-
-dates = month_range(2002, 4, n_bands)
-years_all = np.array([d.year for d in dates])
-unique_years = sorted(np.unique(years_all))
+twsa_groups = annual_groups(grace.dates)
+unique_years = sorted(twsa_groups.keys())
 
 baseline_years_twsa = [y for y in unique_years if baseline_start <= y <= baseline_end]
 if not baseline_years_twsa:
     raise RuntimeError(f"No GRACE baseline years found in {baseline_start}-{baseline_end}")
 
-annual_means = {}
+# GRACE means are small (0.5 deg), keep them in memory
+twsa_cache = AnnualMeanCache(twsa_shape, tag="twsa")
 for y in unique_years:
-    idxs = np.where(years_all == y)[0]
-    y_sum = np.zeros(twsa_shape, dtype="float32")
-    y_count = np.zeros(twsa_shape, dtype="int32")
-
-    for idx in idxs:
-        band = ds.GetRasterBand(int(idx + 1))
-        arr = band.ReadAsArray().astype("float32")
-
-        if lon_order is not None:
-            arr = arr[:, lon_order]
-
-        arr = arr[lat_mask, :]
-        arr = arr[:, lon_mask]
-
-        nodata = band.GetNoDataValue()
-        if nodata is not None:
-            arr[arr == nodata] = np.nan
+    twsa_cache.get(y, lambda y=y: (grace.data[i] for i in twsa_groups[y]))
 
-        nanmean_update(y_sum, y_count, arr * TWSA_TO_CM)
+twsa_baseline = twsa_cache.baseline(baseline_years_twsa)
+twsa_mean_anom = twsa_cache.mean_anomaly(unique_years, twsa_baseline)
 
-    annual_means[y] = finalize_mean(y_sum, y_count)
-
-base_sum = np.zeros(twsa_shape, dtype="float32")
-base_count = np.zeros(twsa_shape, dtype="int32")
-for y in baseline_years_twsa:
-    nanmean_update(base_sum, base_count, annual_means[y])
-twsa_baseline = finalize_mean(base_sum, base_count)
-
-anom_sum = np.zeros(twsa_shape, dtype="float32")
-anom_count = np.zeros(twsa_shape, dtype="int32")
-for y in unique_years:
-    anom = annual_means[y] - twsa_baseline
-    nanmean_update(anom_sum, anom_count, anom)
-twsa_mean_anom = finalize_mean(anom_sum, anom_count)
-
-print("Reprojecting WTDA to TWSA grid...")
-wtda_on_twsa = np.full(twsa_shape, np.nan, dtype="float32")
-reproject(
-    source=wtda_mean_anom,
-    destination=wtda_on_twsa,
-    src_transform=ref_transform,
-    src_crs=ref_crs,
-    dst_transform=twsa_transform,
-    dst_crs="EPSG:4326",
-    src_nodata=np.nan,
-    dst_nodata=np.nan,
-    resampling=Resampling.bilinear
-)
+trace.begin("WTDA to TWSA grid")
+print(f"Moving WTDA to TWSA grid ({WTDA_TO_TWSA_METHOD})...")
+if WTDA_TO_TWSA_METHOD == "aggregate":
+    wtda_on_twsa = aggregate_to_grid(
+        wtda_mean_anom, ref_transform, twsa_shape, twsa_transform,
+        src_crs=ref_crs, dst_crs="EPSG:4326"
+    )
+else:
+    wtda_on_twsa = np.full(twsa_shape, np.nan, dtype="float32")
+    reproject(
+        source=wtda_mean_anom,
+        destination=wtda_on_twsa,
+        src_transform=ref_transform,
+        src_crs=ref_crs,
+        dst_transform=twsa_transform,
+        dst_crs="EPSG:4326",
+        src_nodata=np.nan,
+        dst_nodata=np.nan,
+        resampling=Resampling.bilinear
+    )
 
 print("Masking to boundary...")
 wtda_on_twsa = mask_array_with_boundary(wtda_on_twsa, twsa_transform, boundary_plot)
@@ -724,56 +592,43 @@ extent_main = [LON_MIN, LON_MAX, LAT_MIN, LAT_MAX]
 # =========================================================
 # LANDCOVER / SECOND-CODE PRODUCTS FOR PANEL C
 # =========================================================
+trace.begin("land-cover and panel c")
 print("Processing land-cover and panel c products...")
 
-landcover, lc_profile, lc_transform, lc_crs, lc_bounds, lc_nodata = read_raster(LANDCOVER_TIF)
-landcover = landcover.copy()
-
-greenland_gdf = gpd.read_file(greenland_shp)
-watershed_gdf = gpd.read_file(watershed_shp)
-boundary_gdf = gpd.read_file(boundary_shp)
-
-if lc_crs is not None:
-    if greenland_gdf.crs != lc_crs:
-        greenland_gdf = greenland_gdf.to_crs(lc_crs)
-    if watershed_gdf.crs != lc_crs:
-        watershed_gdf = watershed_gdf.to_crs(lc_crs)
-    if boundary_gdf.crs != lc_crs:
-        boundary_gdf = boundary_gdf.to_crs(lc_crs)
-
-watershed_clipped = gpd.clip(watershed_gdf, boundary_gdf)
-
-boundary_mask = rasterize(
-    [(geom, 1) for geom in boundary_gdf.geometry if geom is not None],
-    out_shape=landcover.shape,
-    transform=lc_transform,
-    fill=0,
-    all_touched=False,
-    dtype=np.uint8
-).astype(bool)
-inside_boundary = boundary_mask.copy()
-
-greenland_mask = rasterize(
-    [(geom, 1) for geom in greenland_gdf.geometry if geom is not None],
-    out_shape=landcover.shape,
-    transform=lc_transform,
-    fill=0,
-    all_touched=False,
-    dtype=np.uint8
-).astype(bool)
-inside_boundary_excl_greenland = inside_boundary & (~greenland_mask)
-
-landcover_fixed = landcover.copy()
-landcover_fixed[(inside_boundary) & (landcover_fixed == 0)] = 7
-if lc_nodata is not None:
-    landcover_fixed[(inside_boundary) & (landcover_fixed == lc_nodata)] = 7
+# at the preview resolution, like the grouped raster reclassify_landcover writes
+with open_raster(LANDCOVER_TIF) as lc_src:
+    lc_profile = lc_src.profile.copy()
+    lc_transform = lc_src.transform
+    lc_crs = lc_src.crs
+    lc_bounds = lc_src.bounds
+    lc_nodata = lc_src.nodata
+    lc_shape = (lc_src.height, lc_src.width)
+
+greenland_gdf = read_overlay(greenland_shp, lc_crs, cache_dir=OVERLAY_CACHE_DIR)
+watershed_gdf = read_overlay(watershed_shp, lc_crs, cache_dir=OVERLAY_CACHE_DIR)
+boundary_gdf = read_overlay(boundary_shp, lc_crs, cache_dir=OVERLAY_CACHE_DIR)
+watershed_clipped = read_overlay(
+    watershed_shp, lc_crs, clip_with=boundary_shp, clip_method="clip", cache_dir=OVERLAY_CACHE_DIR
+)
 
-valid_original_classes = np.array(list(ORIGINAL_CLASSES.keys()))
-invalid_inside = inside_boundary & (~np.isin(landcover_fixed, valid_original_classes))
-landcover_fixed[invalid_inside] = 7
+# fix (0 / nodata / invalid -> 7) and group inside the boundary in one
+# streamed pass; the grouped raster feeds panel c here and panel d below
+# (unless SAVE_GROUPED_TIF, the raster lives in a per-run scratch folder that
+# is removed on exit, also after an error)
+with tempfile.TemporaryDirectory(prefix="twsa_wtda_") as scratch_dir:
+    grouped_tif_path = os.path.join(out_dir if SAVE_GROUPED_TIF else scratch_dir, "grouped_landcover.tif")
+    reclassify_landcover(
+        LANDCOVER_TIF,
+        boundary_gdf.geometry,
+        grouped_tif_path,
+        valid_classes=list(ORIGINAL_CLASSES.keys()),
+        group_classes={1: HUMAN_CLASSES, 2: MIXED_CLASSES, 3: CLIMATE_CLASSES},
+        fill_class=7,
+        grouped_nodata=GROUPED_NODATA
+    )
 
-grouped_landcover = np.full(landcover_fixed.shape, GROUPED_NODATA, dtype=np.uint8)
-grouped_landcover[inside_boundary] = build_grouped_landcover(landcover_fixed)[inside_boundary]
+    grouped_landcover, _, grouped_transform, grouped_crs, _, _ = read_raster(grouped_tif_path)
+inside_boundary = grouped_landcover != GROUPED_NODATA
 
 # panel c uses 2000 and 2025 WTD difference from second code
 # infer Linux WTD_2000 and WTD_2025 from tif_dir naming pattern
@@ -796,12 +651,12 @@ if wtd2000_nodata is not None:
 if wtd2025_nodata is not None:
     wtd_2025[wtd_2025 == wtd2025_nodata] = np.nan
 
-if (wtd2000_crs != lc_crs) or (wtd2000_transform != lc_transform) or (wtd_2000.shape != landcover.shape):
+if (wtd2000_crs != lc_crs) or (wtd2000_transform != lc_transform) or (wtd_2000.shape != lc_shape):
     wtd_2000 = reproject_to_match(
         src_array=wtd_2000,
         src_transform=wtd2000_transform,
         src_crs=wtd2000_crs,
-        dst_shape=landcover.shape,
+        dst_shape=lc_shape,
         dst_transform=lc_transform,
         dst_crs=lc_crs,
         src_nodata=np.nan,
@@ -809,12 +664,12 @@ if (wtd2000_crs != lc_crs) or (wtd2000_transform != lc_transform) or (wtd_2000.s
         resampling=Resampling.bilinear
     )
 
-if (wtd2025_crs != lc_crs) or (wtd2025_transform != lc_transform) or (wtd_2025.shape != landcover.shape):
+if (wtd2025_crs != lc_crs) or (wtd2025_transform != lc_transform) or (wtd_2025.shape != lc_shape):
     wtd_2025 = reproject_to_match(
         src_array=wtd_2025,
         src_transform=wtd2025_transform,
         src_crs=wtd2025_crs,
-        dst_shape=landcover.shape,
+        dst_shape=lc_shape,
         dst_transform=lc_transform,
         dst_crs=lc_crs,
         src_nodata=np.nan,
@@ -847,48 +702,18 @@ diff_plot_arr = np.ma.masked_invalid(wtd_diff_cm)
 # =========================================================
 # GROUPED CLASSES ON TWSA GRID FOR PANEL D NEW CONDITION
 # =========================================================
-boundary_lc = boundary.to_crs(lc_crs)
-greenland_lc = greenland.to_crs(lc_crs)
-
-inside_boundary_lc = rasterize(
-    [(geom, 1) for geom in boundary_lc.geometry if geom is not None and not geom.is_empty],
-    out_shape=landcover.shape,
-    transform=lc_transform,
-    fill=0,
-    all_touched=False,
-    dtype=np.uint8
-).astype(bool)
-
-greenland_mask_lc = rasterize(
-    [(geom, 1) for geom in greenland_lc.geometry if geom is not None and not geom.is_empty],
-    out_shape=landcover.shape,
-    transform=lc_transform,
-    fill=0,
-    all_touched=False,
-    dtype=np.uint8
-).astype(bool)
-
-landcover_fixed_twsa = landcover.copy()
-if lc_nodata is not None:
-    landcover_fixed_twsa[(inside_boundary_lc) & (landcover_fixed_twsa == lc_nodata)] = 7
-landcover_fixed_twsa[(inside_boundary_lc) & (landcover_fixed_twsa == 0)] = 7
-invalid_inside_twsa = inside_boundary_lc & (~np.isin(landcover_fixed_twsa, valid_original_classes))
-landcover_fixed_twsa[invalid_inside_twsa] = 7
-
-grouped_landcover_lc = np.full(landcover_fixed_twsa.shape, GROUPED_NODATA, dtype=np.uint8)
-grouped_landcover_lc[inside_boundary_lc] = build_grouped_landcover(landcover_fixed_twsa)[inside_boundary_lc]
-
-grouped_landcover_twsa = reproject_to_match(
-    src_array=grouped_landcover_lc.astype(np.float32),
-    src_transform=lc_transform,
-    src_crs=lc_crs,
-    dst_shape=twsa_shape,
+grouped_landcover_twsa = np.full(twsa_shape, GROUPED_NODATA, dtype=np.uint8)
+reproject(
+    source=grouped_landcover,
+    destination=grouped_landcover_twsa,
+    src_transform=grouped_transform,
+    src_crs=grouped_crs,
+    src_nodata=GROUPED_NODATA,
     dst_transform=twsa_transform,
     dst_crs="EPSG:4326",
-    src_nodata=GROUPED_NODATA,
     dst_nodata=GROUPED_NODATA,
     resampling=Resampling.nearest
-).astype(np.uint8)
+)
 
 inside_boundary_twsa = np.isfinite(mask_array_with_boundary(
     np.ones(twsa_shape, dtype="float32"),
@@ -1032,6 +857,7 @@ xs_white_c, ys_white_c = build_systematic_points(
 # =========================================================
 # PLOT
 # =========================================================
+trace.begin("rendering")
 print("Plotting final 4-panel figure...")
 
 norm_a = TwoSlopeNorm(vmin=PANEL_A_VMIN, vcenter=0, vmax=PANEL_A_VMAX)
@@ -1079,7 +905,7 @@ add_vertical_colorbar_inside(
 # ---------------- PANEL B ----------------
 ax = axes[0, 1]
 im_b = ax.imshow(
-    panel_b_30s, origin="upper", extent=extent_main,
+    decimate_for_display(panel_b_30s, ax, PNG_DPI), origin="upper", extent=extent_main,
     cmap="RdBu", norm=norm_b, interpolation="nearest"
 )
 if not greenland_plot.empty:
@@ -1274,9 +1100,10 @@ add_vertical_colorbar_inside(
     extend="both"
 )
 
-fig.savefig(out_png, dpi=300, bbox_inches="tight")
+fig.savefig(out_png, dpi=PNG_DPI, bbox_inches="tight")
 fig.savefig(out_pdf, bbox_inches="tight")
 
+trace.finish(TRACE_DIR, chrome=TRACE_CHROME)
 print("Done.")
 print("PNG:", out_png)
 print("PDF:", out_pdf)
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Benchmark the analysis hot paths on synthetic monthly GeoTIFF archives.
+
+Generates a fake North America archive (grid size, months and ocean/NaN
+fraction configurable), then times the functions the pipeline scripts
+spend their time in, loaded straight from those scripts:
+
+  quantile_mapping          Bias correction and Spatial downscaling1.py
+  rolling_baseline          heatmap P-ET.py  compute_baseline_mean_std (12-month rolling sum + Welford, with I/O)
+  dominance_matrix          heatmap P-ET.py  compute_dominance_matrix  (with I/O)
+  welford_update            IQR.py           welford_update (in memory)
+  zonal_means               average groundwater.py  zonal_mean_raster over synthetic watersheds
+  iqr_kernel                pwtl.quantiles.nan_quartiles vs np.nanpercentile (12, H, W)
+  correlation_sums          correlation_maps_C_cividis.py  corr_from_sums + p_from_r_n
+  prefetch                  heatmap P-ET.py  compute_baseline_mean_std with month read-ahead
+                            (pwtl.prefetch) vs synchronous reads (depth 0)
+
+--cold drops the archive from the page cache before every repeat of the
+I/O cases, so reads hit the drive; point --data-dir at the external drive
+to measure what prefetching buys there.
+
+A case whose dependencies are missing is recorded as skipped. Results go
+to one JSON file per run (timings + environment + config) for comparison.
+
+Examples:
+  python benchmark_hot_paths.py                      # laptop-size grid
+  python benchmark_hot_paths.py --size full --data-dir /media/scratch/bench_full
+  python benchmark_hot_paths.py --only iqr_kernel welford_update --repeat 5
+  python benchmark_hot_paths.py --only prefetch --cold --data-dir "/media/mohammad/My Book/bench"
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+import pwtl.prefetch
+from pwtl.bench import evict_page_cache, load_script_functions, time_call, write_results
+from pwtl.quantiles import nan_quartiles
+from pwtl.synthetic import make_monthly_archive, make_watersheds, NODATA
+
+
+# =========================
+# USER SETTINGS
+# =========================
+HERE = os.path.dirname(os.path.abspath(__file__))
+CODES_DIR = os.path.dirname(HERE)
+
+OUT_DIR = os.path.join(HERE, "benchmark_results")
+
+# width, height, months, block size
+SIZES = {
+    "laptop": dict(width=1024, height=768, months=36, block=256),
+    "full":   dict(width=14400, height=10800, months=24, block=512),   # 30 arc-sec, 120 x 90 deg
+}
+NAN_FRAC = 0.35
+N_WATERSHEDS = (8, 5)
+REPEAT = 3
+SEED = 0
+# in-memory cases (welford, IQR kernel, correlation) run on a centre tile of at most this size
+IN_MEMORY_TILE = 2048
+# =========================
+
+CASES = ["quantile_mapping", "rolling_baseline", "dominance_matrix", "welford_update",
+         "zonal_means", "iqr_kernel", "correlation_sums", "prefetch"]
+
+
+def script(name):
+    for d in (HERE, CODES_DIR):
+        p = os.path.join(d, name)
+        if os.path.exists(p):
+            return p
+    raise FileNotFoundError(name)
+
+
+def load_block(path):
+    """Centre tile (<= IN_MEMORY_TILE square) of a synthetic month, NaN for nodata."""
+    import rasterio
+    from rasterio.windows import Window
+    with rasterio.open(path) as src:
+        h, w = min(src.height, IN_MEMORY_TILE), min(src.width, IN_MEMORY_TILE)
+        win = Window((src.width - w) // 2, (src.height - h) // 2, w, h)
+        a = src.read(1, window=win).astype(np.float32)
+    a[a == NODATA] = np.nan
+    return a
+
+
+# =========================
+# CASES
+# =========================
+def bench_quantile_mapping(ctx):
+    fn = load_script_functions(script("Bias correction and Spatial downscaling1.py"), ["quantile_mapping"])["quantile_mapping"]
+    rng = np.random.default_rng(SEED)
+    n = min(ctx["height"], IN_MEMORY_TILE)
+    obs = rng.gamma(2.0, 1.0, size=(n, n)).astype(np.float32)
+    mod = rng.gamma(2.5, 0.8, size=(n, n)).astype(np.float32)
+    stats = time_call(lambda: fn(obs, mod), repeat=ctx["repeat"])
+    stats["pixels"] = obs.size
+    return stats
+
+
+def cold_setup(ctx):
+    """setup= for time_call: evict the archive from the page cache when --cold."""
+    if not ctx["cold"]:
+        return None
+    paths = [p for _, p in ctx["archive"]["wtd"]]
+
+    def setup():
+        evict_page_cache(paths)
+    return setup
+
+
+def bench_rolling_baseline(ctx):
+    fns = load_script_functions(script("heatmap P-ET.py"), ["compute_baseline_mean_std"])
+    dates = [k for k, _ in ctx["archive"]["wtd"]]
+    y0, y1 = int(dates[0][:4]), int(dates[-1][:4])
+    stats = time_call(lambda: fns["compute_baseline_mean_std"](
+        dates=dates, wtd_dir=ctx["data_dir"], baseline_start=y0, baseline_end=y1,
+        block_size=ctx["block"], nodata=NODATA, height=ctx["height"], width=ctx["width"]),
+        repeat=ctx["repeat"], setup=cold_setup(ctx))
+    stats["pixel_months"] = ctx["width"] * ctx["height"] * len(dates)
+    return stats
+
+
+def bench_dominance_matrix(ctx):
+    fns = load_script_functions(script("heatmap P-ET.py"),
+                                ["compute_baseline_mean_std", "compute_dominance_matrix"])
+    dates = [k for k, _ in ctx["archive"]["wtd"]]
+    y0, y1 = int(dates[0][:4]), int(dates[-1][:4])
+    mean, std = fns["compute_baseline_mean_std"](
+        dates=dates, wtd_dir=ctx["data_dir"], baseline_start=y0, baseline_end=y1,
+        block_size=ctx["block"], nodata=NODATA, height=ctx["height"], width=ctx["width"])
+    stats = time_call(lambda: fns["compute_dominance_matrix"](
+        dates=dates, wtd_dir=ctx["data_dir"], mean=mean, std=std,
+        block_size=ctx["block"], nodata=NODATA), repeat=ctx["repeat"], setup=cold_setup(ctx))
+    stats["pixel_months"] = ctx["width"] * ctx["height"] * len(dates)
+    return stats
+
+
+def bench_welford_update(ctx):
+    fn = load_script_functions(script("IQR.py"), ["welford_update"])["welford_update"]
+    paths = [p for _, p in ctx["archive"]["wtd"][:12]]
+    frames = [load_block(p) for p in paths]
+
+    def setup():
+        shape = frames[0].shape
+        return (np.zeros(shape, np.float32), np.zeros(shape, np.float32), np.zeros(shape, np.int32))
+
+    def run(state):
+        mean, m2, count = state
+        for x in frames:
+            fn(mean, m2, count, x)
+
+    stats = time_call(run, repeat=ctx["repeat"], setup=setup)
+    stats["pixel_months"] = frames[0].size * len(frames)
+    return stats
+
+
+def bench_zonal_means(ctx):
+    fn = load_script_functions(script("average groundwater.py"), ["zonal_mean_raster"])["zonal_mean_raster"]
+    sheds = make_watersheds(*N_WATERSHEDS)
+    tif = ctx["archive"]["wtd"][0][1]
+    stats = time_call(lambda: [fn(tif, g) for g in sheds.geometry], repeat=ctx["repeat"])
+    stats["polygons"] = len(sheds)
+    return stats
+
+
+def bench_iqr_kernel(ctx):
+    frames = [load_block(p) for _, p in ctx["archive"]["wtd"][:12]]
+    stack = np.stack(frames, axis=0)
+
+    kernel = time_call(lambda s: nan_quartiles(s, overwrite_input=True),
+                       repeat=ctx["repeat"], setup=stack.copy)
+    reference = time_call(lambda: (np.nanpercentile(stack, 25, axis=0),
+                                   np.nanpercentile(stack, 75, axis=0)), repeat=ctx["repeat"])
+
+    q25, q75 = nan_quartiles(stack)
+    ref25 = np.nanpercentile(stack, 25, axis=0)
+    kernel["max_abs_diff_vs_nanpercentile"] = float(np.nanmax(np.abs(q25 - ref25)))
+    kernel["nanpercentile"] = reference
+    kernel["speedup"] = reference["median_s"] / kernel["median_s"]
+    kernel["pixels"] = stack[0].size
+    return kernel
+
+
+def bench_correlation_sums(ctx):
+    fns = load_script_functions(script("correlation_maps_C_cividis.py"), ["corr_from_sums", "p_from_r_n"])
+    frames = [load_block(p) for _, p in ctx["archive"]["wtd"]]
+    rng = np.random.default_rng(SEED)
+    shape = frames[0].shape
+    n = np.zeros(shape, "uint16")
+    sx, sy, sxx, syy, sxy = (np.zeros(shape, "float32") for _ in range(5))
+    for x in frames:
+        y = x + rng.standard_normal(shape).astype(np.float32)
+        m = np.isfinite(x)
+        n[m] += 1
+        sx[m] += x[m]
+        sy[m] += y[m]
+        sxx[m] += x[m] * x[m]
+        syy[m] += y[m] * y[m]
+        sxy[m] += x[m] * y[m]
+
+    def run():
+        r = fns["corr_from_sums"](n, sx, sy, sxx, syy, sxy)
+        return fns["p_from_r_n"](r, n)
+
+    stats = time_call(run, repeat=ctx["repeat"])
+    stats["pixels"] = n.size
+    return stats
+
+
+def bench_prefetch(ctx):
+    fns = load_script_functions(script("heatmap P-ET.py"), ["compute_baseline_mean_std"])
+    dates = [k for k, _ in ctx["archive"]["wtd"]]
+    y0, y1 = int(dates[0][:4]), int(dates[-1][:4])
+
+    def run():
+        fns["compute_baseline_mean_std"](
+            dates=dates, wtd_dir=ctx["data_dir"], baseline_start=y0, baseline_end=y1,
+            block_size=ctx["block"], nodata=NODATA, height=ctx["height"], width=ctx["width"])
+
+    # PWTL_PREFETCH=0: the loops read synchronously, as before read-ahead
+    saved = os.environ.get("PWTL_PREFETCH")
+    os.environ["PWTL_PREFETCH"] = "0"
+    try:
+        sync = time_call(run, repeat=ctx["repeat"], setup=cold_setup(ctx))
+    finally:
+        if saved is None:
+            del os.environ["PWTL_PREFETCH"]
+        else:
+            os.environ["PWTL_PREFETCH"] = saved
+    stats = time_call(run, repeat=ctx["repeat"], setup=cold_setup(ctx))
+
+    stats["depth"] = int(saved) if saved else pwtl.prefetch.DEFAULT_DEPTH
+    stats["synchronous"] = sync
+    stats["speedup"] = sync["median_s"] / stats["median_s"]
+    stats["pixel_months"] = ctx["width"] * ctx["height"] * len(dates)
+    return stats
+
+
+# =========================
+# MAIN
+# =========================
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--size", choices=sorted(SIZES), default="laptop")
+    ap.add_argument("--width", type=int, help="override grid width")
+    ap.add_argument("--height", type=int, help="override grid height")
+    ap.add_argument("--months", type=int, help="override number of months (>= 13)")
+    ap.add_argument("--nan-frac", type=float, default=NAN_FRAC, help="ocean/NaN fraction of the grid")
+    ap.add_argument("--repeat", type=int, default=REPEAT)
+    ap.add_argument("--only", nargs="+", choices=CASES, help="run only these cases")
+    ap.add_argument("--data-dir", help="keep/reuse the synthetic archive here (default: temp dir, removed)")
+    ap.add_argument("--cold", action="store_true", help="drop the archive from the page cache before each I/O run")
+    ap.add_argument("--out", help="results JSON (default: benchmark_results/bench_<size>_<time>.json)")
+    args = ap.parse_args()
+
+    cfg = dict(SIZES[args.size])
+    for key in ("width", "height", "months"):
+        if getattr(args, key) is not None:
+            cfg[key] = getattr(args, key)
+    if cfg["months"] < 13:
+        raise SystemExit("--months must be >= 13 (12-month rolling windows)")
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="pwtl_bench_")
+    out_json = args.out or os.path.join(OUT_DIR, f"bench_{args.size}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+
+    print(f"Synthetic archive: {cfg['width']} x {cfg['height']}, {cfg['months']} months -> {data_dir}")
+    t0 = time.perf_counter()
+    archive = make_monthly_archive(data_dir, cfg["width"], cfg["height"], cfg["months"],
+                                   variables=("wtd",), nan_frac=args.nan_frac, block=cfg["block"], seed=SEED)
+    print(f"  ready in {time.perf_counter() - t0:.1f} s")
+
+    ctx = dict(cfg, repeat=args.repeat, cold=args.cold, data_dir=data_dir, archive=archive)
+    results = {}
+    try:
+        for name in args.only or CASES:
+            print(f"\n{name} ...")
+            try:
+                res = globals()[f"bench_{name}"](ctx)
+            except ImportError as e:
+                results[name] = {"skipped": f"missing dependency: {e}"}
+                print(f"  skipped ({e})")
+                continue
+            results[name] = res
+            print(f"  median {res['median_s']:.3f} s  (min {res['min_s']:.3f} s, n={res['repeat']})")
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    config = dict(cfg, size=args.size, nan_frac=args.nan_frac, repeat=args.repeat, cold=args.cold,
+                  argv=sys.argv[1:])
+    write_results(out_json, config, results)
+    print(f"\nSaved: {out_json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,21 +12,40 @@ New:
     (2) viridis + better domain
     (3) cividis + better domain
     (4) magma   + better domain
+
+Monthly updates: a full run saves its rolling windows, the last KMAX months
+and the correlation sums in STATE_DIR; `--update` adds only the new month(s)
+and redraws the figures.
+
+The five passes (mean/std + one per timescale) checkpoint their
+accumulators every CHECKPOINT_INTERVAL_S; `--resume` continues an
+interrupted full run from the last month saved.
+
+`--preview-factor N` reads the inputs at 1/N resolution (~N^2 faster) and
+writes to OUT_DIR/preview_xN, for checking figure layouts.
 """
 
 import os
 import re
 import glob
+import argparse
+from functools import partial
 import numpy as np
 import pandas as pd
 import geopandas as gpd
-import rasterio
 from rasterio.features import geometry_window, geometry_mask
 import matplotlib.pyplot as plt
 from matplotlib.patches import Patch
 from matplotlib.colors import PowerNorm
 from scipy.stats import t as student_t
 
+from pwtl.checkpoint import Checkpoint, input_signature
+from pwtl.incremental import RollingState, months_after
+from pwtl.prefetch import prefetch
+from pwtl.preview import open_raster, preview_dir, preview_dpi, set_preview_factor
+from pwtl.sketch import HistogramSketch
+from pwtl.trace import Tracer
+
 # ============================================================
 # PATHS
 # ============================================================
@@ -78,6 +97,22 @@ DOMAIN_USE_SIGNIFICANT_ONLY = True
 DOMAIN_P_LOW  = 5     # 5th percentile
 DOMAIN_P_HIGH = 99    # 99th percentile
 DOMAIN_PAD = 0.00     # optional small padding (e.g., 0.01)
+# r distribution per k is kept as a histogram sketch over [-1, 1] (saved as r_k{k}_sketch.npz)
+R_SKETCH_BINS = 4000
+# Fig3 (k, season) groups with at most this many significant pixels keep their r values,
+# so sparse boxes get exact quartiles and whiskers instead of binned estimates
+FIG3_EXACT_MAX = 10000
+
+# saved sums/rolling windows for --update (a new month costs one month of reads)
+STATE_DIR = os.path.join(OUT_DIR, "state", "correlation")
+
+# --resume checkpoints (accumulators + ring buffers, at most every CHECKPOINT_INTERVAL_S)
+CHECKPOINT_DIR = os.path.join(OUT_DIR, "checkpoints")
+CHECKPOINT_INTERVAL_S = 600
+
+# per-stage wall/CPU/I-O trace (JSON; Chrome trace too if TRACE_CHROME)
+TRACE_DIR = os.path.join(OUT_DIR, "traces")
+TRACE_CHROME = False
 
 # Colormaps to save (4 outputs)
 FIG2_CMAPS = [
@@ -147,7 +182,7 @@ def compute_extent_from_transform(transform, width, height):
     return (xmin, xmax, ymin, ymax)
 
 def read_window_masked(fp, window, inside_mask):
-    with rasterio.open(fp) as src:
+    with open_raster(fp) as src:
         arr = src.read(1, window=window).astype("float32")
         nod = src.nodata
         if nod is not None:
@@ -157,6 +192,11 @@ def read_window_masked(fp, window, inside_mask):
     arr[~inside_mask] = np.nan
     return arr
 
+def read_month_pair(key, prec_map, evap_map, window, inside_mask):
+    """(P, E) of one month (the prefetch() loader: next months load while this one is processed)."""
+    return (read_window_masked(prec_map[key], window, inside_mask),
+            read_window_masked(evap_map[key], window, inside_mask))
+
 def welford_update(mean, M2, n, x):
     m = np.isfinite(x)
     if not np.any(m):
@@ -200,68 +240,148 @@ def p_from_r_n(r, n):
     p[m] = pv.astype("float32")
     return p
 
-def robust_domain_from_values(vals, p_low=5, p_high=99, pad=0.0):
-    vals = np.asarray(vals, dtype="float64")
-    vals = vals[np.isfinite(vals)]
-    if vals.size < 100:
+def robust_domain_from_sketch(sketch, p_low=5, p_high=99, pad=0.0):
+    if sketch.count < 100:
         return 0.0, 1.0
-    vmin = float(np.percentile(vals, p_low))
-    vmax = float(np.percentile(vals, p_high))
+    vmin, vmax = (float(v) for v in sketch.percentile([p_low, p_high]))
     vmin = max(0.0, vmin - pad)
     vmax = min(1.0, vmax + pad)
     if vmax <= vmin:
         return 0.0, 1.0
     return vmin, vmax
 
-# ============================================================
-# MAIN
-# ============================================================
-def main():
-    boundary   = gpd.read_file(BOUNDARY_SHP)
-    watersheds = gpd.read_file(WATERSHED_SHP)
-    greenland  = gpd.read_file(GREENLAND_SHP)
-
-    prec_files = list_sorted_files(PREC_GLOB)
-    evap_files = list_sorted_files(EVAP_GLOB)
-
-    prec_map = {parse_yyyymm(f): f for f in prec_files}
-    evap_map = {parse_yyyymm(f): f for f in evap_files}
+def rolling_value(roll, rolln, k, min_valid_k):
+    """Rolling k-month sum as in the passes: partial windows scaled up (or NaN)."""
+    ok = rolln >= min_valid_k
+    if SCALE_PARTIAL_WINDOWS:
+        scale = np.where(ok, (k / np.maximum(1, rolln)).astype("float64"), np.nan)
+        return (roll * scale).astype("float32")
+    return np.where(ok, roll, np.nan).astype("float32")
+
+def maps_from_sums(k, n, sx, sy, sxx, syy, sxy, r_all_maps, p_all_maps, fig3_sketches):
+    r_all = corr_from_sums(n["ALL"], sx["ALL"], sy["ALL"], sxx["ALL"], syy["ALL"], sxy["ALL"])
+    p_all = p_from_r_n(r_all, n["ALL"])
+    r_all_maps[k] = r_all
+    p_all_maps[k] = p_all
+
+    print(f"  k={k}: finite r pixels={np.isfinite(r_all).sum()} | pixels with n>=3 = {(n['ALL']>=3).sum()}")
+
+    for sn in SEASON_NAMES:
+        r_s = corr_from_sums(n[sn], sx[sn], sy[sn], sxx[sn], syy[sn], sxy[sn])
+        p_s = p_from_r_n(r_s, n[sn])
+        fig3_sketches[k][sn].update(np.where(p_s < P_THRESHOLD, r_s, np.nan))
+
+def new_fig3_sketches():
+    # significant seasonal r per (k, season), binned: memory does not grow with pixel count
+    return {k: {s: HistogramSketch(-1.0, 1.0, n_bins=R_SKETCH_BINS, exact_max=FIG3_EXACT_MAX)
+                for s in SEASON_NAMES}
+            for k in TIMESCALES}
+
+def update_pass(state, new_keys, prec_map, evap_map, window, inside_mask, min_valid):
+    """
+    Add `new_keys` months to the saved correlation sums. New months are
+    standardised with the saved mean/std: Pearson r is unchanged by any
+    fixed per-pixel shift/scale, so r over the extended series is exact
+    without revisiting old months. One read of each new month.
+    """
+    groups = ["ALL"] + SEASON_NAMES
+    ringP  = np.array(state.load_array("ringP"))
+    ringWB = np.array(state.load_array("ringWB"))
+    slot = int(state.meta["slot"])
+
+    stats = {k: np.array(state.load_array(f"stats_k{k}")) for k in TIMESCALES}
+    n     = {k: np.array(state.load_array(f"n_k{k}")) for k in TIMESCALES}
+    sums  = {k: np.array(state.load_array(f"sums_k{k}")) for k in TIMESCALES}
+    roll  = {k: np.array(state.load_array(f"roll_k{k}")) for k in TIMESCALES}
+    rolln = {k: np.array(state.load_array(f"rolln_k{k}")) for k in TIMESCALES}
+
+    read = partial(read_month_pair, prec_map=prec_map, evap_map=evap_map, window=window, inside_mask=inside_mask)
+    for key, (p, e) in prefetch(new_keys, read):
+        sname = season_of_month(key[1])
+        wb = p - e
 
-    common = sorted(set(prec_map.keys()).intersection(set(evap_map.keys())), key=yyyymm_int)
-    common = [k for k in common if START_YYYYMM <= yyyymm_int(k) <= END_YYYYMM]
-    if not common:
-        raise RuntimeError("No matching YYYYMM after filter.")
+        validP  = np.isfinite(p)
+        validWB = np.isfinite(p) & np.isfinite(e)
 
-    dates = pd.DatetimeIndex([pd.Timestamp(y, m, 15) for (y, m) in common])
-    months = dates.month.values
-    seasons = np.array([season_of_month(mo) for mo in months], dtype=object)
+        for k in TIMESCALES:
+            rollP_k, rollW_k = roll[k]
+            rollNP_k, rollNW_k = rolln[k]
 
-    print("Matched months:", len(common), "from", common[0], "to", common[-1])
-    print("Using BUF_LEN =", BUF_LEN)
+            rollP_k[validP]   += p[validP]
+            rollNP_k[validP]  += 1
+            rollW_k[validWB]  += wb[validWB]
+            rollNW_k[validWB] += 1
 
-    # ---- fixed window + inside mask ----
-    first_fp = prec_map[common[0]]
-    with rasterio.open(first_fp) as src0:
-        rcrs = src0.crs
-        if boundary.crs != rcrs:   boundary   = boundary.to_crs(rcrs)
-        if watersheds.crs != rcrs: watersheds = watersheds.to_crs(rcrs)
-        if greenland.crs != rcrs:  greenland  = greenland.to_crs(rcrs)
+            # the month leaving the k-window; the ring holds the last KMAX, oldest at `slot`
+            old_idx = (slot + KMAX - k) % KMAX
+            oldP, oldW = ringP[old_idx], ringWB[old_idx]
+            oldmP, oldmW = np.isfinite(oldP), np.isfinite(oldW)
+            rollP_k[oldmP]   -= oldP[oldmP]
+            rollNP_k[oldmP]  -= 1
+            rollW_k[oldmW]   -= oldW[oldmW]
+            rollNW_k[oldmW]  -= 1
+
+            meanP_k, stdP_k, meanW_k, stdW_k = stats[k]
+            x = (rolling_value(rollP_k, rollNP_k, k, min_valid[k]) - meanP_k) / stdP_k
+            y = (rolling_value(rollW_k, rollNW_k, k, min_valid[k]) - meanW_k) / stdW_k
+
+            m = np.isfinite(x) & np.isfinite(y)
+            if np.any(m):
+                for gi in (0, groups.index(sname)) if sname in SEASON_NAMES else (0,):
+                    n[k][gi][m] += 1
+                    sx_g, sy_g, sxx_g, syy_g, sxy_g = sums[k][gi]
+                    sx_g[m]  += x[m]
+                    sy_g[m]  += y[m]
+                    sxx_g[m] += x[m] * x[m]
+                    syy_g[m] += y[m] * y[m]
+                    sxy_g[m] += x[m] * y[m]
+
+        ringP[slot] = p
+        ringWB[slot] = wb
+        slot = (slot + 1) % KMAX
 
-        window = geometry_window(src0, boundary.geometry, pad_x=0, pad_y=0)
-        w_transform = src0.window_transform(window)
-        H = int(window.height)
-        W = int(window.width)
+    for k in TIMESCALES:
+        state.save_array(f"n_k{k}", n[k])
+        state.save_array(f"sums_k{k}", sums[k])
+        state.save_array(f"roll_k{k}", roll[k])
+        state.save_array(f"rolln_k{k}", rolln[k])
+    state.save_array("ringP", ringP)
+    state.save_array("ringWB", ringWB)
+    state.meta["slot"] = slot
+
+def maps_from_state(state):
+    groups = ["ALL"] + SEASON_NAMES
+    r_all_maps, p_all_maps = {}, {}
+    fig3_sketches = new_fig3_sketches()
+    for k in TIMESCALES:
+        n_k = np.array(state.load_array(f"n_k{k}"))
+        sums_k = np.array(state.load_array(f"sums_k{k}"))
+        n = {g: n_k[i] for i, g in enumerate(groups)}
+        sx, sy, sxx, syy, sxy = ({g: sums_k[i][j] for i, g in enumerate(groups)} for j in range(5))
+        maps_from_sums(k, n, sx, sy, sxx, syy, sxy, r_all_maps, p_all_maps, fig3_sketches)
+    return r_all_maps, p_all_maps, fig3_sketches
+
+def pack_buffers(P_buf, WB_buf):
+    """Filled slots of the month ring buffers, for a checkpoint."""
+    out = {f"P_buf_{i}": a for i, a in enumerate(P_buf) if a is not None}
+    out.update({f"WB_buf_{i}": a for i, a in enumerate(WB_buf) if a is not None})
+    return out
 
-        inside_mask = geometry_mask(boundary.geometry, out_shape=(H, W),
-                                    transform=w_transform, invert=True)
-        extent = compute_extent_from_transform(w_transform, W, H)
+def restore_buffers(arrays, P_buf, WB_buf, mP_buf, mW_buf):
+    for i in range(BUF_LEN):
+        if f"P_buf_{i}" in arrays:
+            P_buf[i] = arrays[f"P_buf_{i}"]
+            WB_buf[i] = arrays[f"WB_buf_{i}"]
+            mP_buf[i] = np.isfinite(P_buf[i])
+            mW_buf[i] = np.isfinite(WB_buf[i])   # = finite P and E
 
-    min_valid = {k: max(1, int(np.ceil(k * MIN_VALID_FRAC_BY_K[k]))) for k in TIMESCALES}
-    print("min_valid months per k:", min_valid)
+def baseline_pass(common, prec_map, evap_map, window, inside_mask, min_valid, trace, ckpt=None, resume=None):
+    H, W = inside_mask.shape
 
     # ========================================================
     # PASS 1: mean/std of rolling sums
     # ========================================================
+    trace.begin("baseline pass")
     print("\nPASS 1/2: computing mean/std of rolling sums...")
 
     P_buf   = [None] * BUF_LEN
@@ -284,10 +404,18 @@ def main():
 
     buf_idx = 0
     t_idx = 0
-
-    for key in common:
-        p = read_window_masked(prec_map[key], window, inside_mask)
-        e = read_window_masked(evap_map[key], window, inside_mask)
+    if resume is not None and resume.stage == "pass1":
+        a = resume.arrays
+        for k in TIMESCALES:
+            for name, d in (("rollP", rollP), ("rollNP", rollNP), ("rollWB", rollWB), ("rollNW", rollNW),
+                            ("meanP", meanP), ("M2P", M2P), ("nP", nP),
+                            ("meanW", meanW), ("M2W", M2W), ("nW", nW)):
+                d[k][...] = a[f"{name}_{k}"]
+        restore_buffers(a, P_buf, WB_buf, mP_buf, mWB_buf)
+        buf_idx, t_idx = int(resume.meta["buf_idx"]), int(resume.meta["t_idx"])
+
+    read = partial(read_month_pair, prec_map=prec_map, evap_map=evap_map, window=window, inside_mask=inside_mask)
+    for key, (p, e) in prefetch(common[t_idx:], read):
         wb = p - e
 
         validP  = np.isfinite(p)
@@ -337,6 +465,14 @@ def main():
         if t_idx % 24 == 0:
             print(f"  processed {t_idx}/{len(common)} months...")
 
+        if ckpt is not None and ckpt.due():
+            arrays = pack_buffers(P_buf, WB_buf)
+            for name, d in (("rollP", rollP), ("rollNP", rollNP), ("rollWB", rollWB), ("rollNW", rollNW),
+                            ("meanP", meanP), ("M2P", M2P), ("nP", nP),
+                            ("meanW", meanW), ("M2W", M2W), ("nW", nW)):
+                arrays.update({f"{name}_{k}": d[k] for k in TIMESCALES})
+            ckpt.save("pass1", arrays, buf_idx=buf_idx, t_idx=t_idx)
+
     stdP = {k: safe_std_from_M2(M2P[k], nP[k]).astype("float32") for k in TIMESCALES}
     stdW = {k: safe_std_from_M2(M2W[k], nW[k]).astype("float32") for k in TIMESCALES}
     meanP = {k: meanP[k].astype("float32") for k in TIMESCALES}
@@ -345,16 +481,46 @@ def main():
     for k in TIMESCALES:
         print(f"k={k}: finite stdP={np.isfinite(stdP[k]).sum()}  finite stdW={np.isfinite(stdW[k]).sum()}")
 
+    # per k: stacked meanP, stdP, meanW, stdW
+    return {k: np.stack([meanP[k], stdP[k], meanW[k], stdW[k]]) for k in TIMESCALES}
+
+def correlation_pass(common, seasons, prec_map, evap_map, window, inside_mask, min_valid, stats, trace,
+                     state=None, ckpt=None, resume=None):
+    H, W = inside_mask.shape
+
     # ========================================================
     # PASS 2: correlations
     # ========================================================
+    trace.begin("correlation pass")
     print("\nPASS 2/2: computing correlations...")
     r_all_maps = {}
     p_all_maps = {}
-    fig3_data = {k: {s: [] for s in SEASON_NAMES} for k in TIMESCALES}
+    fig3_sketches = new_fig3_sketches()
+    groups = ["ALL"] + SEASON_NAMES
+
+    done_ks = []
+    if resume is not None and resume.stage == "pass2":
+        done_ks = list(resume.meta["done_ks"])
+        for k in done_ks:
+            r_all_maps[k] = resume.arrays[f"r_all_{k}"]
+            p_all_maps[k] = resume.arrays[f"p_all_{k}"]
+            for sn in SEASON_NAMES:
+                fig3_sketches[k][sn] = HistogramSketch.load(ckpt.file(f"fig3_k{k}_{sn}.npz"))
+
+    def checkpoint_arrays(**current):
+        arrays = {f"stats_{k}": stats[k] for k in TIMESCALES}
+        for k in done_ks:
+            arrays[f"r_all_{k}"] = r_all_maps[k]
+            arrays[f"p_all_{k}"] = p_all_maps[k]
+        arrays.update(current)
+        return arrays
 
     for k in TIMESCALES:
+        if k in done_ks:
+            print(f"\nTimescale k={k} months: finished before the interruption, skipped.")
+            continue
         print(f"\nTimescale k={k} months...")
+        meanP_k, stdP_k, meanW_k, stdW_k = stats[k]
 
         rollP_k  = np.zeros((H, W), dtype="float64")
         rollNP_k = np.zeros((H, W), dtype="int16")
@@ -369,17 +535,27 @@ def main():
         buf_idx = 0
         t_idx = 0
 
-        groups = ["ALL"] + SEASON_NAMES
         n   = {g: np.zeros((H, W), dtype="uint16") for g in groups}
         sx  = {g: np.zeros((H, W), dtype="float32") for g in groups}
         sy  = {g: np.zeros((H, W), dtype="float32") for g in groups}
         sxx = {g: np.zeros((H, W), dtype="float32") for g in groups}
         syy = {g: np.zeros((H, W), dtype="float32") for g in groups}
         sxy = {g: np.zeros((H, W), dtype="float32") for g in groups}
-
-        for (key, sname) in zip(common, seasons):
-            p = read_window_masked(prec_map[key], window, inside_mask)
-            e = read_window_masked(evap_map[key], window, inside_mask)
+        sums = {"sx": sx, "sy": sy, "sxx": sxx, "syy": syy, "sxy": sxy}
+
+        if resume is not None and resume.stage == "pass2" and resume.meta.get("k") == k:
+            a = resume.arrays
+            rollP_k[...], rollNP_k[...] = a["rollP_k"], a["rollNP_k"]
+            rollW_k[...], rollNW_k[...] = a["rollW_k"], a["rollNW_k"]
+            for g in groups:
+                n[g][...] = a[f"n_{g}"]
+                for name, d in sums.items():
+                    d[g][...] = a[f"{name}_{g}"]
+            restore_buffers(a, P_buf, WB_buf, mP_buf, mW_buf)
+            buf_idx, t_idx = int(resume.meta["buf_idx"]), int(resume.meta["t_idx"])
+
+        read = partial(read_month_pair, prec_map=prec_map, evap_map=evap_map, window=window, inside_mask=inside_mask)
+        for (key, (p, e)), sname in zip(prefetch(common[t_idx:], read), seasons[t_idx:]):
             wb = p - e
 
             validP  = np.isfinite(p)
@@ -420,8 +596,8 @@ def main():
                     Pk  = np.where(okP, rollP_k, np.nan).astype("float32")
                     WBk = np.where(okW, rollW_k, np.nan).astype("float32")
 
-                x = (Pk  - meanP[k]) / stdP[k]
-                y = (WBk - meanW[k]) / stdW[k]
+                x = (Pk  - meanP_k) / stdP_k
+                y = (WBk - meanW_k) / stdW_k
 
                 m = np.isfinite(x) & np.isfinite(y)
                 if np.any(m):
@@ -445,19 +621,164 @@ def main():
             if t_idx % 24 == 0:
                 print(f"  k={k}: processed {t_idx}/{len(common)} months...")
 
-        r_all = corr_from_sums(n["ALL"], sx["ALL"], sy["ALL"], sxx["ALL"], syy["ALL"], sxy["ALL"])
-        p_all = p_from_r_n(r_all, n["ALL"])
-        r_all_maps[k] = r_all
-        p_all_maps[k] = p_all
+            if ckpt is not None and ckpt.due():
+                current = pack_buffers(P_buf, WB_buf)
+                current.update(rollP_k=rollP_k, rollNP_k=rollNP_k, rollW_k=rollW_k, rollNW_k=rollNW_k)
+                for g in groups:
+                    current[f"n_{g}"] = n[g]
+                    current.update({f"{name}_{g}": d[g] for name, d in sums.items()})
+                ckpt.save("pass2", checkpoint_arrays(**current),
+                          k=k, done_ks=done_ks, buf_idx=buf_idx, t_idx=t_idx)
+
+        if state is not None:
+            state.save_array(f"n_k{k}", np.stack([n[g] for g in groups]))
+            state.save_array(f"sums_k{k}", np.stack([np.stack([sx[g], sy[g], sxx[g], syy[g], sxy[g]])
+                                                     for g in groups]))
+            state.save_array(f"roll_k{k}", np.stack([rollP_k, rollW_k]))
+            state.save_array(f"rolln_k{k}", np.stack([rollNP_k, rollNW_k]))
+            if k == KMAX:
+                # last KMAX months, oldest first (ring slot 0 is overwritten next)
+                order = [(buf_idx - KMAX + j) % BUF_LEN for j in range(KMAX)]
+                state.save_array("ringP", np.stack([P_buf[i] for i in order]))
+                state.save_array("ringWB", np.stack([WB_buf[i] for i in order]))
+
+        maps_from_sums(k, n, sx, sy, sxx, syy, sxy, r_all_maps, p_all_maps, fig3_sketches)
+
+        if ckpt is not None:
+            for sn in SEASON_NAMES:
+                fig3_sketches[k][sn].save(ckpt.file(f"fig3_k{k}_{sn}.npz"))
+            done_ks.append(k)
+            ckpt.save("pass2", checkpoint_arrays(), k=None, done_ks=done_ks)
+
+    return r_all_maps, p_all_maps, fig3_sketches
+
+def full_pass(common, seasons, prec_map, evap_map, window, inside_mask, min_valid, trace,
+              state=None, ckpt=None, resume=None):
+    """
+    PASS 1 + PASS 2 over the whole archive. With a RollingState, the frozen
+    mean/std, rolling sums, correlation sums and the last KMAX months are
+    saved for later update_pass() runs. With a Checkpoint, the accumulators
+    are saved periodically and `resume` (from Checkpoint.load) continues
+    from the month / timescale reached.
+    """
+    if resume is not None and resume.stage == "pass2":
+        trace.begin("baseline pass")
+        print("\nPASS 1/2: mean/std of rolling sums restored from checkpoint.")
+        stats = {k: resume.arrays[f"stats_{k}"] for k in TIMESCALES}
+    else:
+        stats = baseline_pass(common, prec_map, evap_map, window, inside_mask, min_valid, trace, ckpt, resume)
+        if ckpt is not None:
+            ckpt.save("pass2", {f"stats_{k}": stats[k] for k in TIMESCALES}, k=None, done_ks=[])
+
+    if state is not None:
+        for k in TIMESCALES:
+            state.save_array(f"stats_k{k}", stats[k])
+
+    return correlation_pass(common, seasons, prec_map, evap_map, window, inside_mask, min_valid, stats, trace,
+                            state, ckpt, resume)
+
+# ============================================================
+# MAIN
+# ============================================================
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--update", action="store_true",
+                    help="add only the months after the saved state (see STATE_DIR) to the correlation sums")
+    ap.add_argument("--resume", action="store_true",
+                    help="continue an interrupted full run from its last checkpoint (see CHECKPOINT_DIR)")
+    ap.add_argument("--preview-factor", type=int, default=1,
+                    help="read inputs at 1/N resolution (~N^2 faster) to check the figures; outputs go to preview_xN")
+    args = ap.parse_args()
+
+    # a preview keeps its outputs, state and checkpoints apart from the full-resolution ones
+    set_preview_factor(args.preview_factor)
+    out_dir = preview_dir(OUT_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+    state_dir = preview_dir(STATE_DIR)
+    ckpt_dir = preview_dir(CHECKPOINT_DIR)
+
+    trace = Tracer("correlation_maps")
+    trace.begin("setup")
+    boundary   = gpd.read_file(BOUNDARY_SHP)
+    watersheds = gpd.read_file(WATERSHED_SHP)
+    greenland  = gpd.read_file(GREENLAND_SHP)
+
+    prec_files = list_sorted_files(PREC_GLOB)
+    evap_files = list_sorted_files(EVAP_GLOB)
+
+    prec_map = {parse_yyyymm(f): f for f in prec_files}
+    evap_map = {parse_yyyymm(f): f for f in evap_files}
+
+    common = sorted(set(prec_map.keys()).intersection(set(evap_map.keys())), key=yyyymm_int)
+    # an update continues the series past END_YYYYMM
+    common = [k for k in common
+              if START_YYYYMM <= yyyymm_int(k) and (args.update or yyyymm_int(k) <= END_YYYYMM)]
+    if not common:
+        raise RuntimeError("No matching YYYYMM after filter.")
+
+    dates = pd.DatetimeIndex([pd.Timestamp(y, m, 15) for (y, m) in common])
+    months = dates.month.values
+    seasons = np.array([season_of_month(mo) for mo in months], dtype=object)
+
+    print("Matched months:", len(common), "from", common[0], "to", common[-1])
+    print("Using BUF_LEN =", BUF_LEN)
 
-        print(f"  k={k}: finite r pixels={np.isfinite(r_all).sum()} | pixels with n>=3 = {(n['ALL']>=3).sum()}")
+    # ---- fixed window + inside mask ----
+    first_fp = prec_map[common[0]]
+    with open_raster(first_fp) as src0:
+        rcrs = src0.crs
+        if boundary.crs != rcrs:   boundary   = boundary.to_crs(rcrs)
+        if watersheds.crs != rcrs: watersheds = watersheds.to_crs(rcrs)
+        if greenland.crs != rcrs:  greenland  = greenland.to_crs(rcrs)
 
-        for sn in SEASON_NAMES:
-            r_s = corr_from_sums(n[sn], sx[sn], sy[sn], sxx[sn], syy[sn], sxy[sn])
-            p_s = p_from_r_n(r_s, n[sn])
-            vals = r_s[(p_s < P_THRESHOLD) & np.isfinite(r_s)]
-            if vals.size > 0:
-                fig3_data[k][sn].extend(vals.astype("float32").tolist())
+        window = geometry_window(src0, boundary.geometry, pad_x=0, pad_y=0)
+        w_transform = src0.window_transform(window)
+        H = int(window.height)
+        W = int(window.width)
+
+        inside_mask = geometry_mask(boundary.geometry, out_shape=(H, W),
+                                    transform=w_transform, invert=True)
+        extent = compute_extent_from_transform(w_transform, W, H)
+
+    min_valid = {k: max(1, int(np.ceil(k * MIN_VALID_FRAC_BY_K[k]))) for k in TIMESCALES}
+    print("min_valid months per k:", min_valid)
+
+    state = RollingState(state_dir)
+    if args.update:
+        trace.begin("incremental update")
+        state.load(timescales=TIMESCALES, window=[int(window.col_off), int(window.row_off), W, H],
+                   min_valid=[min_valid[k] for k in TIMESCALES], scale_partial=SCALE_PARTIAL_WINDOWS)
+        new_keys = months_after(common, state.meta["last"])
+        if new_keys:
+            print(f"\nUPDATE: ingesting {len(new_keys)} new month(s): {new_keys[0]} -> {new_keys[-1]}")
+            state.begin_update()
+            update_pass(state, new_keys, prec_map, evap_map, window, inside_mask, min_valid)
+            state.commit(last=yyyymm_int(new_keys[-1]))
+        else:
+            print(f"\nUPDATE: state is current (last month {state.meta['last']}), redrawing only.")
+        r_all_maps, p_all_maps, fig3_sketches = maps_from_state(state)
+    else:
+        if len(common) < KMAX:
+            raise RuntimeError(f"Need at least {KMAX} months, found {len(common)}.")
+        ckpt = Checkpoint(
+            ckpt_dir, "correlation",
+            input_signature([prec_map[k] for k in common] + [evap_map[k] for k in common],
+                            BOUNDARY_SHP, TIMESCALES, MIN_VALID_FRAC_BY_K, SCALE_PARTIAL_WINDOWS),
+            interval_s=CHECKPOINT_INTERVAL_S,
+        )
+        resume = ckpt.load() if args.resume else None
+        if resume is None:
+            ckpt.clear()
+
+        state.create(keep_arrays=resume is not None,
+                     timescales=TIMESCALES, window=[int(window.col_off), int(window.row_off), W, H],
+                     min_valid=[min_valid[k] for k in TIMESCALES], scale_partial=SCALE_PARTIAL_WINDOWS)
+        r_all_maps, p_all_maps, fig3_sketches = full_pass(
+            common, seasons, prec_map, evap_map, window, inside_mask, min_valid, trace, state, ckpt, resume
+        )
+        state.commit(last=yyyymm_int(common[-1]), slot=0)
+        print(f"Saved rolling state for --update: {state_dir}")
+        ckpt.clear()
 
     # ========================================================
     # Build plot maps + store significance masks
@@ -465,6 +786,7 @@ def main():
     r_plot_maps = {}
     used_thresh = {}
     sig_masks = {}
+    r_sketches = {}
 
     for k in TIMESCALES:
         r_all = r_all_maps[k]
@@ -487,23 +809,24 @@ def main():
         out[mask_sig] = r_all[mask_sig]
         r_plot_maps[k] = out
 
+        r_sketches[k] = HistogramSketch(-1.0, 1.0, n_bins=R_SKETCH_BINS).update(
+            out if DOMAIN_USE_SIGNIFICANT_ONLY else r_all
+        )
+        r_sketches[k].save(os.path.join(out_dir, f"r_k{k}_sketch.npz"))
+
         print(f"k={k}: used p<{thr:.2f} | kept pixels={np.isfinite(out).sum()}")
 
     # ========================================================
     # Auto better domain (vmin/vmax) from k=12 distribution
     # ========================================================
     kdom = AUTO_DOMAIN_FROM_K
-    if DOMAIN_USE_SIGNIFICANT_ONLY:
-        vals = r_all_maps[kdom][sig_masks[kdom] & np.isfinite(r_all_maps[kdom])]
-    else:
-        vals = r_all_maps[kdom][np.isfinite(r_all_maps[kdom])]
-
-    vmin, vmax = robust_domain_from_values(vals, DOMAIN_P_LOW, DOMAIN_P_HIGH, DOMAIN_PAD)
+    vmin, vmax = robust_domain_from_sketch(r_sketches[kdom], DOMAIN_P_LOW, DOMAIN_P_HIGH, DOMAIN_PAD)
     print(f"\nAuto colorbar domain from k={kdom}: vmin={vmin:.3f}, vmax={vmax:.3f} (percentiles {DOMAIN_P_LOW}-{DOMAIN_P_HIGH})")
 
     # ========================================================
     # FIG 2: save 4 versions (different colormaps, same domain)
     # ========================================================
+    trace.begin("rendering")
     ks = [1, 3, 6, 12]
     panel_text = {1: "30 days\n1 month", 3: "90 days\n3 months", 6: "180 days\n6 months", 12: "360 days\n12 months"}
 
@@ -550,9 +873,9 @@ def main():
             f"domain [{vmin:.2f}, {vmax:.2f}]"
         )
 
-        fig2_png = os.path.join(OUT_DIR, f"Fig2_correlation_maps_{tag}.png")
-        fig2_pdf = os.path.join(OUT_DIR, f"Fig2_correlation_maps_{tag}.pdf")
-        fig.savefig(fig2_png, dpi=1500, bbox_inches="tight")
+        fig2_png = os.path.join(out_dir, f"Fig2_correlation_maps_{tag}.png")
+        fig2_pdf = os.path.join(out_dir, f"Fig2_correlation_maps_{tag}.pdf")
+        fig.savefig(fig2_png, dpi=preview_dpi(1500), bbox_inches="tight")
         fig.savefig(fig2_pdf, bbox_inches="tight")
         plt.close(fig)
 
@@ -569,8 +892,8 @@ def main():
                       for s in SEASON_NAMES]
 
     for idx, (ax, k) in enumerate(zip(axes.ravel(), ks)):
-        data = [fig3_data[k][s] for s in SEASON_NAMES]
-        bp = ax.boxplot(data, labels=SEASON_NAMES, showfliers=False, patch_artist=True)
+        stats = [fig3_sketches[k][s].box_stats(label=s) for s in SEASON_NAMES]
+        bp = ax.bxp(stats, showfliers=False, patch_artist=True)
 
         for box, s in zip(bp["boxes"], SEASON_NAMES):
             box.set_facecolor(SEASON_COLORS[s])
@@ -585,12 +908,13 @@ def main():
             ax.legend(handles=legend_handles, loc="lower center",
                       bbox_to_anchor=(0.5, 0.02), ncol=4, frameon=False)
 
-    fig3_png = os.path.join(OUT_DIR, "Fig3_seasonal_boxplots_correlation.png")
-    fig3_pdf = os.path.join(OUT_DIR, "Fig3_seasonal_boxplots_correlation.pdf")
-    fig.savefig(fig3_png, dpi=1500, bbox_inches="tight")
+    fig3_png = os.path.join(out_dir, "Fig3_seasonal_boxplots_correlation.png")
+    fig3_pdf = os.path.join(out_dir, "Fig3_seasonal_boxplots_correlation.pdf")
+    fig.savefig(fig3_png, dpi=preview_dpi(1500), bbox_inches="tight")
     fig.savefig(fig3_pdf, bbox_inches="tight")
     plt.close(fig)
 
+    trace.finish(TRACE_DIR, chrome=TRACE_CHROME)
     print("\nDONE ✅")
     print("Fig3:", fig3_png)
     print("Fig3:", fig3_pdf)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Monthly P, E and WTD series at point locations (e.g. observation wells).
+
+Reads a CSV of points (id, lon, lat), opens every monthly GeoTIFF of each
+archive once and gathers all points from it (see pwtl/points.py), then
+writes one (point x month) table per variable:
+
+  <out_dir>/points_P.csv, points_E.csv, points_WTD.csv
+
+An archive may also be a cube file with one band per month (netCDF
+variable, Zarr, multi-band GeoTIFF, VRT stack) instead of a folder.
+
+Examples:
+  python extract_point_series.py wells.csv
+  python extract_point_series.py wells.csv --archive WTD="/media/mohammad/My Book/WTM_Result/Monthly/3"
+  python extract_point_series.py wells.csv --id_col site_no --lon_col dec_long_va --lat_col dec_lat_va
+"""
+
+import os
+import time
+import argparse
+
+import pandas as pd
+
+from pwtl.points import extract_archives
+
+
+# =========================
+# USER SETTINGS
+# =========================
+PREC_DIR = "/media/mohammad/My Book/0-2025/Monthly/pr/CMIP6/monthly/downscaled/N_America/1"
+EVAP_DIR = "/media/mohammad/My Book/0-2025/Monthly/evap/CMIP6/monthly/downscaled/N_America/1"
+WTD_DIR  = "/media/mohammad/My Book/WTM_Result/Monthly/3"
+OUT_DIR  = "/home/mohammad/Desktop/1/points"
+
+ARCHIVES = {"P": PREC_DIR, "E": EVAP_DIR, "WTD": WTD_DIR}
+# =========================
+
+
+def parse_archive(text):
+    name, sep, path = text.partition("=")
+    if not sep or not name or not path:
+        raise argparse.ArgumentTypeError(f"expected NAME=PATH, got {text!r}")
+    return name, path
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("points_csv", help="CSV with one row per point")
+    ap.add_argument("--id_col", default="id", help="Point id column")
+    ap.add_argument("--lon_col", default="lon", help="Longitude (or x) column")
+    ap.add_argument("--lat_col", default="lat", help="Latitude (or y) column")
+    ap.add_argument("--points_crs", default="EPSG:4326", help="CRS of the point coordinates")
+    ap.add_argument("--archive", type=parse_archive, action="append",
+                    help="NAME=folder or cube file; repeat for several (default: P, E, WTD from USER SETTINGS)")
+    ap.add_argument("--out_dir", default=OUT_DIR, help="Output folder")
+    args = ap.parse_args()
+
+    points = pd.read_csv(args.points_csv)
+    missing = [c for c in (args.id_col, args.lon_col, args.lat_col) if c not in points.columns]
+    if missing:
+        raise SystemExit(f"Column(s) {missing} not in {args.points_csv}; columns are {list(points.columns)}")
+    print(f"{len(points)} points from {args.points_csv}")
+
+    archives = dict(args.archive) if args.archive else ARCHIVES
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    t0 = time.perf_counter()
+    table = extract_archives(archives, points[args.lon_col].values, points[args.lat_col].values,
+                             ids=points[args.id_col].values, points_crs=args.points_crs)
+
+    for name in archives:
+        out_csv = os.path.join(args.out_dir, f"points_{name}.csv")
+        table[name].to_csv(out_csv)
+        print(f"Saved: {out_csv}")
+    print(f"Done in {time.perf_counter() - t0:.0f} s")
+
+
+if __name__ == "__main__":
+    main()
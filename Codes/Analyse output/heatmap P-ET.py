@@ -24,6 +24,18 @@ What it does (same logic as your P-E script, but for WTD):
 Outputs (dpi=1500):
   /home/mohammad/Desktop/1/wtd_wet_dry_dominance_heatmap.png
   /home/mohammad/Desktop/1/wtd_wet_dry_dominance_heatmap.pdf
+
+Monthly updates:
+  A full run also saves its state (baseline mean/std, the last 12 months per
+  pixel, the running 12-month sum and the per-month wet/dry counts) in
+  <out_dir>/state/wtd_dominance. When a new month arrives,
+    python "heatmap P-ET.py" --update
+  reads only the new month(s), adds their dominance cells and redraws the
+  heatmap. Months inside the baseline years need a full run.
+
+Preview:
+  --preview_factor N reads the WTD rasters at 1/N resolution (~N^2 faster)
+  and writes to <out_dir>/preview_xN, to check the figure before a full run.
 """
 
 import os
@@ -31,14 +43,21 @@ import re
 import glob
 import argparse
 from collections import deque, defaultdict
+from functools import partial
 
 import numpy as np
-import rasterio
 from rasterio.windows import Window
 
 import matplotlib.pyplot as plt
 from matplotlib.colors import TwoSlopeNorm
 
+from pwtl.storage import read_decoded
+from pwtl.incremental import RollingState, check_outside_baseline, months_after
+from pwtl.prefetch import DEFAULT_DEPTH, prefetch
+from pwtl.preview import open_raster, preview_dir, preview_dpi, set_preview_factor
+from pwtl.blocks import auto_block_size, describe_budget, parse_memory, raster_block_shape
+from pwtl.trace import Tracer
+
 
 # --------- FIXED PATHS (your paths) ----------
 WTD_DIR_DEFAULT = "/media/mohammad/My Book/WTM_Result/Monthly/3"
@@ -48,6 +67,14 @@ OUT_DIR_DEFAULT = "/home/mohammad/Desktop/1"
 # Matches N_America_YYYYMM_anything.tif
 DATE_RE = re.compile(r"^N_America_(\d{6})_.*\.tif$")
 
+# Working set per pixel for --max_memory, as (count, dtype):
+# per window: 12-month deque + its stack, ~4 temporaries, Welford mean/m2/count, masks,
+# months read ahead
+WINDOW_TERMS = [(12, "float32"), (12, "float32"), (4, "float32"), (2, "float32"), (1, "int32"), (3, "bool"),
+                (DEFAULT_DEPTH, "float32")]
+# whole grid: mean, m2, std + count
+GRID_TERMS = [(3, "float32"), (1, "int32")]
+
 
 def parse_yyyymm(path: str) -> str:
     fn = os.path.basename(path)
@@ -85,7 +112,7 @@ def build_wtd_path_for_date(wtd_dir: str, yyyymm: str):
 
 
 def open_reference_raster(ref_path: str):
-    with rasterio.open(ref_path) as src:
+    with open_raster(ref_path) as src:
         nodata = src.nodata
         height, width = src.height, src.width
     return nodata, height, width
@@ -100,8 +127,8 @@ def iter_windows(width: int, height: int, block_size: int):
 
 
 def read_block(path: str, window: Window, nodata):
-    with rasterio.open(path) as src:
-        arr = src.read(1, window=window).astype(np.float32)
+    with open_raster(path) as src:
+        arr = read_decoded(src, 1, window=window)
 
     if nodata is not None:
         valid = (arr != nodata) & np.isfinite(arr)
@@ -112,6 +139,10 @@ def read_block(path: str, window: Window, nodata):
     return arr
 
 
+def read_month(yyyymm: str, wtd_dir: str, window: Window, nodata):
+    return read_block(build_wtd_path_for_date(wtd_dir, yyyymm), window, nodata)
+
+
 def compute_baseline_mean_std(
     dates,
     wtd_dir,
@@ -142,12 +173,11 @@ def compute_baseline_mean_std(
         w_m2   = np.zeros((wh, ww), dtype=np.float32)
         w_cnt  = np.zeros((wh, ww), dtype=np.int32)
 
-        for yyyymm in dates:
+        # next months are read in the background while this one is processed
+        read = partial(read_month, wtd_dir=wtd_dir, window=window, nodata=nodata)
+        for yyyymm, wtd in prefetch(dates, read):
             y, _ = month_index_to_year_month(yyyymm)
 
-            w_path = build_wtd_path_for_date(wtd_dir, yyyymm)
-            wtd = read_block(w_path, window, nodata)
-
             if len(wtd_deque) < 12:
                 wtd_deque.append(wtd)
                 if len(wtd_deque) == 12:
@@ -197,6 +227,33 @@ def compute_baseline_mean_std(
     return mean, std
 
 
+def dominance_from_counts(dates, wet_counts, dry_counts, tot_counts):
+    """Per-month wet/dry/total pixel counts -> (years, dominance matrix years x 12)."""
+    year_to_months = defaultdict(set)
+    ym_map = {}
+    for d in dates:
+        y, m = month_index_to_year_month(d)
+        year_to_months[y].add(m)
+        ym_map[d] = (y, m)
+
+    years_sorted = sorted(year_to_months.keys())
+    dom = np.full((len(years_sorted), 12), np.nan, dtype=np.float32)
+    year_index = {y: i for i, y in enumerate(years_sorted)}
+
+    for d in dates:
+        tot = tot_counts[d]
+        if tot <= 0:
+            continue
+        wet_pct = 100.0 * wet_counts[d] / tot
+        dry_pct = 100.0 * dry_counts[d] / tot
+        dominance = wet_pct - dry_pct  # [-100, +100]
+
+        y, m = ym_map[d]
+        dom[year_index[y], m - 1] = dominance
+
+    return years_sorted, dom
+
+
 def compute_dominance_matrix(
     dates,
     wtd_dir,
@@ -204,25 +261,20 @@ def compute_dominance_matrix(
     std,
     block_size,
     nodata,
+    state=None,
 ):
     """
     PASS 2:
       - compute WTD12 again
       - compute z per pixel
       - dominance = 100*(%wet - %dry)
+    With a RollingState, the last 12 months per pixel, their sum and the
+    per-month counts are saved for later --update runs.
     """
-    year_to_months = defaultdict(set)
-    ym_map = {}
-    for d in dates:
-        y, m = month_index_to_year_month(d)
-        year_to_months[y].add(m)
-        ym_map[d] = (y, m)
-
-    years_sorted = sorted(year_to_months.keys())
-    dom = np.full((len(years_sorted), 12), np.nan, dtype=np.float32)
-    year_index = {y: i for i, y in enumerate(years_sorted)}
-
     height, width = mean.shape
+    if state is not None:
+        ring = state.open_array("ring", shape=(12, height, width), dtype="float32", fill=np.nan)
+        rsum = state.open_array("rsum", shape=(height, width), dtype="float64", fill=0.0)
 
     wet_counts = {d: 0 for d in dates}
     dry_counts = {d: 0 for d in dates}
@@ -240,9 +292,8 @@ def compute_dominance_matrix(
         w_mean = mean[r0:r1, c0:c1]
         w_std  = std[r0:r1, c0:c1]
 
-        for d in dates:
-            w_path = build_wtd_path_for_date(wtd_dir, d)
-            wtd = read_block(w_path, window, nodata)
+        read = partial(read_month, wtd_dir=wtd_dir, window=window, nodata=nodata)
+        for d, wtd in prefetch(dates, read):
 
             if len(wtd_deque) < 12:
                 wtd_deque.append(wtd)
@@ -263,26 +314,78 @@ def compute_dominance_matrix(
                 continue
 
             z = (wtd12[valid] - w_mean[valid]) / w_std[valid]
-            wet = np.count_nonzero(z > 0)
-            dry = np.count_nonzero(z < 0)
-            tot = z.size
+            # plain ints: the counts end up in the state's JSON
+            wet = int(np.count_nonzero(z > 0))
+            dry = int(np.count_nonzero(z < 0))
+            tot = int(z.size)
 
             wet_counts[d] += wet
             dry_counts[d] += dry
             tot_counts[d] += tot
 
-    for d in dates:
-        tot = tot_counts[d]
-        if tot <= 0:
-            continue
-        wet_pct = 100.0 * wet_counts[d] / tot
-        dry_pct = 100.0 * dry_counts[d] / tot
-        dominance = wet_pct - dry_pct  # [-100, +100]
+        if state is not None and len(wtd_deque) == 12:
+            # oldest month first, so the ring slot to overwrite next is 0
+            stack = np.stack(wtd_deque, axis=0)
+            ring[:, r0:r1, c0:c1] = stack
+            rsum[r0:r1, c0:c1] = np.nansum(stack.astype(np.float64), axis=0)
 
-        y, m = ym_map[d]
-        dom[year_index[y], m - 1] = dominance
+    if state is not None:
+        ring.flush()
+        rsum.flush()
+        state.meta["counts"] = {d: [wet_counts[d], dry_counts[d], tot_counts[d]] for d in dates}
 
-    return years_sorted, dom
+    return dominance_from_counts(dates, wet_counts, dry_counts, tot_counts)
+
+
+def update_dominance(state, new_dates, wtd_dir, block_size, nodata):
+    """
+    Ingest `new_dates` into a saved state: one read of each new month per
+    window, the 12-month sum is updated with the month leaving the ring.
+    Returns {yyyymm: [wet, dry, total]} for the new months.
+    """
+    mean = state.load_array("mean")
+    std = state.load_array("std")
+    ring = state.open_array("ring")
+    rsum = state.open_array("rsum")
+    slot = int(state.meta["slot"])
+    height, width = mean.shape
+
+    counts = {d: [0, 0, 0] for d in new_dates}
+
+    for window in iter_windows(width, height, block_size):
+        r0 = int(window.row_off)
+        c0 = int(window.col_off)
+        r1 = r0 + int(window.height)
+        c1 = c0 + int(window.width)
+
+        w_mean = np.asarray(mean[r0:r1, c0:c1])
+        w_std  = np.asarray(std[r0:r1, c0:c1])
+        acc = np.array(rsum[r0:r1, c0:c1], dtype=np.float64)
+
+        read = partial(read_month, wtd_dir=wtd_dir, window=window, nodata=nodata)
+        for i, (d, wtd) in enumerate(prefetch(new_dates, read)):
+            s = (slot + i) % 12
+            old = ring[s, r0:r1, c0:c1]
+
+            # running nansum: NaN months contribute 0, as np.nansum over the deque
+            acc += np.nan_to_num(wtd, nan=0.0) - np.nan_to_num(old, nan=0.0)
+            ring[s, r0:r1, c0:c1] = wtd
+            wtd12 = acc.astype(np.float32)
+
+            valid = np.isfinite(wtd12) & np.isfinite(w_mean) & np.isfinite(w_std)
+            if not np.any(valid):
+                continue
+            z = (wtd12[valid] - w_mean[valid]) / w_std[valid]
+            counts[d][0] += int(np.count_nonzero(z > 0))
+            counts[d][1] += int(np.count_nonzero(z < 0))
+            counts[d][2] += int(z.size)
+
+        rsum[r0:r1, c0:c1] = acc
+
+    ring.flush()
+    rsum.flush()
+    state.meta["slot"] = (slot + len(new_dates)) % 12
+    return counts
 
 
 def plot_heatmap(years, dom, out_png, out_pdf, dpi, title, baseline_start, baseline_end):
@@ -336,14 +439,30 @@ def main():
     ap.add_argument("--baseline_start", type=int, default=2000, help="Baseline start year")
     ap.add_argument("--baseline_end",   type=int, default=2020, help="Baseline end year")
     ap.add_argument("--block_size", type=int, default=512, help="Block size (256/512/1024)")
+    ap.add_argument("--max_memory", default=None,
+                    help="Memory budget, e.g. 8G: overrides --block_size with the largest tile-aligned block that fits")
     ap.add_argument("--dpi", type=int, default=1500, help="DPI for PNG/PDF")
     ap.add_argument("--title", default="WTD Wet vs. Dry Conditions: Spatial coverage", help="Plot title")
+    ap.add_argument("--trace_chrome", action="store_true", help="Also write a Chrome trace of the run stages")
+    ap.add_argument("--update", action="store_true",
+                    help="Ingest only the months after the saved state instead of recomputing everything")
+    ap.add_argument("--state_dir", default=None, help="Rolling state folder (default: <out_dir>/state/wtd_dominance)")
+    ap.add_argument("--preview_factor", "--preview-factor", type=int, default=1,
+                    help="Read WTD at 1/N resolution (~N^2 faster) to check the figure; writes to <out_dir>/preview_xN")
     args = ap.parse_args()
 
+    # a preview keeps its outputs and state apart from the full-resolution ones
+    set_preview_factor(args.preview_factor)
+    args.out_dir = preview_dir(args.out_dir)
+    args.dpi = preview_dpi(args.dpi)
+
     os.makedirs(args.out_dir, exist_ok=True)
+    state_dir = preview_dir(args.state_dir) if args.state_dir else os.path.join(args.out_dir, "state", "wtd_dominance")
     out_png = os.path.join(args.out_dir, "wtd_wet_dry_dominance_heatmap.png")
     out_pdf = os.path.join(args.out_dir, "wtd_wet_dry_dominance_heatmap.pdf")
 
+    trace = Tracer("heatmap_P-ET")
+    trace.begin("setup")
     dates = list_time_steps(args.wtd_dir)
     print(f"Found {len(dates)} monthly steps: {dates[0]} -> {dates[-1]}")
 
@@ -351,28 +470,74 @@ def main():
     nodata, height, width = open_reference_raster(ref)
     print(f"Raster size: {width} x {height} | nodata = {nodata}")
 
-    print("PASS 1/2: Computing baseline mean/std (WTD12) ...")
-    mean, std = compute_baseline_mean_std(
-        dates=dates,
-        wtd_dir=args.wtd_dir,
-        baseline_start=args.baseline_start,
-        baseline_end=args.baseline_end,
-        block_size=args.block_size,
-        nodata=nodata,
-        height=height,
-        width=width,
-    )
-
-    print("PASS 2/2: Computing dominance matrix ...")
-    years, dom = compute_dominance_matrix(
-        dates=dates,
-        wtd_dir=args.wtd_dir,
-        mean=mean,
-        std=std,
-        block_size=args.block_size,
-        nodata=nodata,
-    )
-
+    if args.max_memory:
+        budget = parse_memory(args.max_memory)
+        args.block_size = auto_block_size(
+            budget, WINDOW_TERMS, GRID_TERMS, shape=(height, width), block_shape=raster_block_shape(ref)
+        )
+        print("Memory budget:", describe_budget(args.block_size, budget, WINDOW_TERMS, GRID_TERMS, (height, width)))
+
+    if args.update:
+        trace.begin("incremental update")
+        state = RollingState(state_dir).load(
+            baseline=[args.baseline_start, args.baseline_end], shape=[height, width]
+        )
+        new_dates = months_after(dates, state.meta["last"])
+        if new_dates:
+            check_outside_baseline(new_dates, args.baseline_start, args.baseline_end)
+            print(f"UPDATE: ingesting {len(new_dates)} new month(s): {new_dates[0]} -> {new_dates[-1]}")
+            state.begin_update()
+            counts = update_dominance(state, new_dates, args.wtd_dir, args.block_size, nodata)
+            state.meta["counts"].update(counts)
+            state.commit(last=new_dates[-1])
+        else:
+            print(f"UPDATE: state is current (last month {state.meta['last']}), redrawing only.")
+
+        counts = state.meta["counts"]
+        years, dom = dominance_from_counts(
+            sorted(counts),
+            {d: c[0] for d, c in counts.items()},
+            {d: c[1] for d, c in counts.items()},
+            {d: c[2] for d, c in counts.items()},
+        )
+    else:
+        if len(dates) < 12:
+            raise RuntimeError(f"Need at least 12 months for WTD12, found {len(dates)}.")
+
+        trace.begin("baseline pass")
+        print("PASS 1/2: Computing baseline mean/std (WTD12) ...")
+        mean, std = compute_baseline_mean_std(
+            dates=dates,
+            wtd_dir=args.wtd_dir,
+            baseline_start=args.baseline_start,
+            baseline_end=args.baseline_end,
+            block_size=args.block_size,
+            nodata=nodata,
+            height=height,
+            width=width,
+        )
+
+        state = RollingState(state_dir).create(
+            baseline=[args.baseline_start, args.baseline_end], shape=[height, width], nodata=nodata
+        )
+        state.save_array("mean", mean)
+        state.save_array("std", std)
+
+        trace.begin("dominance pass")
+        print("PASS 2/2: Computing dominance matrix ...")
+        years, dom = compute_dominance_matrix(
+            dates=dates,
+            wtd_dir=args.wtd_dir,
+            mean=mean,
+            std=std,
+            block_size=args.block_size,
+            nodata=nodata,
+            state=state,
+        )
+        state.commit(last=dates[-1], slot=0)
+        print(f"Saved rolling state for --update: {state_dir}")
+
+    trace.begin("rendering")
     print(f"Saving:\n  {out_png}\n  {out_pdf}")
     plot_heatmap(
         years=years,
@@ -385,6 +550,7 @@ def main():
         baseline_end=args.baseline_end,
     )
 
+    trace.finish(os.path.join(args.out_dir, "traces"), chrome=args.trace_chrome)
     print("Done.")
 
 
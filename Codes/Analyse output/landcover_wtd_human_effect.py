@@ -1,14 +1,19 @@
 import os
+import tempfile
 import numpy as np
 import rasterio
 from rasterio.plot import plotting_extent
 from rasterio.warp import reproject, Resampling
-from rasterio.features import rasterize
 import matplotlib.pyplot as plt
 from matplotlib.colors import ListedColormap, BoundaryNorm
 from matplotlib.patches import Patch
 from matplotlib.colorbar import ColorbarBase
-import geopandas as gpd
+
+from pwtl.landcover import reclassify_landcover
+from pwtl.crosstab import wtd_change_crosstab, write_crosstab_csv
+from pwtl.overlays import read_overlay
+from pwtl.cog import open_cog
+from pwtl.trace import Tracer
 
 # ============================================================
 # USER SETTINGS
@@ -30,6 +35,7 @@ OUTPUT_BASENAME = "landcover_wtd_human_effect"
 
 SAVE_GROUPED_TIF = True
 SAVE_DIFF_TIF = True
+SAVE_CLASS_SUMMARY_CSV = True
 
 # ---------------- FIGURE ----------------
 FIG_WIDTH = 18
@@ -213,6 +219,12 @@ FIG_PNG = os.path.join(OUTPUT_DIR, OUTPUT_BASENAME + ".png")
 FIG_PDF = os.path.join(OUTPUT_DIR, OUTPUT_BASENAME + ".pdf")
 GROUPED_TIF = os.path.join(OUTPUT_DIR, OUTPUT_BASENAME + "_grouped_landcover.tif")
 DIFF_TIF = os.path.join(OUTPUT_DIR, OUTPUT_BASENAME + "_wtd_diff_cm.tif")
+CLASS_SUMMARY_CSV = os.path.join(OUTPUT_DIR, OUTPUT_BASENAME + "_wtd_change_by_class.csv")
+# reprojected / clipped shapefiles are cached here between runs
+OVERLAY_CACHE_DIR = os.path.join(OUTPUT_DIR, "overlay_cache")
+# per-stage wall/CPU/I-O trace (JSON; Chrome trace too if TRACE_CHROME)
+TRACE_DIR = os.path.join(OUTPUT_DIR, "traces")
+TRACE_CHROME = False
 
 # ============================================================
 # HELPER FUNCTIONS
@@ -255,14 +267,6 @@ def reproject_to_match(
     return dst_array
 
 
-def build_grouped_landcover(landcover):
-    grouped = np.full(landcover.shape, GROUPED_NODATA, dtype=np.uint8)
-    grouped[np.isin(landcover, HUMAN_CLASSES)] = 1
-    grouped[np.isin(landcover, MIXED_CLASSES)] = 2
-    grouped[np.isin(landcover, CLIMATE_CLASSES)] = 3
-    return grouped
-
-
 def rgb255_to_mpl(rgb):
     return tuple(v / 255.0 for v in rgb)
 
@@ -289,85 +293,94 @@ def build_systematic_points(condition_mask, transform, step_row, step_col, start
     return np.asarray(xs), np.asarray(ys)
 
 # ============================================================
-# READ LAND-COVER
-# ============================================================
-
-landcover, lc_profile, lc_transform, lc_crs, lc_bounds, lc_nodata = read_raster(LANDCOVER_TIF)
-landcover = landcover.copy()
-
-# ============================================================
-# READ SHAPEFILES
+# READ LAND-COVER METADATA
 # ============================================================
 
-greenland_gdf = gpd.read_file(GREENLAND_SHP)
-watershed_gdf = gpd.read_file(WATERSHED_SHP)
-boundary_gdf = gpd.read_file(BOUNDARY_SHP)
-
-if lc_crs is not None:
-    if greenland_gdf.crs != lc_crs:
-        greenland_gdf = greenland_gdf.to_crs(lc_crs)
-    if watershed_gdf.crs != lc_crs:
-        watershed_gdf = watershed_gdf.to_crs(lc_crs)
-    if boundary_gdf.crs != lc_crs:
-        boundary_gdf = boundary_gdf.to_crs(lc_crs)
+trace = Tracer(os.path.splitext(os.path.basename(__file__))[0])
+trace.begin("setup")
 
-watershed_clipped = gpd.clip(watershed_gdf, boundary_gdf)
+with rasterio.open(LANDCOVER_TIF) as lc_src:
+    lc_profile = lc_src.profile.copy()
+    lc_transform = lc_src.transform
+    lc_crs = lc_src.crs
+    lc_bounds = lc_src.bounds
+    lc_nodata = lc_src.nodata
 
 # ============================================================
-# BUILD BOUNDARY MASK
+# READ SHAPEFILES
 # ============================================================
 
-boundary_mask = rasterize(
-    [(geom, 1) for geom in boundary_gdf.geometry if geom is not None],
-    out_shape=landcover.shape,
-    transform=lc_transform,
-    fill=0,
-    all_touched=False,
-    dtype=np.uint8
-).astype(bool)
-
-inside_boundary = boundary_mask.copy()
+greenland_gdf = read_overlay(GREENLAND_SHP, lc_crs, cache_dir=OVERLAY_CACHE_DIR)
+boundary_gdf = read_overlay(BOUNDARY_SHP, lc_crs, cache_dir=OVERLAY_CACHE_DIR)
+watershed_clipped = read_overlay(
+    WATERSHED_SHP, lc_crs, clip_with=BOUNDARY_SHP, clip_method="clip", cache_dir=OVERLAY_CACHE_DIR
+)
 
 # ============================================================
-# FIX LAND-COVER INSIDE BOUNDARY
-# 0 -> 4
-# nodata inside boundary -> 4
-# invalid inside boundary -> 4
+# FIX + GROUP LAND-COVER INSIDE BOUNDARY (streamed by window)
+# 0 / nodata / invalid inside boundary -> 7, then grouped
+# outside boundary -> GROUPED_NODATA
 # ============================================================
 
-landcover_fixed = landcover.copy()
-
-landcover_fixed[(inside_boundary) & (landcover_fixed == 0)] = 7
+trace.begin("land-cover reclassify")
+# per-run scratch folder for the intermediate rasters (concurrent runs do not
+# overwrite each other's files); removed on exit, also after an error
+with tempfile.TemporaryDirectory(prefix=OUTPUT_BASENAME + "_") as scratch_dir:
+    grouped_tif_path = GROUPED_TIF if SAVE_GROUPED_TIF else os.path.join(scratch_dir, "grouped_landcover.tif")
+    fixed_tif_path = os.path.join(scratch_dir, "fixed_landcover.tif")
 
-if lc_nodata is not None:
-    landcover_fixed[(inside_boundary) & (landcover_fixed == lc_nodata)] = 7
+    reclassify_landcover(
+        LANDCOVER_TIF,
+        boundary_gdf.geometry,
+        grouped_tif_path,
+        fixed_path=fixed_tif_path,
+        valid_classes=list(ORIGINAL_CLASSES.keys()),
+        group_classes={1: HUMAN_CLASSES, 2: MIXED_CLASSES, 3: CLIMATE_CLASSES},
+        fill_class=7,
+        grouped_nodata=GROUPED_NODATA
+    )
 
-valid_original_classes = np.array(list(ORIGINAL_CLASSES.keys()))
-invalid_inside = inside_boundary & (~np.isin(landcover_fixed, valid_original_classes))
-landcover_fixed[invalid_inside] = 7
+    # ============================================================
+    # PER-CLASS WTD CHANGE SUMMARY (one windowed pass, both levels)
+    # ============================================================
+
+    GROUPED_NAMES = {
+        1: "Strong human effect",
+        2: "Mixed human and climate effect",
+        3: "Mostly climate-driven",
+    }
+
+    trace.begin("per-class WTD summary")
+    wtd_change_tables = wtd_change_crosstab(
+        {"original": fixed_tif_path, "grouped": grouped_tif_path},
+        WTD_2000_TIF,
+        WTD_2025_TIF,
+        bin_edges=CBAR_BOUNDARIES,
+        factor=WTD_TO_CM_FACTOR,
+        class_nodata=GROUPED_NODATA
+    )
 
-# ============================================================
-# BUILD GROUPED LAND-COVER ONLY FOR BOUNDARY AREA
-# ============================================================
+    if SAVE_CLASS_SUMMARY_CSV:
+        write_crosstab_csv(
+            CLASS_SUMMARY_CSV,
+            wtd_change_tables,
+            class_names={
+                "original": {k: v[0] for k, v in ORIGINAL_CLASSES.items()},
+                "grouped": GROUPED_NAMES,
+            }
+        )
 
-grouped_landcover = np.full(landcover_fixed.shape, GROUPED_NODATA, dtype=np.uint8)
-grouped_landcover[inside_boundary] = build_grouped_landcover(landcover_fixed)[inside_boundary]
+    grouped_landcover, _, _, _, _, _ = read_raster(grouped_tif_path)
+    landcover_fixed, _, _, _, _, _ = read_raster(fixed_tif_path)
 
-if SAVE_GROUPED_TIF:
-    grouped_profile = lc_profile.copy()
-    grouped_profile.update(
-        dtype=rasterio.uint8,
-        nodata=GROUPED_NODATA,
-        count=1,
-        compress="lzw"
-    )
-    with rasterio.open(GROUPED_TIF, "w", **grouped_profile) as dst:
-        dst.write(grouped_landcover, 1)
+# every pixel inside the boundary gets a group 1..3
+inside_boundary = grouped_landcover != GROUPED_NODATA
 
 # ============================================================
 # READ WTD MAPS
 # ============================================================
 
+trace.begin("WTD maps")
 wtd_2000, _, wtd2000_transform, wtd2000_crs, _, wtd2000_nodata = read_raster(WTD_2000_TIF)
 wtd_2025, _, wtd2025_transform, wtd2025_crs, _, wtd2025_nodata = read_raster(WTD_2025_TIF)
 
@@ -379,24 +392,24 @@ if wtd2000_nodata is not None:
 if wtd2025_nodata is not None:
     wtd_2025[wtd_2025 == wtd2025_nodata] = np.nan
 
-if (wtd2000_crs != lc_crs) or (wtd2000_transform != lc_transform) or (wtd_2000.shape != landcover.shape):
+if (wtd2000_crs != lc_crs) or (wtd2000_transform != lc_transform) or (wtd_2000.shape != grouped_landcover.shape):
     wtd_2000 = reproject_to_match(
         src_array=wtd_2000,
         src_transform=wtd2000_transform,
         src_crs=wtd2000_crs,
-        dst_shape=landcover.shape,
+        dst_shape=grouped_landcover.shape,
         dst_transform=lc_transform,
         dst_crs=lc_crs,
         src_nodata=np.nan,
         dst_nodata=np.nan
     )
 
-if (wtd2025_crs != lc_crs) or (wtd2025_transform != lc_transform) or (wtd_2025.shape != landcover.shape):
+if (wtd2025_crs != lc_crs) or (wtd2025_transform != lc_transform) or (wtd_2025.shape != grouped_landcover.shape):
     wtd_2025 = reproject_to_match(
         src_array=wtd_2025,
         src_transform=wtd2025_transform,
         src_crs=wtd2025_crs,
-        dst_shape=landcover.shape,
+        dst_shape=grouped_landcover.shape,
         dst_transform=lc_transform,
         dst_crs=lc_crs,
         src_nodata=np.nan,
@@ -415,10 +428,9 @@ if SAVE_DIFF_TIF:
     diff_profile.update(
         dtype=rasterio.float32,
         nodata=np.nan,
-        count=1,
-        compress="lzw"
+        count=1
     )
-    with rasterio.open(DIFF_TIF, "w", **diff_profile) as dst:
+    with open_cog(DIFF_TIF, diff_profile) as dst:
         dst.write(wtd_diff_cm.astype(np.float32), 1)
 
 # ============================================================
@@ -482,6 +494,7 @@ xs, ys = build_systematic_points(
 # PLOT FIGURE
 # ============================================================
 
+trace.begin("rendering")
 fig, axes = plt.subplots(2, 2, figsize=(FIG_WIDTH, FIG_HEIGHT))
 extent = plotting_extent(landcover_fixed, lc_transform)
 
@@ -655,6 +668,8 @@ plt.tight_layout()
 plt.savefig(FIG_PNG, dpi=FIG_DPI, bbox_inches="tight")
 plt.savefig(FIG_PDF, dpi=FIG_DPI, bbox_inches="tight")
 
+trace.finish(TRACE_DIR, chrome=TRACE_CHROME)
+
 if SHOW_PLOT:
     plt.show()
 else:
@@ -674,6 +689,17 @@ if SAVE_GROUPED_TIF:
 if SAVE_DIFF_TIF:
     print(f"WTD difference TIFF saved to: {DIFF_TIF}")
 
+if SAVE_CLASS_SUMMARY_CSV:
+    print(f"Per-class WTD change summary saved to: {CLASS_SUMMARY_CSV}")
+
+print("\nWTD change by grouped class (cm):")
+for row in wtd_change_tables["grouped"].rows(GROUPED_NAMES):
+    print(
+        f"{row['class']} = {row['name']}: n={row['count']}, "
+        f"mean={row['mean']:.2f}, std={row['std']:.2f}, "
+        f"decline={row['frac_neg']:.1%}, rise={row['frac_pos']:.1%}"
+    )
+
 print("\nLand-cover fixing rules:")
 print("1) Inside boundary, land-cover value 0 -> 4")
 print("2) Inside boundary, land-cover nodata -> 4")
@@ -0,0 +1,6 @@
+"""
+Shared helpers for the scripts in "Analyse output".
+
+The scripts are run directly from this folder (python "IQR.py", ...), so
+the package is importable without installation.
+"""
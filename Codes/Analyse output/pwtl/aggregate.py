@@ -0,0 +1,197 @@
+"""
+Area-weighted aggregation of a fine raster onto a coarser grid.
+
+Used to move the 30-arc-second WTDA mean onto the 0.5 deg GRACE grid, but
+works for any fine -> coarse comparison in the same CRS:
+
+- grids that nest exactly (integer factor, aligned origins) use a strided
+  reshape-mean, weighted by cell area on geographic grids;
+- grids that do not nest use a sparse overlap matrix per axis (cached),
+  so each coarse cell is the overlap- and area-weighted mean of the fine
+  cells it covers.
+
+NaN source cells are ignored. Both paths run over row strips, so the
+temporary arrays stay at strip size.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+from scipy import sparse
+from rasterio.crs import CRS
+from rasterio.enums import Resampling
+from rasterio.warp import reproject
+
+
+def _is_geographic(crs):
+    if crs is None:
+        return True
+    return CRS.from_user_input(crs).is_geographic
+
+
+def row_area_weights(transform, height, geographic=True):
+    """Relative cell area per row (sin(lat_top) - sin(lat_bottom) on lat/lon grids)."""
+    if not geographic:
+        return np.ones(height, dtype="float64")
+    top = transform.f + np.arange(height) * transform.e
+    bottom = top + transform.e
+    top = np.clip(top, -90.0, 90.0)
+    bottom = np.clip(bottom, -90.0, 90.0)
+    return np.abs(np.sin(np.radians(top)) - np.sin(np.radians(bottom)))
+
+
+def nesting_offsets(src_transform, dst_transform, tol=1e-6):
+    """
+    (row_off, col_off, fy, fx) when every destination cell is exactly fy x fx
+    source cells starting at integer offset (row_off, col_off); else None.
+    """
+    if src_transform.b != 0 or src_transform.d != 0 or dst_transform.b != 0 or dst_transform.d != 0:
+        return None
+    vals = (
+        (dst_transform.f - src_transform.f) / src_transform.e,
+        (dst_transform.c - src_transform.c) / src_transform.a,
+        dst_transform.e / src_transform.e,
+        dst_transform.a / src_transform.a,
+    )
+    rounded = [int(round(v)) for v in vals]
+    if any(abs(v - r) > tol * max(1.0, abs(v)) for v, r in zip(vals, rounded)):
+        return None
+    if rounded[2] < 1 or rounded[3] < 1:
+        return None
+    return tuple(rounded)
+
+
+@lru_cache(maxsize=32)
+def _overlap_matrix_1d(src_origin, src_step, src_n, dst_origin, dst_step, dst_n):
+    """
+    Sparse (dst_n x src_n) matrix of overlap lengths between source and
+    destination cells along one axis. Steps may be negative (north-up rows).
+    """
+    sign = 1.0 if src_step > 0 else -1.0
+    src_edges = sign * (src_origin + np.arange(src_n + 1) * src_step)
+    dst_edges = sign * (dst_origin + np.arange(dst_n + 1) * dst_step)
+
+    rows, cols, vals = [], [], []
+    for i in range(dst_n):
+        lo, hi = sorted((dst_edges[i], dst_edges[i + 1]))
+        j0 = max(0, int(np.searchsorted(src_edges, lo, side="right")) - 1)
+        j1 = min(src_n, int(np.searchsorted(src_edges, hi, side="left")))
+        if j1 <= j0:
+            continue
+        j = np.arange(j0, j1)
+        ov = np.minimum(src_edges[j + 1], hi) - np.maximum(src_edges[j], lo)
+        keep = ov > 0
+        rows.append(np.full(int(keep.sum()), i))
+        cols.append(j[keep])
+        vals.append(ov[keep])
+
+    if rows:
+        rows, cols, vals = np.concatenate(rows), np.concatenate(cols), np.concatenate(vals)
+    m = sparse.csr_matrix((vals, (rows, cols)), shape=(dst_n, src_n), dtype="float64")
+    m.sum_duplicates()
+    return m
+
+
+def overlap_matrices(src_transform, src_shape, dst_transform, dst_shape):
+    wy = _overlap_matrix_1d(float(src_transform.f), float(src_transform.e), int(src_shape[0]),
+                            float(dst_transform.f), float(dst_transform.e), int(dst_shape[0]))
+    wx = _overlap_matrix_1d(float(src_transform.c), float(src_transform.a), int(src_shape[1]),
+                            float(dst_transform.c), float(dst_transform.a), int(dst_shape[1]))
+    return wy, wx
+
+
+def _block_mean_nested(src, dst_shape, offsets, row_w, min_valid_frac, strip_rows):
+    row_off, col_off, fy, fx = offsets
+    H, W = dst_shape
+    sh, sw = src.shape
+    out = np.full(dst_shape, np.nan, dtype="float32")
+
+    strip = max(1, strip_rows // fy)
+    for i0 in range(0, H, strip):
+        i1 = min(H, i0 + strip)
+        # source rows/cols covered by destination rows i0..i1, NaN-padded at the edges
+        r0 = row_off + i0 * fy
+        block = np.full(((i1 - i0) * fy, W * fx), np.nan, dtype="float32")
+        rs0, rs1 = max(r0, 0), min(r0 + block.shape[0], sh)
+        cs0, cs1 = max(col_off, 0), min(col_off + W * fx, sw)
+        if rs1 > rs0 and cs1 > cs0:
+            block[rs0 - r0:rs1 - r0, cs0 - col_off:cs1 - col_off] = src[rs0:rs1, cs0:cs1]
+
+        w = np.zeros(block.shape[0], dtype="float32")
+        if rs1 > rs0:
+            w[rs0 - r0:rs1 - r0] = row_w[rs0:rs1]
+        w = w.reshape(i1 - i0, fy, 1, 1)
+
+        b = block.reshape(i1 - i0, fy, W, fx)
+        valid = np.isfinite(b)
+        num = (np.where(valid, b, 0.0) * w).sum(axis=(1, 3))
+        den = (valid * w).sum(axis=(1, 3))
+        tot = w.sum(axis=(1, 3)) * fx
+
+        ok = den > 0
+        if min_valid_frac > 0:
+            ok &= den >= min_valid_frac * tot
+        res = np.full(num.shape, np.nan, dtype="float32")
+        res[ok] = (num[ok] / den[ok]).astype("float32")
+        out[i0:i1] = res
+    return out
+
+
+def _overlap_mean(src, src_transform, dst_shape, dst_transform, row_w, min_valid_frac, strip_rows):
+    wy, wx = overlap_matrices(src_transform, src.shape, dst_transform, dst_shape)
+    wy = wy.multiply(row_w[np.newaxis, :]).tocsc()
+
+    num = np.zeros(dst_shape, dtype="float64")
+    den = np.zeros(dst_shape, dtype="float64")
+    for r0 in range(0, src.shape[0], strip_rows):
+        r1 = min(src.shape[0], r0 + strip_rows)
+        wy_s = wy[:, r0:r1]
+        if wy_s.nnz == 0:
+            continue
+        a = np.asarray(src[r0:r1], dtype="float32")
+        valid = np.isfinite(a)
+        # (dst_h x strip) @ (strip x src_w) @ (src_w x dst_w)
+        num += wy_s @ (wx @ np.where(valid, a, 0.0).T).T
+        den += wy_s @ (wx @ valid.astype("float32").T).T
+
+    out = np.full(dst_shape, np.nan, dtype="float32")
+    ok = den > 0
+    if min_valid_frac > 0:
+        tot = np.outer(np.asarray(wy.sum(axis=1)).ravel(), np.asarray(wx.sum(axis=1)).ravel())
+        ok &= den >= min_valid_frac * tot
+    out[ok] = (num[ok] / den[ok]).astype("float32")
+    return out
+
+
+def aggregate_to_grid(src, src_transform, dst_shape, dst_transform,
+                      src_crs="EPSG:4326", dst_crs=None,
+                      area_weighted=True, min_valid_frac=0.0, strip_rows=256):
+    """
+    Mean of the fine `src` cells inside each destination cell (NaN ignored).
+
+    area_weighted  : weight source rows by cell area on geographic grids
+    min_valid_frac : minimum valid (weighted) fraction of a destination cell,
+                     below which the result is NaN
+    Different CRSs fall back to rasterio's Resampling.average.
+    """
+    dst_shape = tuple(int(v) for v in dst_shape)
+
+    if (src_crs is not None and dst_crs is not None
+            and CRS.from_user_input(dst_crs) != CRS.from_user_input(src_crs)):
+        out = np.full(dst_shape, np.nan, dtype="float32")
+        reproject(
+            source=np.asarray(src, dtype="float32"), destination=out,
+            src_transform=src_transform, src_crs=src_crs,
+            dst_transform=dst_transform, dst_crs=dst_crs,
+            src_nodata=np.nan, dst_nodata=np.nan,
+            resampling=Resampling.average
+        )
+        return out
+
+    geographic = area_weighted and _is_geographic(src_crs)
+    row_w = row_area_weights(src_transform, src.shape[0], geographic)
+
+    offsets = nesting_offsets(src_transform, dst_transform)
+    if offsets is not None:
+        return _block_mean_nested(src, dst_shape, offsets, row_w, min_valid_frac, strip_rows)
+    return _overlap_mean(src, src_transform, dst_shape, dst_transform, row_w, min_valid_frac, strip_rows)
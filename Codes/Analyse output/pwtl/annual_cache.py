@@ -0,0 +1,111 @@
+"""
+Annual-mean layer shared by the TWSA-WTDA agreement scripts.
+
+Each year's mean is computed once from its monthly/annual layers and kept,
+either in memory or as a .npy file in a cache folder (opened memory-mapped
+on later use). Baseline and anomaly means are then derived from the cached
+annual means instead of re-reading and re-cropping the inputs.
+"""
+
+import os
+import hashlib
+
+import numpy as np
+
+
+def nanmean_update(sum_arr, count_arr, new_arr):
+    valid = np.isfinite(new_arr)
+    sum_arr[valid] += new_arr[valid]
+    count_arr[valid] += 1
+
+
+def finalize_mean(sum_arr, count_arr):
+    out = np.full(sum_arr.shape, np.nan, dtype="float32")
+    mask = count_arr > 0
+    out[mask] = sum_arr[mask] / count_arr[mask]
+    return out
+
+
+def source_signature(paths, *extra):
+    """
+    Short hash of the input files (path, size, mtime) plus any extra settings
+    (crop window, unit factor, ...). Changes whenever an input is replaced.
+    """
+    h = hashlib.sha1()
+    for p in paths:
+        st = os.stat(p)
+        h.update(f"{os.path.abspath(p)}|{st.st_size}|{int(st.st_mtime)}\n".encode())
+    for e in extra:
+        h.update(f"{e!r}\n".encode())
+    return h.hexdigest()[:16]
+
+
+class AnnualMeanCache:
+    """
+    shape     : 2D shape of every annual layer
+    cache_dir : folder for .npy files; None keeps everything in memory
+    tag       : filename prefix, e.g. "wtda" or "twsa"
+    """
+
+    def __init__(self, shape, cache_dir=None, tag="annual"):
+        self.shape = tuple(shape)
+        self.cache_dir = cache_dir
+        self.tag = tag
+        self._means = {}
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _disk_path(self, year, signature):
+        if not self.cache_dir:
+            return None
+        sig = f"_{signature}" if signature else ""
+        return os.path.join(self.cache_dir, f"{self.tag}_{year}{sig}.npy")
+
+    def get(self, year, load_layers, signature=None):
+        """
+        Annual mean for `year`. `load_layers` is a callable returning an
+        iterable of 2D float arrays (the layers averaged into that year); it is
+        only called when the year is neither in memory nor on disk.
+        """
+        if year in self._means:
+            return self._means[year]
+
+        path = self._disk_path(year, signature)
+        if path is not None and os.path.exists(path):
+            mean = np.load(path, mmap_mode="r")
+            if mean.shape != self.shape:
+                raise RuntimeError(f"Cached annual mean has shape {mean.shape}, expected {self.shape}: {path}")
+        else:
+            y_sum = np.zeros(self.shape, dtype="float32")
+            y_count = np.zeros(self.shape, dtype="int32")
+            for arr in load_layers():
+                nanmean_update(y_sum, y_count, arr)
+            mean = finalize_mean(y_sum, y_count)
+            del y_sum, y_count
+
+            if path is not None:
+                tmp = path + ".tmp.npy"
+                np.save(tmp, mean)
+                os.replace(tmp, path)
+                mean = np.load(path, mmap_mode="r")
+
+        self._means[year] = mean
+        return mean
+
+    def years(self):
+        return sorted(self._means.keys())
+
+    def baseline(self, years):
+        b_sum = np.zeros(self.shape, dtype="float32")
+        b_count = np.zeros(self.shape, dtype="int32")
+        for y in years:
+            nanmean_update(b_sum, b_count, np.asarray(self._means[y], dtype="float32"))
+        return finalize_mean(b_sum, b_count)
+
+    def mean_anomaly(self, years, baseline):
+        a_sum = np.zeros(self.shape, dtype="float32")
+        a_count = np.zeros(self.shape, dtype="int32")
+        for y in years:
+            anom = np.asarray(self._means[y], dtype="float32") - baseline
+            nanmean_update(a_sum, a_count, anom)
+        return finalize_mean(a_sum, a_count)
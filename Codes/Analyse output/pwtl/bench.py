@@ -0,0 +1,138 @@
+"""
+Small timing harness for the analysis hot paths.
+
+Most scripts here do their work at module level or create output folders
+on import, so benchmarks cannot simply import them. load_script_functions()
+parses a script, and executes only its imports, the requested functions
+and the top-level functions/constants those depend on, so the benchmark
+times the code as it is in the script, not a copy of it.
+"""
+
+import ast
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+
+def _names_used(node):
+    return {n.id for n in ast.walk(node) if isinstance(n, ast.Name)}
+
+
+def _bound_names(imp):
+    return {(a.asname or a.name).split(".")[0] for a in imp.names}
+
+
+def load_script_functions(script_path, names):
+    """
+    Return {name: function} for `names` defined at top level of script_path.
+    Imports those functions need and that fail raise ImportError (the caller
+    decides to skip).
+    """
+    with open(script_path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=script_path)
+
+    imports, defs = [], {}
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            imports.append(node)
+        elif isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            defs[node.name] = node
+        elif isinstance(node, ast.Assign) and all(isinstance(t, ast.Name) for t in node.targets):
+            for t in node.targets:
+                defs[t.id] = node
+
+    missing = [n for n in names if n not in defs]
+    if missing:
+        raise KeyError(f"{os.path.basename(script_path)} does not define: {', '.join(missing)}")
+
+    # transitive closure over top-level names the requested functions use
+    needed, todo = set(), list(names)
+    while todo:
+        name = todo.pop()
+        if name in needed:
+            continue
+        needed.add(name)
+        todo.extend(n for n in _names_used(defs[name]) if n in defs and n not in needed)
+
+    used = set().union(*(_names_used(defs[n]) for n in needed))
+    wanted = {id(defs[n]) for n in needed}
+    # only imports the selected code needs (a script may import e.g. grass at top level)
+    body = [node for node in tree.body
+            if id(node) in wanted or (node in imports and _bound_names(node) & used)]
+    module = ast.Module(body=body, type_ignores=[])
+    ns = {"__name__": "bench_" + os.path.splitext(os.path.basename(script_path))[0].replace(" ", "_"),
+          "__file__": script_path}
+    exec(compile(module, script_path, "exec"), ns)
+    return {n: ns[n] for n in names}
+
+
+def time_call(fn, repeat=3, setup=None):
+    """
+    Run fn() `repeat` times (setup() before each run, untimed; its return
+    value is passed to fn when not None). Returns wall-time stats in seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        arg = setup() if setup is not None else None
+        t0 = time.perf_counter()
+        fn(arg) if arg is not None else fn()
+        times.append(time.perf_counter() - t0)
+    return {
+        "repeat": repeat,
+        "min_s": min(times),
+        "median_s": statistics.median(times),
+        "mean_s": statistics.fmean(times),
+        "times_s": times,
+    }
+
+
+def evict_page_cache(paths):
+    """
+    Ask the OS to drop cached pages of `paths`, so the next read comes from
+    the drive (cold-cache timing). No-op where posix_fadvise is unavailable.
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    for p in paths:
+        fd = os.open(p, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    return True
+
+
+def environment():
+    import numpy as np
+    info = {
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+    try:
+        import rasterio
+        info["rasterio"] = rasterio.__version__
+        info["gdal"] = rasterio.__gdal_version__
+    except ImportError:
+        pass
+    return info
+
+
+def write_results(path, config, results):
+    doc = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment(),
+        "config": config,
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(doc, f, indent=2)
+    os.replace(tmp, path)
+    return doc
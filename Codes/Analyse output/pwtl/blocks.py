@@ -0,0 +1,95 @@
+"""
+Block size from a memory budget.
+
+The windowed passes hold, per pixel of the current window, a fixed number
+of time steps and accumulators (12-month deques, stacks, Welford state,
+temporaries), plus some full-grid arrays (baseline mean/std). Given those
+terms and a budget such as "8G", auto_block_size() returns the largest
+square window that fits, rounded down to a multiple of the GeoTIFF's
+internal block shape so every window covers whole tiles and no tile is
+decoded twice.
+"""
+
+import math
+import re
+
+import numpy as np
+
+_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+
+def parse_memory(text):
+    """'8G', '512M', '2.5GB', '1073741824' -> bytes."""
+    m = re.fullmatch(r"\s*([0-9]*\.?[0-9]+)\s*([KMGT]?)I?B?\s*", str(text).upper())
+    if not m:
+        raise ValueError(f"Cannot parse memory size: {text!r} (use e.g. 8G, 512M)")
+    return int(float(m.group(1)) * _UNITS[m.group(2)])
+
+
+def bytes_per_pixel(terms):
+    """terms: iterable of (count, dtype), e.g. [(12, "float32"), (1, "int32")]."""
+    return sum(int(n) * np.dtype(dt).itemsize for n, dt in terms)
+
+
+def raster_block_shape(path, band=1):
+    """Internal (rows, cols) block of a GeoTIFF band; (1, width) style for striped files."""
+    import rasterio
+    with rasterio.open(path) as src:
+        return tuple(src.block_shapes[band - 1])
+
+
+def _lcm(a, b):
+    return a * b // math.gcd(a, b)
+
+
+def block_alignment(block_shape, width, multiple=8):
+    """
+    Step the window side must be a multiple of: the tile rows and cols for
+    tiled files; only the strip height for striped files (a strip spans the
+    full width, so square windows cannot align to it column-wise).
+    """
+    bh, bw = (int(v) for v in block_shape)
+    align = _lcm(bh, multiple)
+    if bw < width:
+        align = _lcm(align, bw)
+    return align
+
+
+def auto_block_size(max_bytes, window_terms, grid_terms=(), shape=None,
+                    block_shape=(1, 1), multiple=8, max_block=None):
+    """
+    Largest square window side whose working set fits in `max_bytes`.
+
+    window_terms: (count, dtype) held per window pixel
+    grid_terms:   (count, dtype) held per pixel of the whole (H, W) grid
+    shape:        (H, W) of the grid
+    """
+    height, width = shape
+    fixed = bytes_per_pixel(grid_terms) * height * width
+    per_px = bytes_per_pixel(window_terms)
+    align = block_alignment(block_shape, width, multiple)
+
+    avail = max_bytes - fixed
+    side = int(math.sqrt(avail / per_px)) if avail > 0 else 0
+    side = (side // align) * align
+    if side < align:
+        need = fixed + per_px * align * align
+        raise RuntimeError(
+            f"Memory budget {max_bytes / 1024 ** 3:.2f} GiB is too small: full-grid arrays need "
+            f"{fixed / 1024 ** 3:.2f} GiB and one {align}x{align} window needs "
+            f"{per_px * align * align / 1024 ** 2:.0f} MiB (total {need / 1024 ** 3:.2f} GiB)."
+        )
+
+    # no point in windows larger than the grid
+    cap = -(-max(height, width) // align) * align
+    if max_block:
+        cap = min(cap, max(align, (int(max_block) // align) * align))
+    return min(side, cap)
+
+
+def describe_budget(side, max_bytes, window_terms, grid_terms=(), shape=None):
+    height, width = shape
+    fixed = bytes_per_pixel(grid_terms) * height * width
+    win = bytes_per_pixel(window_terms) * side * side
+    return (f"block {side}x{side}: ~{(fixed + win) / 1024 ** 3:.2f} GiB of {max_bytes / 1024 ** 3:.2f} GiB "
+            f"(grid arrays {fixed / 1024 ** 3:.2f} GiB, window {win / 1024 ** 2:.0f} MiB)")
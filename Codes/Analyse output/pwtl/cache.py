@@ -0,0 +1,87 @@
+"""
+Memory-budgeted LRU cache for decoded rasters, masks and reprojected
+geometries, shared by all panels of a figure.
+
+Keys are plain tuples built by the caller, typically
+("raster", path) or ("reprojected", path, grid_key(...)), so a year map
+that appears in two panels is read, nodata-masked and warped only once.
+Cached arrays are made read-only; callers must copy before editing.
+"""
+
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+
+def nbytes_of(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(nbytes_of(v) for v in value)
+    if hasattr(value, "memory_usage"):
+        try:
+            return int(value.memory_usage(deep=True).sum())
+        except Exception:
+            return 0
+    return 0
+
+
+def _freeze(value):
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, (tuple, list)):
+        for v in value:
+            _freeze(v)
+    return value
+
+
+def grid_key(shape, transform, crs):
+    """Hashable description of a target grid."""
+    return (
+        tuple(int(n) for n in shape),
+        tuple(round(float(v), 12) for v in tuple(transform)[:6]),
+        crs.to_string() if crs is not None else None,
+    )
+
+
+def path_key(path):
+    """Absolute path plus size/mtime, so an overwritten file is not served stale."""
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+
+class LRUCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = int(max_bytes)
+        self._items = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, loader):
+        if key in self._items:
+            self._items.move_to_end(key)
+            self.hits += 1
+            return self._items[key][0]
+
+        self.misses += 1
+        value = _freeze(loader())
+        size = nbytes_of(value)
+        self._items[key] = (value, size)
+        self.current_bytes += size
+
+        # always keep the newest entry, even if it alone exceeds the budget
+        while self.current_bytes > self.max_bytes and len(self._items) > 1:
+            _, (_, old_size) = self._items.popitem(last=False)
+            self.current_bytes -= old_size
+
+        return value
+
+    def clear(self):
+        self._items.clear()
+        self.current_bytes = 0
+
+    def summary(self):
+        return (f"cache: {self.hits} hits, {self.misses} misses, "
+                f"{len(self._items)} entries, {self.current_bytes / 1024 ** 2:.0f} MB held")
@@ -0,0 +1,160 @@
+"""
+Checkpoint / resume for long multi-pass runs.
+
+The passes keep their accumulators (Welford mean/M2/count, rolling buffers,
+correlation sums) in memory for hours; a crash or a disconnected drive used
+to mean starting over. A Checkpoint periodically writes them, plus the
+position reached (stage, next window / month), to one .npz and a small JSON:
+
+    ckpt = Checkpoint(CHECKPOINT_DIR, "IQR_WB12Z", input_signature(paths, BLOCK_SIZE, ...))
+    resume = ckpt.load() if args.resume else None      # None: start from scratch
+    ...
+    if ckpt.due():
+        ckpt.save("baseline", {"mean": mean, "m2": m2}, next_window=i + 1)
+    ...
+    ckpt.clear()                                       # run finished
+
+The JSON records a signature of the inputs (path, size, mtime of every
+file, plus the settings that shape the accumulators) and the SHA-1 of the
+.npz. load() ignores a checkpoint whose inputs or settings changed (stale)
+or whose data file does not match its checksum (partial write).
+Each save writes the arrays to a new generation file (<name>.ckpt.<n>.npz)
+that the JSON names, then replaces the JSON atomically, and only then
+removes the previous generation. An interrupted save therefore leaves the
+previous checkpoint (JSON and the npz it names) intact.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from pwtl.annual_cache import source_signature
+
+CHECKPOINT_INTERVAL_S = 600
+
+
+def input_signature(paths, *settings):
+    """Signature of the input files (path, size, mtime) and the run settings."""
+    return source_signature(sorted(paths), *settings)
+
+
+def _sha1_file(path, chunk=1 << 24):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class Resume:
+    """What Checkpoint.load() hands back: stage, position metadata and arrays."""
+
+    def __init__(self, stage, meta, arrays):
+        self.stage = stage
+        self.meta = meta
+        self.arrays = arrays
+
+    def __repr__(self):
+        pos = ", ".join(f"{k}={v}" for k, v in self.meta.items() if not isinstance(v, (list, dict)))
+        return f"stage {self.stage!r} ({pos})"
+
+
+class Checkpoint:
+    def __init__(self, ckpt_dir, name, signature, interval_s=CHECKPOINT_INTERVAL_S):
+        self.ckpt_dir = ckpt_dir
+        self.name = name
+        self.signature = signature
+        self.interval_s = interval_s
+        self.json_path = os.path.join(ckpt_dir, f"{name}.ckpt.json")
+        # current generation of the arrays, named in the JSON
+        self.npz_path = None
+        self._gen = 0
+        self._last_save = time.monotonic()
+        self._npz_sha1 = None
+        os.makedirs(ckpt_dir, exist_ok=True)
+
+    def file(self, filename):
+        """Path for side files (sketches, ...) that belong to this checkpoint."""
+        return os.path.join(self.ckpt_dir, f"{self.name}.{filename}")
+
+    def _new_npz_path(self):
+        while True:
+            self._gen += 1
+            path = os.path.join(self.ckpt_dir, f"{self.name}.ckpt.{self._gen}.npz")
+            if not os.path.exists(path):
+                return path
+
+    def due(self):
+        return time.monotonic() - self._last_save >= self.interval_s
+
+    def save(self, stage, arrays=None, **meta):
+        """
+        Record `stage` and position `meta` (JSON-able). arrays=None keeps the
+        arrays of the previous save (e.g. only the list of finished years moved on).
+        """
+        t0 = time.perf_counter()
+        old_npz = self.npz_path
+        if arrays is not None:
+            # a new file: the one the current JSON names stays valid until the JSON moves on
+            new_npz = self._new_npz_path()
+            tmp = new_npz + ".tmp.npz"
+            np.savez(tmp, **{k: np.asarray(v) for k, v in arrays.items()})
+            sha1 = _sha1_file(tmp)
+            os.replace(tmp, new_npz)
+        else:
+            new_npz, sha1 = old_npz, self._npz_sha1
+
+        doc = {
+            "name": self.name,
+            "stage": stage,
+            "signature": self.signature,
+            "npz": os.path.basename(new_npz) if new_npz else None,
+            "npz_sha1": sha1,
+            "saved": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "meta": meta,
+        }
+        tmp = self.json_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(doc, f, indent=2)
+        os.replace(tmp, self.json_path)
+        self.npz_path, self._npz_sha1 = new_npz, sha1
+        if old_npz and old_npz != new_npz and os.path.exists(old_npz):
+            os.remove(old_npz)
+        self._last_save = time.monotonic()
+        print(f"  checkpoint: {stage} ({time.perf_counter() - t0:.1f} s)")
+
+    def load(self):
+        """The saved Resume, or None when there is none or it cannot be used."""
+        if not os.path.exists(self.json_path):
+            print(f"No checkpoint for {self.name} in {self.ckpt_dir}; starting from scratch.")
+            return None
+        with open(self.json_path) as f:
+            doc = json.load(f)
+
+        if doc.get("signature") != self.signature:
+            print(f"Checkpoint for {self.name} is stale (inputs or settings changed); starting from scratch.")
+            return None
+
+        arrays = {}
+        if doc.get("npz_sha1"):
+            npz_path = os.path.join(self.ckpt_dir, doc.get("npz") or f"{self.name}.ckpt.npz")
+            if not os.path.exists(npz_path) or _sha1_file(npz_path) != doc["npz_sha1"]:
+                print(f"Checkpoint data for {self.name} is missing or corrupt; starting from scratch.")
+                return None
+            with np.load(npz_path) as z:
+                arrays = {k: z[k] for k in z.files}
+            self.npz_path, self._npz_sha1 = npz_path, doc["npz_sha1"]
+
+        resume = Resume(doc["stage"], doc.get("meta", {}), arrays)
+        print(f"Resuming {self.name} from {resume} saved {doc.get('saved')}")
+        return resume
+
+    def clear(self):
+        for fn in os.listdir(self.ckpt_dir):
+            if fn.startswith(f"{self.name}."):
+                os.remove(os.path.join(self.ckpt_dir, fn))
+        self.npz_path = None
+        self._npz_sha1 = None
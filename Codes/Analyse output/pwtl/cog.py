@@ -0,0 +1,157 @@
+"""
+Cloud-Optimized GeoTIFF writer profile and re-tiling.
+
+Windowed reads of striped or untiled GeoTIFFs decode whole strips, and the
+outputs had no overviews, so every zoomed-out figure read full resolution.
+All GeoTIFF outputs go through here instead:
+
+  cog_profile(profile)     - tiled 512x512, deflate + predictor, NUM_THREADS
+  open_cog(path, profile)  - write window by window into a tiled GTiff; on
+                             close it is rewritten as a COG with overviews
+  convert_to_cog(src, dst) - re-tile an existing GeoTIFF (e.g. the monthly
+                             N_America_YYYYMM_*.tif inputs)
+
+GDAL's COG driver only supports CreateCopy, hence the write-then-copy. With
+GDAL < 3.1 (no COG driver) the same layout is produced with GTiff
+COPY_SRC_OVERVIEWS=YES.
+"""
+
+import os
+from contextlib import contextmanager
+
+import numpy as np
+import rasterio
+import rasterio.shutil
+from rasterio.enums import Resampling
+from rasterio.env import GDALVersion
+
+COG_BLOCK = 512
+COG_COMPRESS = "deflate"
+COG_NUM_THREADS = "ALL_CPUS"
+
+
+def default_predictor(dtype):
+    # 3 = floating-point predictor, 2 = horizontal differencing
+    return 3 if np.dtype(dtype).kind == "f" else 2
+
+
+def cog_profile(profile, block=COG_BLOCK, compress=COG_COMPRESS, predictor=None,
+                num_threads=COG_NUM_THREADS, interleave=None, **updates):
+    """
+    Copy of a rasterio profile set up for tiled, compressed writing.
+    predictor=None picks 3 for floats, 2 for integers; pass 1 for
+    categorical rasters (class maps gain nothing from differencing).
+    Half-float (nbits=16, see pwtl.storage) rasters are written without one.
+    interleave="band" stores each band in its own tiles, so reading one band
+    of a multi-band stack does not decompress all of them (GDAL's default
+    for multi-band is "pixel").
+    """
+    out = dict(profile)
+    out.update(updates)
+    if out.get("nbits"):
+        predictor = 1
+    out.update(
+        driver="GTiff", tiled=True, blockxsize=block, blockysize=block,
+        compress=compress, predictor=predictor or default_predictor(out["dtype"]),
+        num_threads=num_threads, BIGTIFF="IF_SAFER",
+    )
+    out.pop("interleave", None)
+    if interleave:
+        out["interleave"] = interleave
+    return out
+
+
+def overview_factors(width, height, block=COG_BLOCK):
+    """2, 4, 8, ... until the coarsest level fits in one block."""
+    factors, f = [], 2
+    while max(width, height) / f >= block / 2:
+        factors.append(f)
+        f *= 2
+    return factors
+
+
+def _has_cog_driver():
+    return GDALVersion.runtime().at_least("3.1")
+
+
+def _copy_as_cog(src_path, dst_path, block, compress, predictor, resampling, num_threads, nbits=None,
+                 interleave=None):
+    tmp = dst_path + ".cog.tmp.tif"
+    # the COG driver has no NBITS option, so half floats take the GTiff route;
+    # it only takes INTERLEAVE=BAND from GDAL 3.11 on
+    band = interleave is not None and interleave.lower() == "band"
+    extra = {"NBITS": str(nbits)} if nbits else {}
+    if band:
+        extra["INTERLEAVE"] = "BAND"
+    if _has_cog_driver() and not nbits and (not band or GDALVersion.runtime().at_least("3.11")):
+        rasterio.shutil.copy(
+            src_path, tmp, driver="COG",
+            BLOCKSIZE=block, COMPRESS=compress.upper(), PREDICTOR=str(predictor),
+            OVERVIEW_RESAMPLING=resampling.name.upper(), NUM_THREADS=num_threads,
+            BIGTIFF="IF_SAFER", **extra
+        )
+    else:
+        with rasterio.open(src_path, "r+") as src:
+            src.build_overviews(overview_factors(src.width, src.height, block), resampling)
+        rasterio.shutil.copy(
+            src_path, tmp, driver="GTiff",
+            TILED="YES", BLOCKXSIZE=block, BLOCKYSIZE=block, COMPRESS=compress.upper(),
+            PREDICTOR=str(predictor), COPY_SRC_OVERVIEWS="YES", NUM_THREADS=num_threads,
+            BIGTIFF="IF_SAFER", **extra
+        )
+    os.replace(tmp, dst_path)
+
+
+@contextmanager
+def open_cog(path, profile, resampling=Resampling.average, **profile_kwargs):
+    """
+    `with open_cog(path, profile) as dst: dst.write(..., window=win)`.
+    Writes a tiled GTiff next to `path` and turns it into a COG at `path`
+    when the block exits without error. Use Resampling.nearest (or mode)
+    for class maps.
+    """
+    prof = cog_profile(profile, **profile_kwargs)
+    work = path + ".work.tif"
+    try:
+        with rasterio.open(work, "w", **prof) as dst:
+            yield dst
+        _copy_as_cog(work, path, prof["blockxsize"], prof["compress"], prof["predictor"],
+                     resampling, prof["num_threads"], prof.get("nbits"), prof.get("interleave"))
+    finally:
+        if os.path.exists(work):
+            os.remove(work)
+
+
+def is_cog_like(path, block=COG_BLOCK):
+    """Tiled with square blocks of at least `block`/2 and has overviews (when large enough)."""
+    with rasterio.open(path) as src:
+        bh, bw = src.block_shapes[0]
+        tiled = bh == bw and bh >= block // 2 and bw < src.width
+        needs_ovr = bool(overview_factors(src.width, src.height, block))
+        return tiled and (not needs_ovr or bool(src.overviews(1)))
+
+
+def convert_to_cog(src_path, dst_path=None, resampling=Resampling.average, block=COG_BLOCK,
+                   compress=COG_COMPRESS, predictor=None, num_threads=COG_NUM_THREADS):
+    """Re-tile `src_path` as a COG at dst_path (default: in place). Returns dst_path."""
+    dst_path = dst_path or src_path
+    if os.path.dirname(dst_path):
+        os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+    with rasterio.open(src_path) as src:
+        predictor = predictor or default_predictor(src.dtypes[0])
+
+    if _has_cog_driver():
+        _copy_as_cog(src_path, dst_path, block, compress, predictor, resampling, num_threads)
+        return dst_path
+
+    # old GDAL: tiled copy first, then overviews + COPY_SRC_OVERVIEWS
+    work = dst_path + ".work.tif"
+    try:
+        rasterio.shutil.copy(src_path, work, driver="GTiff", TILED="YES", BLOCKXSIZE=block,
+                             BLOCKYSIZE=block, COMPRESS=compress.upper(), PREDICTOR=str(predictor),
+                             NUM_THREADS=num_threads, BIGTIFF="IF_SAFER")
+        _copy_as_cog(work, dst_path, block, compress, predictor, resampling, num_threads)
+    finally:
+        if os.path.exists(work):
+            os.remove(work)
+    return dst_path
@@ -0,0 +1,158 @@
+"""
+One-pass land-cover x WTD-change cross-tabulation.
+
+Class rasters and the two WTD rasters are read in the same row-strip windows
+(WTD is warped on the fly onto the class grid when the grids differ). Every
+statistic is a bincount on the class codes, so one pass gives per-class
+count, mean, std, sign fractions and a fixed-bin histogram for all classes.
+"""
+
+import csv
+
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.vrt import WarpedVRT
+
+from pwtl.landcover import iter_row_windows, to_lut_index
+
+
+class CrossTab:
+    """Per-class running sums for values binned by uint8 class codes."""
+
+    def __init__(self, bin_edges, n_classes=256, class_nodata=0):
+        self.bin_edges = np.asarray(bin_edges, dtype=np.float64)
+        self.n_classes = int(n_classes)
+        self.class_nodata = class_nodata
+        # histogram bins: [< e0], [e0, e1), ..., [>= e_last]
+        self.n_bins = self.bin_edges.size + 1
+
+        self.count = np.zeros(self.n_classes, dtype=np.int64)
+        self.total = np.zeros(self.n_classes, dtype=np.float64)
+        self.total_sq = np.zeros(self.n_classes, dtype=np.float64)
+        self.n_neg = np.zeros(self.n_classes, dtype=np.int64)
+        self.n_pos = np.zeros(self.n_classes, dtype=np.int64)
+        self.hist = np.zeros((self.n_classes, self.n_bins), dtype=np.int64)
+
+    def update(self, classes, values):
+        valid = np.isfinite(values)
+        if self.class_nodata is not None:
+            valid &= classes != self.class_nodata
+        if not np.any(valid):
+            return
+
+        c = classes[valid].astype(np.intp)
+        v = values[valid].astype(np.float64)
+        n = self.n_classes
+
+        self.count += np.bincount(c, minlength=n)
+        self.total += np.bincount(c, weights=v, minlength=n)
+        self.total_sq += np.bincount(c, weights=v * v, minlength=n)
+        self.n_neg += np.bincount(c[v < 0], minlength=n)
+        self.n_pos += np.bincount(c[v > 0], minlength=n)
+
+        b = np.searchsorted(self.bin_edges, v, side="right")
+        flat = c * self.n_bins + b
+        self.hist += np.bincount(flat, minlength=n * self.n_bins).reshape(n, self.n_bins)
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.total_sq += other.total_sq
+        self.n_neg += other.n_neg
+        self.n_pos += other.n_pos
+        self.hist += other.hist
+        return self
+
+    def rows(self, class_names=None):
+        """Summary rows (dicts) for every class with at least one value."""
+        out = []
+        for k in np.flatnonzero(self.count):
+            n = int(self.count[k])
+            mean = self.total[k] / n
+            var = max(self.total_sq[k] / n - mean * mean, 0.0)
+            row = {
+                "class": int(k),
+                "name": (class_names or {}).get(int(k), ""),
+                "count": n,
+                "mean": float(mean),
+                "std": float(np.sqrt(var)),
+                "frac_neg": self.n_neg[k] / n,
+                "frac_zero": (n - self.n_neg[k] - self.n_pos[k]) / n,
+                "frac_pos": self.n_pos[k] / n,
+            }
+            for label, h in zip(self.bin_labels(), self.hist[k]):
+                row[label] = int(h)
+            out.append(row)
+        return out
+
+    def bin_labels(self):
+        e = [f"{x:g}" for x in self.bin_edges]
+        return [f"hist_lt_{e[0]}"] + [f"hist_{a}_{b}" for a, b in zip(e[:-1], e[1:])] + [f"hist_ge_{e[-1]}"]
+
+
+def write_crosstab_csv(path, tables, class_names=None):
+    """tables: {level_name: CrossTab}; class_names: {level_name: {code: name}}"""
+    rows = []
+    for level, tab in tables.items():
+        for row in tab.rows((class_names or {}).get(level)):
+            rows.append({"level": level, **row})
+    if not rows:
+        raise RuntimeError("Cross-tab is empty: no finite WTD change inside any class.")
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def _open_on_grid(path, ref):
+    """Dataset handle for `path` on `ref`'s grid (warped VRT if the grids differ)."""
+    src = rasterio.open(path)
+    if src.crs == ref.crs and src.transform == ref.transform and src.shape == ref.shape:
+        return src, None
+    vrt = WarpedVRT(
+        src, crs=ref.crs, transform=ref.transform, width=ref.width, height=ref.height,
+        resampling=Resampling.bilinear, nodata=np.nan, dtype="float32"
+    )
+    return vrt, src
+
+
+def _read_float(ds, win):
+    a = ds.read(1, window=win).astype(np.float32, copy=False)
+    if ds.nodata is not None and not np.isnan(ds.nodata):
+        a[a == ds.nodata] = np.nan
+    return a
+
+
+def wtd_change_crosstab(class_paths, wtd_start_path, wtd_end_path, bin_edges,
+                        factor=1.0, class_nodata=0, rows_per_window=512):
+    """
+    class_paths: {level_name: path} of uint8 class rasters on one grid.
+    Returns {level_name: CrossTab} of (wtd_end - wtd_start) * factor,
+    computed in a single windowed pass.
+    """
+    levels = list(class_paths)
+    tables = {lv: CrossTab(bin_edges, class_nodata=class_nodata) for lv in levels}
+    class_ds = {lv: rasterio.open(class_paths[lv]) for lv in levels}
+    ref = class_ds[levels[0]]
+    for lv in levels[1:]:
+        if class_ds[lv].transform != ref.transform or class_ds[lv].shape != ref.shape:
+            raise RuntimeError(f"Class raster '{lv}' is not on the same grid as '{levels[0]}'.")
+
+    opened = []
+    try:
+        start_ds, start_raw = _open_on_grid(wtd_start_path, ref)
+        opened += [start_ds, start_raw]
+        end_ds, end_raw = _open_on_grid(wtd_end_path, ref)
+        opened += [end_ds, end_raw]
+
+        for win in iter_row_windows(ref, rows_per_window):
+            diff = (_read_float(end_ds, win) - _read_float(start_ds, win)) * factor
+            for lv in levels:
+                tables[lv].update(to_lut_index(class_ds[lv].read(1, window=win)), diff)
+    finally:
+        for ds in opened + list(class_ds.values()):
+            if ds is not None:
+                ds.close()
+
+    return tables
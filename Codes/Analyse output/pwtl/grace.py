@@ -0,0 +1,144 @@
+"""
+GRACE/GRACE-FO mascon reader.
+
+The lat/lon window and the 0-360 -> -180..180 longitude roll are applied at
+read time: only the source columns/rows inside the window are requested from
+GDAL, as one bulk ReadAsArray per contiguous column run, for the whole time
+slab at once. The result is a (time, lat, lon) float32 cube, north-up, with
+longitudes ascending.
+"""
+
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+from osgeo import gdal
+from rasterio.transform import from_bounds
+
+
+GraceCube = namedtuple("GraceCube", ["data", "lon", "lat", "transform", "dates"])
+
+
+def get_grace_subdataset(nc_path):
+    ds = gdal.Open(nc_path)
+    if ds is None:
+        raise RuntimeError("Could not open NetCDF file.")
+    subdatasets = ds.GetSubDatasets()
+    if not subdatasets:
+        return nc_path
+    preferred = ["lwe_thickness", "lwe", "equivalent_water_thickness",
+                 "water_thickness", "twsa", "tws"]
+    for name, desc in subdatasets:
+        text = (name + " " + desc).lower()
+        for key in preferred:
+            if key in text:
+                return name
+    for name, desc in subdatasets:
+        text = (name + " " + desc).lower()
+        if ("lat" not in text) and ("lon" not in text) and ("time" not in text):
+            return name
+    raise RuntimeError("Could not find GRACE data variable.")
+
+
+def month_range(start_year, start_month, n):
+    dates = []
+    y, m = start_year, start_month
+    for _ in range(n):
+        dates.append(datetime(y, m, 1))
+        m += 1
+        if m > 12:
+            m = 1
+            y += 1
+    return dates
+
+
+def make_transform_from_lonlat(lon, lat_ascending):
+    xres = np.mean(np.diff(lon))
+    yres = np.mean(np.abs(np.diff(lat_ascending)))
+    west  = lon.min() - xres / 2.0
+    east  = lon.max() + xres / 2.0
+    south = lat_ascending.min() - yres / 2.0
+    north = lat_ascending.max() + yres / 2.0
+    return from_bounds(west, south, east, north, len(lon), len(lat_ascending))
+
+
+def _contiguous_runs(idx):
+    # split a sequence of column indices into runs of consecutive indices
+    breaks = np.where(np.diff(idx) != 1)[0] + 1
+    return np.split(idx, breaks)
+
+
+def read_grace_cube(nc_path, lon_min, lon_max, lat_min, lat_max,
+                    start_year=2002, start_month=4, first_band=0, n_bands=None, scale=1.0):
+    """
+    Read the GRACE variable inside [lon_min, lon_max] x [lat_min, lat_max].
+
+    first_band / n_bands select the time slab (0-based, default: all bands).
+    Band dates follow month_range(start_year, start_month, ...) like the
+    original scripts. Nodata is set to NaN and values are multiplied by scale.
+    """
+    subdataset = get_grace_subdataset(nc_path)
+    ds = gdal.Open(subdataset)
+    if ds is None:
+        raise RuntimeError("Could not open GRACE subdataset.")
+
+    total_bands = ds.RasterCount
+    if n_bands is None:
+        n_bands = total_bands - first_band
+    if first_band < 0 or n_bands <= 0 or first_band + n_bands > total_bands:
+        raise ValueError(f"Band slab {first_band}+{n_bands} outside 0..{total_bands}")
+    band_list = list(range(first_band + 1, first_band + n_bands + 1))
+
+    gt = ds.GetGeoTransform()
+    lon_src = gt[0] + (np.arange(ds.RasterXSize) + 0.5) * gt[1]
+    lat_src = gt[3] + (np.arange(ds.RasterYSize) + 0.5) * gt[5]
+    lon_src = np.where(lon_src > 180, lon_src - 360, lon_src)
+
+    cols = np.where((lon_src >= lon_min) & (lon_src <= lon_max))[0]
+    rows = np.where((lat_src <= lat_max) & (lat_src >= lat_min))[0]
+    if cols.size == 0 or rows.size == 0:
+        raise RuntimeError("GRACE grid does not overlap the requested lat/lon window.")
+
+    # ascending longitude; runs of consecutive source columns are read in one go
+    cols = cols[np.argsort(lon_src[cols], kind="stable")]
+    r0, r1 = int(rows.min()), int(rows.max()) + 1
+
+    pieces = []
+    for run in _contiguous_runs(cols):
+        block = ds.ReadAsArray(
+            xoff=int(run[0]), yoff=r0, xsize=int(run.size), ysize=r1 - r0,
+            band_list=band_list
+        )
+        if block.ndim == 2:
+            block = block[np.newaxis, :, :]
+        pieces.append(block)
+    data = pieces[0] if len(pieces) == 1 else np.concatenate(pieces, axis=2)
+    data = data.astype("float32", copy=False)
+
+    nodata = np.array(
+        [np.nan if v is None else v
+         for v in (ds.GetRasterBand(b).GetNoDataValue() for b in band_list)],
+        dtype="float64"
+    )
+    if np.isfinite(nodata).any():
+        data[data == nodata[:, None, None].astype("float32")] = np.nan
+
+    if scale != 1.0:
+        data *= np.float32(scale)
+
+    lon = lon_src[cols]
+    lat = lat_src[r0:r1]
+    if gt[5] > 0:
+        data = data[:, ::-1, :]
+        lat = lat[::-1]
+
+    transform = make_transform_from_lonlat(lon, lat[::-1])
+    dates = month_range(start_year, start_month, total_bands)[first_band:first_band + n_bands]
+    ds = None
+    return GraceCube(np.ascontiguousarray(data), lon, lat, transform, dates)
+
+
+def annual_groups(dates):
+    """{year: indices into the cube's time axis}"""
+    years = np.array([d.year for d in dates])
+    return {int(y): np.where(years == y)[0] for y in np.unique(years)}
@@ -0,0 +1,172 @@
+"""
+Persistent rolling-window state for monthly incremental updates.
+
+A full run ends with everything needed to continue the series saved in a
+state folder: the last k months per pixel (ring buffer), running sums and
+whatever accumulators the product keeps (Welford baseline, per-month
+counts, correlation sums, ...). When a new month arrives, an --update run
+loads that state, ingests only the months after `last` and saves it again,
+so a monthly update reads one month of inputs instead of the whole archive.
+
+    state = RollingState(os.path.join(OUT_DIR, "state", "wtd_dominance"))
+    state.create(shape=[H, W], baseline=[2000, 2020])
+    ring = state.open_array("ring", shape=(12, H, W), dtype="float32")
+    ...
+    state.commit(last="202512", slot=0)
+
+Arrays are .npy files opened memory-mapped, so a window-by-window update
+only touches the windows it writes. state.json is written last (atomically);
+while an update is in progress it is marked dirty, and a state left dirty by
+a crash is refused rather than silently reused.
+"""
+
+import json
+import os
+
+import numpy as np
+
+STATE_VERSION = 1
+
+
+def yyyymm_int(key):
+    """'202401', 202401 or (2024, 1) -> 202401."""
+    if isinstance(key, tuple):
+        return int(key[0]) * 100 + int(key[1])
+    return int(key)
+
+
+def next_yyyymm(key):
+    y, m = divmod(yyyymm_int(key), 100)
+    return (y + 1) * 100 + 1 if m == 12 else y * 100 + m + 1
+
+
+def months_after(dates, last):
+    """
+    Entries of sorted `dates` after `last`, which must continue the series
+    month by month (a gap would break the rolling windows).
+    """
+    new = [d for d in dates if yyyymm_int(d) > yyyymm_int(last)]
+    expected = next_yyyymm(last)
+    for d in new:
+        if yyyymm_int(d) != expected:
+            raise RuntimeError(
+                f"Cannot update incrementally: expected month {expected} after {yyyymm_int(last)}, "
+                f"found {yyyymm_int(d)}. Fill the gap or run a full recompute."
+            )
+        expected = next_yyyymm(d)
+    return new
+
+
+def check_outside_baseline(new_dates, baseline_start, baseline_end):
+    """New months inside the baseline period change every z score: refuse."""
+    hit = [d for d in new_dates if baseline_start <= yyyymm_int(d) // 100 <= baseline_end]
+    if hit:
+        raise RuntimeError(
+            f"New month(s) {yyyymm_int(hit[0])}... fall inside the baseline {baseline_start}-{baseline_end}; "
+            f"the baseline and all past z scores change, so run a full recompute."
+        )
+
+
+def _json_default(obj):
+    """numpy scalars / arrays in the metadata (counts, nodata, ...) as plain Python."""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class RollingState:
+    def __init__(self, state_dir):
+        self.state_dir = state_dir
+        self.meta_path = os.path.join(state_dir, "state.json")
+        self.meta = {}
+
+    def exists(self):
+        return os.path.exists(self.meta_path)
+
+    def _path(self, name):
+        return os.path.join(self.state_dir, f"{name}.npy")
+
+    def file(self, filename):
+        """Path for other per-state files (e.g. sketches) kept alongside the arrays."""
+        return os.path.join(self.state_dir, filename)
+
+    def create(self, keep_arrays=False, **meta):
+        """
+        Start a fresh state (a full run), discarding any previous one.
+        keep_arrays=True keeps arrays already written, for a full run resumed
+        from a checkpoint.
+        """
+        os.makedirs(self.state_dir, exist_ok=True)
+        for fn in os.listdir(self.state_dir):
+            if fn.endswith((".npy", ".npz")) and not keep_arrays:
+                os.remove(os.path.join(self.state_dir, fn))
+        self.meta = dict(meta, version=STATE_VERSION, dirty=True)
+        self._write_meta()
+        return self
+
+    def load(self, **expected):
+        """
+        Open an existing state for updating. `expected` settings (baseline,
+        shape, ...) must match what the state was built with.
+        """
+        if not self.exists():
+            raise RuntimeError(f"No saved state in {self.state_dir}; run a full pass first.")
+        with open(self.meta_path) as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != STATE_VERSION:
+            raise RuntimeError(f"State in {self.state_dir} has an old format; run a full pass.")
+        if self.meta.get("dirty"):
+            raise RuntimeError(
+                f"State in {self.state_dir} was left mid-update (crash or interrupt); run a full pass."
+            )
+        for key, val in expected.items():
+            saved = self.meta.get(key)
+            if json.loads(json.dumps(val, default=_json_default)) != saved:
+                raise RuntimeError(
+                    f"State in {self.state_dir} was built with {key}={saved!r}, now {val!r}; run a full pass."
+                )
+        return self
+
+    def begin_update(self):
+        self.meta["dirty"] = True
+        self._write_meta()
+
+    def commit(self, **meta):
+        """Record the new position (e.g. last=...) and mark the state clean."""
+        self.meta.update(meta)
+        self.meta["dirty"] = False
+        self._write_meta()
+
+    def _write_meta(self):
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.meta, f, indent=2, default=_json_default)
+        os.replace(tmp, self.meta_path)
+
+    def open_array(self, name, shape=None, dtype=None, fill=None):
+        """
+        Memory-mapped array `name`: created (filled with `fill`) when shape and
+        dtype are given and it does not exist yet, else opened read/write.
+        """
+        path = self._path(name)
+        if os.path.exists(path):
+            return np.load(path, mmap_mode="r+")
+        if shape is None:
+            raise RuntimeError(f"State array {name!r} missing in {self.state_dir}; run a full pass.")
+        arr = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=tuple(shape))
+        if fill is not None:
+            arr[...] = fill
+        return arr
+
+    def save_array(self, name, arr):
+        tmp = self._path(name) + ".tmp.npy"
+        np.save(tmp, np.asarray(arr))
+        os.replace(tmp, self._path(name))
+
+    def load_array(self, name, mmap_mode="r"):
+        path = self._path(name)
+        if not os.path.exists(path):
+            raise RuntimeError(f"State array {name!r} missing in {self.state_dir}; run a full pass.")
+        return np.load(path, mmap_mode=mmap_mode)
@@ -0,0 +1,106 @@
+"""
+Land-cover reclassification streamed by window.
+
+The "fix invalid -> fill class inside the boundary" rule and the grouping
+(human / mixed / climate) are folded into 256-entry uint8 lookup tables, so
+each window is one boundary rasterization plus one table lookup. Outputs are
+written window by window; memory stays at a few row strips regardless of the
+raster size.
+"""
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+from pwtl.cog import COG_COMPRESS, cog_profile
+from pwtl.preview import open_raster
+from rasterio.features import geometry_mask
+
+
+def build_reclass_luts(valid_classes, group_classes, fill_class=7, nodata=None, grouped_nodata=0):
+    """
+    Returns (fixed_lut, grouped_lut), both uint8[256], for pixels INSIDE the
+    boundary:
+      fixed_lut[code]   -> code, or fill_class for 0 / nodata / non-valid codes
+      grouped_lut[code] -> group value of fixed_lut[code]
+    group_classes: {group_value: [original classes]}
+    """
+    codes = np.arange(256)
+    invalid = ~np.isin(codes, np.asarray(list(valid_classes)))
+    invalid[0] = True
+    if nodata is not None and np.isfinite(nodata) and 0 <= nodata <= 255 and float(nodata).is_integer():
+        invalid[int(nodata)] = True
+
+    fixed_lut = codes.astype(np.uint8)
+    fixed_lut[invalid] = fill_class
+
+    group_lut = np.full(256, grouped_nodata, dtype=np.uint8)
+    for group_value, classes in group_classes.items():
+        group_lut[np.asarray(list(classes))] = group_value
+
+    return fixed_lut, group_lut[fixed_lut]
+
+
+def iter_row_windows(src, rows_per_window=512):
+    """Full-width row strips, aligned to the file's internal block height."""
+    block_h = src.block_shapes[0][0]
+    rows = max(block_h, (rows_per_window // block_h) * block_h)
+    for r in range(0, src.height, rows):
+        yield Window(0, r, src.width, min(rows, src.height - r))
+
+
+def to_lut_index(arr):
+    """Land-cover codes as uint8 LUT indices; anything outside 0..255 (or NaN) -> 0."""
+    if arr.dtype == np.uint8:
+        return arr
+    ok = (arr >= 0) & (arr <= 255)
+    return np.where(ok, arr, 0).astype(np.uint8)
+
+
+def reclassify_landcover(src_path, boundary_geoms, grouped_path, fixed_path=None,
+                         valid_classes=range(1, 20), group_classes=None,
+                         fill_class=7, grouped_nodata=0, rows_per_window=512, compress=COG_COMPRESS):
+    """
+    Stream `src_path` into a grouped land-cover GeoTIFF (and optionally the
+    fixed original-class raster). Outside the boundary both outputs hold
+    `grouped_nodata`; inside, every pixel gets a valid class / group.
+    Returns the output profile.
+    """
+    if group_classes is None:
+        raise ValueError("group_classes is required, e.g. {1: HUMAN_CLASSES, 2: MIXED_CLASSES, 3: CLIMATE_CLASSES}")
+    geoms = [g for g in boundary_geoms if g is not None and not g.is_empty]
+    if not geoms:
+        raise RuntimeError("Boundary has no geometries.")
+
+    # inputs follow the preview factor (pwtl.preview); class maps decimate by nearest
+    with open_raster(src_path) as src:
+        fixed_lut, grouped_lut = build_reclass_luts(
+            valid_classes, group_classes, fill_class, src.nodata, grouped_nodata
+        )
+
+        # tiled class maps (no predictor: differencing does not help categorical data)
+        profile = cog_profile(src.profile, compress=compress, predictor=1,
+                              dtype=rasterio.uint8, nodata=grouped_nodata, count=1)
+
+        dst_fixed = rasterio.open(fixed_path, "w", **profile) if fixed_path else None
+        try:
+            with rasterio.open(grouped_path, "w", **profile) as dst_grouped:
+                for win in iter_row_windows(src, rows_per_window):
+                    codes = to_lut_index(src.read(1, window=win))
+                    inside = geometry_mask(
+                        geoms,
+                        out_shape=(int(win.height), int(win.width)),
+                        transform=src.window_transform(win),
+                        invert=True,
+                        all_touched=False
+                    )
+                    dst_grouped.write(np.where(inside, grouped_lut[codes], grouped_nodata).astype(np.uint8),
+                                      1, window=win)
+                    if dst_fixed is not None:
+                        dst_fixed.write(np.where(inside, fixed_lut[codes], grouped_nodata).astype(np.uint8),
+                                        1, window=win)
+        finally:
+            if dst_fixed is not None:
+                dst_fixed.close()
+
+    return profile
@@ -0,0 +1,136 @@
+"""
+Cache of prepared vector overlays (boundary, watersheds, Greenland).
+
+read_overlay() returns a shapefile reprojected to `crs`, optionally clipped to
+a lon/lat box and/or to a second shapefile and simplified for display. The
+result is keyed by the source files (path, size, mtime), CRS, clip domain,
+clip method and tolerance; it is kept in memory for the rest of the run and,
+with `cache_dir`, written as GeoParquet (WKB pickle when pyarrow is missing)
+so the next run skips to_crs / overlay / clip entirely.
+"""
+
+import hashlib
+import os
+import pickle
+
+import geopandas as gpd
+import pandas as pd
+from pyproj import CRS
+from shapely.geometry import box
+
+from pwtl.annual_cache import source_signature
+
+_MEMO = {}
+
+SHAPEFILE_SIDECARS = (".shp", ".shx", ".dbf", ".prj", ".cpg")
+
+
+def _shapefile_parts(path):
+    stem = os.path.splitext(path)[0]
+    parts = [stem + ext for ext in SHAPEFILE_SIDECARS if os.path.exists(stem + ext)]
+    return parts or [path]
+
+
+def overlay_key(shp_path, crs="EPSG:4326", clip_box=None, clip_with=None,
+                clip_method="overlay", simplify_tolerance=0.0):
+    crs_wkt = CRS.from_user_input(crs).to_wkt() if crs is not None else "native"
+    box_key = None if clip_box is None else tuple(round(float(v), 9) for v in clip_box)
+    with_key = None if clip_with is None else overlay_key(clip_with, crs, clip_box)
+    raw = repr((
+        source_signature(_shapefile_parts(shp_path)),
+        hashlib.sha1(crs_wkt.encode()).hexdigest(),
+        box_key, with_key, clip_method, float(simplify_tolerance),
+    ))
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+
+def _intersect(gdf, other, clip_method):
+    # same fallbacks the scripts used inline: overlay -> clip -> unclipped
+    if clip_method == "overlay":
+        try:
+            return gpd.overlay(gdf, other, how="intersection")
+        except Exception:
+            pass
+    try:
+        return gpd.clip(gdf, other)
+    except Exception:
+        return gdf.copy()
+
+
+def _cache_base(cache_dir, shp_path, key):
+    name = os.path.splitext(os.path.basename(shp_path))[0]
+    return os.path.join(cache_dir, f"{name}_{key}")
+
+
+def _load(base):
+    if os.path.exists(base + ".parquet"):
+        return gpd.read_parquet(base + ".parquet")
+    if os.path.exists(base + ".wkb.pkl"):
+        with open(base + ".wkb.pkl", "rb") as f:
+            df, geom_col, crs_wkt = pickle.load(f)
+        df[geom_col] = gpd.GeoSeries.from_wkb(df[geom_col], crs=crs_wkt)
+        return gpd.GeoDataFrame(df, geometry=geom_col, crs=crs_wkt)
+    return None
+
+
+def _save(gdf, base):
+    os.makedirs(os.path.dirname(base), exist_ok=True)
+    try:
+        tmp = base + ".parquet.tmp"
+        gdf.to_parquet(tmp)
+        os.replace(tmp, base + ".parquet")
+        return
+    except ImportError:
+        pass
+
+    geom_col = gdf.geometry.name
+    df = pd.DataFrame(gdf.drop(columns=geom_col))
+    df[geom_col] = gdf.geometry.to_wkb()
+    tmp = base + ".wkb.pkl.tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump((df, geom_col, gdf.crs.to_wkt() if gdf.crs else None), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, base + ".wkb.pkl")
+
+
+def read_overlay(shp_path, crs="EPSG:4326", clip_box=None, clip_with=None,
+                 clip_method="overlay", simplify_tolerance=0.0, cache_dir=None,
+                 assume_crs="EPSG:4326"):
+    """
+    crs: target CRS (None keeps the shapefile's own CRS)
+    clip_box:  (xmin, ymin, xmax, ymax) in `crs`
+    clip_with: second shapefile, prepared with the same crs/clip_box, to intersect with
+    clip_method: "overlay" (gpd.overlay, split features) or "clip" (gpd.clip)
+    assume_crs: CRS given to a shapefile that has none
+    Returns a copy the caller may modify.
+    """
+    key = overlay_key(shp_path, crs, clip_box, clip_with, clip_method, simplify_tolerance)
+    if key in _MEMO:
+        return _MEMO[key].copy()
+
+    base = _cache_base(cache_dir, shp_path, key) if cache_dir else None
+    gdf = _load(base) if base else None
+
+    if gdf is None:
+        gdf = gpd.read_file(shp_path)
+        gdf = gdf.set_crs(assume_crs) if gdf.crs is None else gdf
+        if crs is not None:
+            gdf = gdf.to_crs(crs)
+
+        if clip_box is not None:
+            domain = gpd.GeoDataFrame(geometry=[box(*clip_box)], crs=gdf.crs)
+            gdf = _intersect(gdf, domain, clip_method)
+
+        if clip_with is not None:
+            other = read_overlay(clip_with, crs, clip_box, cache_dir=cache_dir, assume_crs=assume_crs)
+            gdf = _intersect(gdf, other, clip_method)
+
+        if simplify_tolerance > 0:
+            gdf = gdf.copy()
+            gdf[gdf.geometry.name] = gdf.geometry.simplify(simplify_tolerance, preserve_topology=True)
+            gdf = gdf[~gdf.geometry.is_empty]
+
+        if base:
+            _save(gdf, base)
+
+    _MEMO[key] = gdf
+    return gdf.copy()
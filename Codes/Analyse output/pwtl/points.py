@@ -0,0 +1,199 @@
+"""
+Point time series from the monthly archives (e.g. WTM output at wells).
+
+Extracting a full monthly series at thousands of lat/lon points used to
+open every GeoTIFF once per point. Here the points are located on the
+raster grid once (PointIndex), grouped by tile, and every monthly raster is
+opened once: each tile that holds points is read as the bounding box of
+those points and all of them are gathered with one fancy-indexing step.
+
+    files = monthly_files(WTD_DIR)                          # [(yyyymm, path), ...]
+    table = extract_monthly(files, wells.lon, wells.lat, ids=wells.id)
+    # -> DataFrame, one row per point, one column per month (NaN off-grid / nodata)
+
+The same gather works on a cube, one band per time step, in any format
+GDAL reads (a netCDF variable, Zarr, a multi-band GeoTIFF or a VRT stack):
+extract_cube() reads each tile once with all bands, so the chunking of the
+cube decides the I/O instead of one request per point and month.
+extract_archives() runs either for several variables (P, E, WTD) and joins
+the tables.
+"""
+
+import os
+import re
+import glob
+
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.crs import CRS
+from rasterio.transform import rowcol
+from rasterio.warp import transform as warp_transform
+from rasterio.windows import Window
+
+from pwtl.prefetch import prefetch
+from pwtl.storage import read_decoded
+
+# points are grouped per tile of at least this many pixels a side (the file's
+# blocks are used when they are larger, e.g. 512x512 COG tiles or cube chunks)
+MIN_TILE = 256
+
+# default file patterns of the monthly archives, by variable
+ARCHIVE_PATTERNS = {
+    "P":   "N_America_??????_precipitation.tif",
+    "E":   "N_America_??????_evaporation.tif",
+    "WTD": "N_America_??????_*.tif",
+}
+
+_YYYYMM = re.compile(r"N_America_(\d{6})_")
+
+
+def monthly_files(directory, pattern="N_America_??????_*.tif"):
+    """Sorted [(yyyymm, path)] of a monthly archive; the first file per month wins."""
+    by_month = {}
+    for path in sorted(glob.glob(os.path.join(directory, pattern))):
+        m = _YYYYMM.search(os.path.basename(path))
+        if m:
+            by_month.setdefault(m.group(1), path)
+    if not by_month:
+        raise RuntimeError(f"No monthly rasters matching {pattern} in {directory}")
+    return sorted(by_month.items())
+
+
+def tile_shape(src, min_tile=MIN_TILE):
+    """The file's block shape, enlarged to whole blocks of at least `min_tile`."""
+    bh, bw = src.block_shapes[0]
+    th = max(bh, -(-min_tile // bh) * bh)
+    tw = max(bw, -(-min_tile // bw) * bw)
+    return min(th, src.height), min(tw, src.width)
+
+
+class PointIndex:
+    """
+    Row/col of each point on one raster grid, grouped by tile. Points off
+    the grid get NaN. Points are given in `points_crs` (lon/lat by default)
+    and reprojected to the grid's CRS when it differs.
+    """
+
+    def __init__(self, xs, ys, transform, width, height, crs=None, points_crs="EPSG:4326",
+                 tile=(MIN_TILE, MIN_TILE)):
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        if xs.shape != ys.shape or xs.ndim != 1:
+            raise ValueError("xs and ys must be 1-D arrays of the same length")
+        if crs is not None and points_crs is not None and CRS.from_user_input(points_crs) != crs:
+            xs, ys = (np.asarray(v) for v in warp_transform(points_crs, crs, xs, ys))
+
+        self.n = xs.size
+        self.grid = (tuple(transform)[:6], int(width), int(height))
+        rows, cols = rowcol(transform, xs, ys, op=np.floor)
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        self.inside = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+
+        th, tw = tile
+        idx = np.flatnonzero(self.inside)
+        tile_id = (rows[idx] // th) * (-(-width // tw)) + cols[idx] // tw
+        order = np.argsort(tile_id, kind="stable")
+        idx, tile_id = idx[order], tile_id[order]
+        bounds = np.flatnonzero(np.diff(tile_id)) + 1
+
+        # per tile: bounding-box window of its points + their offsets in it
+        self.groups = []
+        for g in np.split(idx, bounds):
+            if g.size == 0:
+                continue
+            r, c = rows[g], cols[g]
+            r0, c0 = int(r.min()), int(c.min())
+            win = Window(c0, r0, int(c.max()) - c0 + 1, int(r.max()) - r0 + 1)
+            self.groups.append((win, g, r - r0, c - c0))
+
+    @classmethod
+    def for_dataset(cls, src, xs, ys, points_crs="EPSG:4326", min_tile=MIN_TILE):
+        return cls(xs, ys, src.transform, src.width, src.height, crs=src.crs,
+                   points_crs=points_crs, tile=tile_shape(src, min_tile))
+
+    def matches(self, src):
+        return self.grid == (tuple(src.transform)[:6], src.width, src.height)
+
+    def summary(self):
+        return (f"{self.n} points: {int(self.inside.sum())} on the grid in {len(self.groups)} tiles, "
+                f"{self.n - int(self.inside.sum())} off the grid")
+
+    def gather(self, src, band=1):
+        """
+        Values at the points from an open dataset: (n,) for one band,
+        (n, count) for band=None (all bands of a cube). NaN off the grid.
+        """
+        n_layers = src.count if band is None else 1
+        out = np.full((self.n, n_layers), np.nan, dtype=np.float32)
+        for win, g, r, c in self.groups:
+            block = read_decoded(src, band, window=win)
+            if band is None:
+                out[g] = block[:, r, c].T
+            else:
+                out[g, 0] = block[r, c]
+        return out[:, 0] if band is not None else out
+
+
+def _table(values, ids, columns):
+    index = pd.Index(ids if ids is not None else np.arange(values.shape[0]), name="point")
+    return pd.DataFrame(values, index=index, columns=pd.Index(columns, name="time"))
+
+
+def extract_monthly(files, xs, ys, ids=None, points_crs="EPSG:4326", min_tile=MIN_TILE):
+    """
+    (point x month) DataFrame from [(yyyymm, path)] single-band rasters on
+    one grid. Every raster is opened once; the next ones are read ahead
+    while the current one is gathered (pwtl.prefetch).
+    """
+    if not files:
+        raise RuntimeError("No rasters to extract from.")
+    with rasterio.open(files[0][1]) as src0:
+        index = PointIndex.for_dataset(src0, xs, ys, points_crs, min_tile)
+    print(f"  {index.summary()}")
+
+    def load(item):
+        with rasterio.open(item[1]) as src:
+            if not index.matches(src):
+                raise RuntimeError(f"{item[1]} is not on the grid of {files[0][1]}; extract it separately.")
+            return index.gather(src)
+
+    values = np.full((index.n, len(files)), np.nan, dtype=np.float32)
+    for j, (_, v) in enumerate(prefetch(files, load)):
+        values[:, j] = v
+    return _table(values, ids, [yyyymm for yyyymm, _ in files])
+
+
+def extract_cube(path, xs, ys, ids=None, times=None, points_crs="EPSG:4326", min_tile=MIN_TILE):
+    """
+    (point x time) DataFrame from a cube with one band per time step.
+    `times` labels the bands (default: band descriptions, else 1..count).
+    """
+    with rasterio.open(path) as src:
+        index = PointIndex.for_dataset(src, xs, ys, points_crs, min_tile)
+        print(f"  {index.summary()}")
+        values = index.gather(src, band=None)
+        if times is None:
+            desc = src.descriptions
+            times = list(desc) if all(desc) else list(range(1, src.count + 1))
+    if len(times) != values.shape[1]:
+        raise ValueError(f"{len(times)} time labels for {values.shape[1]} bands in {path}")
+    return _table(values, ids, times)
+
+
+def extract_archives(archives, xs, ys, ids=None, points_crs="EPSG:4326", min_tile=MIN_TILE):
+    """
+    {name: monthly archive folder or cube file} -> one DataFrame with
+    (name, time) columns. Folders use ARCHIVE_PATTERNS[name] when there is
+    one, else any N_America_YYYYMM_*.tif.
+    """
+    tables = {}
+    for name, path in archives.items():
+        print(f"{name}: {path}")
+        if os.path.isdir(path):
+            files = monthly_files(path, ARCHIVE_PATTERNS.get(name, "N_America_??????_*.tif"))
+            tables[name] = extract_monthly(files, xs, ys, ids, points_crs, min_tile)
+        else:
+            tables[name] = extract_cube(path, xs, ys, ids, None, points_crs, min_tile)
+    return pd.concat(tables, axis=1, names=["variable", "time"])
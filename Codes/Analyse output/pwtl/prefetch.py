@@ -0,0 +1,63 @@
+"""
+Read-ahead for the month-by-month loops.
+
+The rolling loops read month t, compute on it, then read month t+1: the CPU
+waits on the drive and the drive waits on the CPU. prefetch() reads the
+next `depth` months in background threads while the loop body works on the
+current one:
+
+    for yyyymm, wtd in prefetch(dates, lambda d: read_block(path_for(d), window, nodata)):
+        ...
+
+Items come back in order, with load(item) already done. GDAL releases the
+GIL while it reads and decodes, so plain threads overlap I/O with the
+numpy work. At most `depth` results are held ahead of the loop (bounded
+memory: depth extra windows). Leaving the loop early (break, exception)
+cancels what has not started. depth=0 reads synchronously, as before.
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# months read ahead; set to 0 (or PWTL_PREFETCH=0) to read synchronously
+DEFAULT_DEPTH = 2
+
+_END = object()
+
+
+def _env_depth():
+    val = os.environ.get("PWTL_PREFETCH")
+    return int(val) if val not in (None, "") else None
+
+
+def prefetch(items, load, depth=None):
+    """Yield (item, load(item)) for `items` in order, loading up to `depth` ahead."""
+    if depth is None:
+        env = _env_depth()
+        depth = DEFAULT_DEPTH if env is None else env
+
+    if depth <= 0:
+        for item in items:
+            yield item, load(item)
+        return
+
+    it = iter(items)
+    pending = deque()
+    pool = ThreadPoolExecutor(max_workers=depth, thread_name_prefix="prefetch")
+    try:
+        for item in it:
+            pending.append((item, pool.submit(load, item)))
+            if len(pending) >= depth:
+                break
+        # while the caller works on `item`, the next `depth` are being read
+        while pending:
+            item, fut = pending.popleft()
+            nxt = next(it, _END)
+            if nxt is not _END:
+                pending.append((nxt, pool.submit(load, nxt)))
+            yield item, fut.result()
+    finally:
+        for _, fut in pending:
+            fut.cancel()
+        pool.shutdown(wait=True)
@@ -0,0 +1,149 @@
+"""
+Reduced-resolution preview runs.
+
+Iterating on figure layout used to mean re-running every analysis at full
+30 arc-second resolution. With --preview-factor N a script reads each input
+raster on a grid N times coarser in both directions, so the whole run
+(reads, masks, label rasters, sums, outputs) does ~N^2 times less work:
+
+    set_preview_factor(args.preview_factor)
+    with open_raster(path) as src:        # instead of rasterio.open(path)
+        profile, transform = src.profile, src.transform   # preview grid
+        arr = src.read(1, window=win)                      # preview pixels
+
+open_raster() hands back a PreviewDataset whose width/height/transform/
+profile describe the coarse grid; windowed reads are decimated out_shape
+reads of the matching full-resolution window, which GDAL serves from the
+file's overviews when it has them (see retile_to_cog.py). Everything
+derived from the dataset (boundary masks, geometry windows, output
+profiles) follows the preview grid without further changes. Outputs go to
+preview_dir(out_dir) and figures are saved at preview_dpi(dpi), so a
+preview never overwrites (or resumes from) full-resolution results.
+
+Only inputs go through open_raster(); products a script wrote itself are
+already on the preview grid and are opened with rasterio.open().
+"""
+
+import math
+import os
+
+import rasterio
+from affine import Affine
+from rasterio.enums import Resampling
+from rasterio.transform import rowcol, xy as transform_xy
+from rasterio.windows import Window, from_bounds, transform as window_transform
+
+# figures of a preview are saved at dpi / factor, but not below this
+MIN_PREVIEW_DPI = 150
+
+_factor = 1
+
+
+def set_preview_factor(factor):
+    """Set the process-wide preview factor (1 = full resolution)."""
+    global _factor
+    factor = int(factor or 1)
+    if factor < 1:
+        raise ValueError(f"preview factor must be >= 1, got {factor}")
+    _factor = factor
+    if factor > 1:
+        print(f"PREVIEW: inputs read at 1/{factor} resolution (outputs in preview_x{factor})")
+    return factor
+
+
+def preview_factor():
+    return _factor
+
+
+def preview_dir(path, factor=None):
+    """`path` for full-resolution runs, `path`/preview_x{N} for previews."""
+    factor = factor or _factor
+    return path if factor == 1 else os.path.join(path, f"preview_x{factor}")
+
+
+def preview_dpi(dpi, factor=None):
+    factor = factor or _factor
+    return dpi if factor == 1 else max(MIN_PREVIEW_DPI, int(dpi / factor))
+
+
+class PreviewDataset:
+    """
+    Read-only view of an open rasterio dataset on a grid `factor` times
+    coarser. Attributes it does not override (crs, nodata, dtypes, scales,
+    offsets, ...) come from the full-resolution dataset.
+    """
+
+    def __init__(self, src, factor, resampling=Resampling.nearest):
+        self._src = src
+        self.factor = factor
+        self.resampling = resampling
+        self.width = max(1, math.ceil(src.width / factor))
+        self.height = max(1, math.ceil(src.height / factor))
+        self.shape = (self.height, self.width)
+        # exact ratios, so the preview grid covers the same bounds
+        self._sx = src.width / self.width
+        self._sy = src.height / self.height
+        self.transform = src.transform * Affine.scale(self._sx, self._sy)
+
+    def __getattr__(self, name):
+        return getattr(self._src, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._src.close()
+
+    @property
+    def profile(self):
+        prof = self._src.profile.copy()
+        prof.update(width=self.width, height=self.height, transform=self.transform)
+        return prof
+
+    @property
+    def meta(self):
+        meta = self._src.meta.copy()
+        meta.update(width=self.width, height=self.height, transform=self.transform)
+        return meta
+
+    def window_transform(self, window):
+        return window_transform(window, self.transform)
+
+    def window(self, left, bottom, right, top):
+        return from_bounds(left, bottom, right, top, transform=self.transform)
+
+    def index(self, x, y, op=math.floor):
+        return rowcol(self.transform, x, y, op=op)
+
+    def xy(self, row, col, offset="center"):
+        return transform_xy(self.transform, row, col, offset=offset)
+
+    def _full_window(self, window):
+        col, row = window.col_off * self._sx, window.row_off * self._sy
+        return Window(col, row,
+                      min(window.width * self._sx, self._src.width - col),
+                      min(window.height * self._sy, self._src.height - row))
+
+    def read(self, indexes=None, window=None, out_shape=None, resampling=None, **kwargs):
+        """Like DatasetReader.read, with `window` in preview pixels."""
+        if window is None:
+            window = Window(0, 0, self.width, self.height)
+        if out_shape is None:
+            out_shape = (int(window.height), int(window.width))
+            if indexes is None or not isinstance(indexes, int):
+                n = self._src.count if indexes is None else len(indexes)
+                out_shape = (n,) + out_shape
+        return self._src.read(indexes, window=self._full_window(window), out_shape=out_shape,
+                              resampling=self.resampling if resampling is None else resampling, **kwargs)
+
+
+def open_raster(path, factor=None, resampling=Resampling.nearest):
+    """rasterio.open(path) at full resolution, a PreviewDataset otherwise."""
+    factor = factor or _factor
+    src = rasterio.open(path)
+    if factor == 1:
+        return src
+    return PreviewDataset(src, factor, resampling)
@@ -0,0 +1,51 @@
+"""
+Quantiles along a short leading axis (e.g. 12 monthly maps) with NaNs.
+
+np.nanpercentile handles the general case: per call it builds masked
+copies, partitions, and is called once per quantile. For a (n, H, W)
+stack with small n, one in-place sort along axis 0 (NaNs sort last) plus
+a per-pixel count of valid values gives every requested quantile by two
+gathers, with the same linear interpolation as np.nanpercentile (its
+default method), including the all-NaN -> NaN case.
+"""
+
+import numpy as np
+
+
+def _lerp(a, b, t):
+    # same form numpy uses for method="linear"
+    diff = b - a
+    return np.where(t >= 0.5, b - diff * (1 - t), a + diff * t)
+
+
+def nan_quantiles(stack, qs, overwrite_input=False):
+    """
+    stack: (n, ...) array, NaN = missing
+    qs:    quantiles in [0, 1]
+    Returns a list of arrays shaped stack.shape[1:], one per q.
+    overwrite_input=True sorts `stack` in place (no copy).
+    """
+    a = stack if overwrite_input else stack.copy()
+    a.sort(axis=0)
+    n_valid = a.shape[0] - np.count_nonzero(np.isnan(a), axis=0)
+    last = np.maximum(n_valid - 1, 0)
+
+    out = []
+    for q in qs:
+        pos = q * last
+        lo = np.floor(pos).astype(np.intp)
+        hi = np.minimum(lo + 1, last)
+        t = (pos - lo).astype(a.dtype)
+
+        v_lo = np.take_along_axis(a, lo[None], axis=0)[0]
+        v_hi = np.take_along_axis(a, hi[None], axis=0)[0]
+        res = _lerp(v_lo, v_hi, t).astype(a.dtype, copy=False)
+        res[n_valid == 0] = np.nan
+        out.append(res)
+    return out
+
+
+def nan_quartiles(stack, overwrite_input=False):
+    """(q25, q75) along axis 0, as np.nanpercentile(stack, [25, 75], axis=0)."""
+    q25, q75 = nan_quantiles(stack, (0.25, 0.75), overwrite_input=overwrite_input)
+    return q25, q75
@@ -0,0 +1,63 @@
+"""
+Display-resolution rendering helpers.
+
+An axis saved at `dpi` can show at most (height_in * dpi, width_in * dpi)
+pixels. Anything finer is thrown away by matplotlib's resampling, after the
+full array has been decoded and held in memory. These helpers size the data
+to that pixel budget up front:
+
+  read_for_display     - decimated `out_shape` read (GDAL serves it from
+                         overviews when the file has them)
+  decimate_for_display - strided view of an array that is already in memory
+"""
+
+import math
+
+from affine import Affine
+from rasterio.enums import Resampling
+
+from pwtl.storage import read_decoded
+
+
+def axis_pixel_budget(ax, dpi):
+    """(rows, cols) of device pixels the axis covers when saved at `dpi`."""
+    fig = ax.figure
+    bbox = ax.get_position()
+    rows = bbox.height * fig.get_figheight() * dpi
+    cols = bbox.width * fig.get_figwidth() * dpi
+    return max(1, int(math.ceil(rows))), max(1, int(math.ceil(cols)))
+
+
+def decimation_factor(src_shape, budget, oversample=1.0):
+    """
+    Largest integer step that keeps at least `oversample` data pixels per
+    device pixel along both axes (1 = no decimation).
+    """
+    rows, cols = budget
+    f_rows = src_shape[0] / (rows * oversample)
+    f_cols = src_shape[1] / (cols * oversample)
+    return max(1, int(math.floor(min(f_rows, f_cols))))
+
+
+def read_for_display(src, ax, dpi, band=1, resampling=Resampling.nearest, oversample=1.0):
+    """
+    Read `band` of an open rasterio dataset at the resolution `ax` can show.
+    Returns (float32 array with nodata -> NaN and any int16 scale/offset
+    applied, transform of that array).
+    """
+    f = decimation_factor((src.height, src.width), axis_pixel_budget(ax, dpi), oversample)
+    out_h = int(math.ceil(src.height / f))
+    out_w = int(math.ceil(src.width / f))
+
+    arr = read_decoded(src, band, out_shape=(out_h, out_w), resampling=resampling)
+
+    transform = src.transform * Affine.scale(src.width / out_w, src.height / out_h)
+    return arr, transform
+
+
+def decimate_for_display(arr, ax, dpi, oversample=1.0):
+    """Strided (nearest-neighbour) view of `arr` sized to the pixel budget of `ax`."""
+    f = decimation_factor(arr.shape[-2:], axis_pixel_budget(ax, dpi), oversample)
+    if f == 1:
+        return arr
+    return arr[..., ::f, ::f]
@@ -0,0 +1,185 @@
+"""
+Mergeable fixed-bin histogram sketch for percentiles of very large samples.
+
+Values are counted into `n_bins` equal bins over [lo, hi) plus one underflow
+and one overflow bin; the exact min and max are tracked, so the outer bins
+are bounded too. update() is one bincount per tile, merge() is an add, and
+the sketch is a few kB on disk (npz), so compute passes can persist it next
+to their GeoTIFFs and figure scripts get percentiles without re-reading them.
+Quantiles interpolate between order statistics as np.percentile does, each
+estimated within its bin, so they are within one bin width of exact.
+With exact_max > 0 the values themselves are also kept while there are at
+most that many, and small groups get exact np.percentile statistics.
+"""
+
+import numpy as np
+
+
+class HistogramSketch:
+    def __init__(self, lo, hi, n_bins=4096, exact_max=0):
+        if not hi > lo:
+            raise ValueError("HistogramSketch needs hi > lo")
+        self.lo = float(lo)
+        self.hi = float(hi)
+        self.n_bins = int(n_bins)
+        # [0] underflow, [1..n_bins] regular bins, [n_bins + 1] overflow
+        self.counts = np.zeros(self.n_bins + 2, dtype=np.int64)
+        self.vmin = np.inf
+        self.vmax = -np.inf
+        # the values themselves while count <= exact_max (None once exceeded)
+        self.exact_max = int(exact_max)
+        self._exact = [] if self.exact_max > 0 else None
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    @property
+    def bin_width(self):
+        return (self.hi - self.lo) / self.n_bins
+
+    def update(self, values):
+        v = np.asarray(values).ravel()
+        v = v[np.isfinite(v)]
+        if v.size == 0:
+            return self
+        self.vmin = min(self.vmin, float(v.min()))
+        self.vmax = max(self.vmax, float(v.max()))
+
+        idx = np.floor((v - self.lo) / self.bin_width).astype(np.int64) + 1
+        np.clip(idx, 0, self.n_bins + 1, out=idx)
+        self.counts += np.bincount(idx, minlength=self.n_bins + 2)
+        if self._exact is not None:
+            self._exact = self._exact + [v.astype(np.float64)] if self.count <= self.exact_max else None
+        return self
+
+    def merge(self, other):
+        if (other.lo, other.hi, other.n_bins) != (self.lo, self.hi, self.n_bins):
+            raise ValueError("Cannot merge sketches with different bins.")
+        self.counts += other.counts
+        if self._exact is not None:
+            ok = other._exact is not None and self.count <= self.exact_max
+            self._exact = self._exact + other._exact if ok else None
+        self.vmin = min(self.vmin, other.vmin)
+        self.vmax = max(self.vmax, other.vmax)
+        return self
+
+    def exact_values(self):
+        """All values (float64), or None when they are not kept."""
+        if self._exact is None:
+            return None
+        return np.concatenate(self._exact) if self._exact else np.empty(0)
+
+    def _bin_edges(self, b):
+        """[left, right) of bin b, with the outer bins bounded by the observed min/max."""
+        if b == 0:
+            return self.vmin, min(self.lo, self.vmax)
+        if b == self.n_bins + 1:
+            return max(self.hi, self.vmin), self.vmax
+        left = self.lo + (b - 1) * self.bin_width
+        return max(left, self.vmin), min(left + self.bin_width, self.vmax)
+
+    def _order_stat(self, k, cum):
+        """Estimate of the k-th smallest value (0-based): its bin, evenly spread inside."""
+        if k <= 0:
+            return self.vmin
+        if k >= cum[-1] - 1:
+            return self.vmax
+        b = int(np.searchsorted(cum, k, side="right"))
+        before = cum[b - 1] if b > 0 else 0
+        left, right = self._bin_edges(b)
+        return left + (k - before + 0.5) / self.counts[b] * (right - left)
+
+    def quantile(self, q):
+        """
+        q in [0, 1] (scalar or sequence); same rank convention as np.percentile
+        (linear): interpolated between the floor and ceil order statistics,
+        each estimated within its bin.
+        """
+        n = self.count
+        qs = np.atleast_1d(np.asarray(q, dtype=np.float64))
+        exact = self.exact_values()
+        if n > 0 and exact is not None:
+            out = np.percentile(exact, 100.0 * np.clip(qs, 0.0, 1.0))
+        elif n == 0:
+            out = np.full(qs.shape, np.nan)
+        else:
+            cum = np.cumsum(self.counts)
+            out = np.empty(qs.shape)
+            for i, qi in enumerate(qs):
+                rank = min(max(qi, 0.0), 1.0) * (n - 1)
+                k = int(np.floor(rank))
+                lo = self._order_stat(k, cum)
+                hi = self._order_stat(k + 1, cum) if rank > k else lo
+                out[i] = lo + (rank - k) * (hi - lo)
+        return float(out[0]) if np.ndim(q) == 0 else out
+
+    def percentile(self, p):
+        return self.quantile(np.asarray(p, dtype=np.float64) / 100.0)
+
+    def _bin_index(self, x):
+        return int(np.clip(np.floor((x - self.lo) / self.bin_width) + 1, 0, self.n_bins + 1))
+
+    def lowest_at_least(self, x):
+        """Approximate smallest value >= x (to one bin width)."""
+        if x <= self.vmin:
+            return self.vmin
+        exact = self.exact_values()
+        if exact is not None:
+            return float(exact[exact >= x].min()) if np.any(exact >= x) else np.nan
+        nonempty = np.flatnonzero(self.counts[self._bin_index(x):])
+        if nonempty.size == 0:
+            return np.nan
+        left, _ = self._bin_edges(self._bin_index(x) + int(nonempty[0]))
+        return max(x, left)
+
+    def highest_at_most(self, x):
+        """Approximate largest value <= x (to one bin width)."""
+        if x >= self.vmax:
+            return self.vmax
+        exact = self.exact_values()
+        if exact is not None:
+            return float(exact[exact <= x].max()) if np.any(exact <= x) else np.nan
+        nonempty = np.flatnonzero(self.counts[:self._bin_index(x) + 1])
+        if nonempty.size == 0:
+            return np.nan
+        _, right = self._bin_edges(int(nonempty[-1]))
+        return min(x, right)
+
+    def box_stats(self, label=None, whis=1.5):
+        """
+        One stats dict for matplotlib's Axes.bxp, with the same definitions as
+        plt.boxplot (linear quartiles, whiskers at the last datum within
+        whis * IQR of the box), without fliers.
+        """
+        stats = {"label": label, "fliers": np.empty(0), "n": self.count}
+        if self.count == 0:
+            stats.update(med=np.nan, q1=np.nan, q3=np.nan, whislo=np.nan, whishi=np.nan)
+            return stats
+
+        q1, med, q3 = (float(v) for v in self.quantile([0.25, 0.50, 0.75]))
+        iqr = q3 - q1
+        stats.update(
+            med=med, q1=q1, q3=q3,
+            whislo=min(q1, self.lowest_at_least(q1 - whis * iqr)),
+            whishi=max(q3, self.highest_at_most(q3 + whis * iqr)),
+        )
+        return stats
+
+    def save(self, path):
+        exact = self.exact_values()
+        np.savez(path, lo=self.lo, hi=self.hi, counts=self.counts, vmin=self.vmin, vmax=self.vmax,
+                 exact_max=self.exact_max, has_exact=exact is not None,
+                 exact=exact if exact is not None else np.empty(0))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as z:
+            exact_max = int(z["exact_max"]) if "exact_max" in z.files else 0
+            sk = cls(float(z["lo"]), float(z["hi"]), int(z["counts"].size - 2), exact_max)
+            sk.counts = z["counts"].astype(np.int64)
+            sk.vmin = float(z["vmin"])
+            sk.vmax = float(z["vmax"])
+            if exact_max:
+                sk._exact = [z["exact"].astype(np.float64)] if bool(z["has_exact"]) else None
+        return sk
@@ -0,0 +1,109 @@
+"""
+Compact storage profiles for WTD / z-score / IQR rasters.
+
+The products are float32, but their useful precision is ~1 cm or ~0.01 z,
+so half the bytes on the USB drives are noise. Two optional profiles:
+
+  "int16"   - value = stored * scale + offset, kept as GDAL band scale/offset
+              metadata; -32768 is nodata. e.g. IQR with scale 0.001 covers
+              0..32.7, WTD in metres with scale 0.01 covers +-327 m.
+  "float16" - GTiff Float32 band with NBITS=16: GDAL stores IEEE half floats
+              and hands back float32 on read (~3 significant digits).
+  "float32" - unchanged.
+
+read_decoded() returns float32 with NaN for nodata for any of them (and for
+plain float rasters), so readers do not need to know how a file was stored.
+"""
+
+import os
+
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.windows import Window
+
+STORAGE_KINDS = ("float32", "float16", "int16")
+INT16_NODATA = -32768
+
+
+def storage_profile(profile, kind="float32"):
+    """Copy of a rasterio profile with dtype/nodata (and NBITS) for `kind`."""
+    out = dict(profile)
+    out["count"] = out.get("count", 1)
+    if kind == "float32":
+        out.update(dtype="float32", nodata=np.nan)
+    elif kind == "float16":
+        out.update(dtype="float32", nodata=np.nan, nbits=16)
+    elif kind == "int16":
+        out.update(dtype="int16", nodata=INT16_NODATA)
+    else:
+        raise ValueError(f"Unknown storage kind {kind!r}; use one of {STORAGE_KINDS}")
+    return out
+
+
+def set_scaling(dst, kind, scale=1.0, offset=0.0):
+    """Record scale/offset on an int16 dataset opened for writing."""
+    if kind == "int16":
+        dst.scales = [scale] * dst.count
+        dst.offsets = [offset] * dst.count
+
+
+def encode(arr, kind, scale=1.0, offset=0.0):
+    """float array (NaN = missing) -> array to write for `kind`."""
+    if kind != "int16":
+        return np.asarray(arr, dtype=np.float32)
+    q = np.round((np.asarray(arr, dtype=np.float64) - offset) / scale)
+    bad = ~np.isfinite(q)
+    np.clip(q, -32767, 32767, out=q)
+    q[bad] = INT16_NODATA
+    return q.astype(np.int16)
+
+
+def read_decoded(src, band=1, **read_kwargs):
+    """
+    src.read(band, **read_kwargs) as float32, scale/offset applied,
+    nodata and non-finite values -> NaN. band=None reads every band
+    (a multi-band cube) as (count, rows, cols).
+    """
+    raw = src.read(band, **read_kwargs)
+    out = raw.astype(np.float32)
+    bad = ~np.isfinite(out)
+    if src.nodata is not None and not np.isnan(src.nodata):
+        bad |= raw == src.nodata
+
+    if band is None:
+        scale = np.asarray(src.scales or [1.0] * src.count, dtype=np.float32)[:, None, None]
+        offset = np.asarray(src.offsets or [0.0] * src.count, dtype=np.float32)[:, None, None]
+    else:
+        scale = np.float32(src.scales[band - 1] if src.scales else 1.0)
+        offset = np.float32(src.offsets[band - 1] if src.offsets else 0.0)
+    if np.any(scale != 1.0):
+        out *= scale
+    if np.any(offset != 0.0):
+        out += offset
+
+    out[bad] = np.nan
+    return out
+
+
+def transcode(src_path, dst_path, kind, scale=1.0, offset=0.0, block=None, resampling=Resampling.average,
+              rows_per_window=None):
+    """
+    Rewrite a single-band raster with a storage profile, as a COG with
+    `block` tiles (default COG_BLOCK) and `resampling` overviews (nearest
+    or mode for class maps).
+    """
+    from pwtl.cog import COG_BLOCK, open_cog
+
+    block = block or COG_BLOCK
+    rows_per_window = rows_per_window or block
+    if os.path.dirname(dst_path):
+        os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+    with rasterio.open(src_path) as src:
+        profile = storage_profile(src.profile, kind)
+        with open_cog(dst_path, profile, resampling=resampling, block=block) as dst:
+            set_scaling(dst, kind, scale, offset)
+            for r in range(0, src.height, rows_per_window):
+                win = Window(0, r, src.width, min(rows_per_window, src.height - r))
+                dst.write(encode(read_decoded(src, 1, window=win), kind, scale, offset), 1, window=win)
+    return dst_path
@@ -0,0 +1,103 @@
+"""
+Synthetic stand-ins for the monthly North America archives.
+
+make_monthly_archive() writes N_America_YYYYMM_<variable>.tif files with the
+same naming, tiling and nodata conventions as the real inputs, over a
+lon/lat grid covering North America. A smooth random "continent" mask
+leaves `nan_frac` of the grid as ocean (nodata), so the NaN handling paths
+get exercised as they do along the real coast. make_watersheds() returns
+box-shaped basins over the same grid for zonal statistics.
+"""
+
+import os
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_bounds
+
+NA_BOUNDS = (-170.0, 5.0, -50.0, 85.0)
+NODATA = -9999.0
+
+
+def _continent_mask(height, width, nan_frac, rng):
+    """True on land; smooth blobs from coarse noise upsampled to the grid."""
+    if nan_frac <= 0:
+        return np.ones((height, width), dtype=bool)
+    coarse = rng.standard_normal((max(2, height // 64), max(2, width // 64)))
+    rows = np.linspace(0, coarse.shape[0] - 1, height)
+    cols = np.linspace(0, coarse.shape[1] - 1, width)
+    r0 = np.floor(rows).astype(int)
+    c0 = np.floor(cols).astype(int)
+    r1 = np.minimum(r0 + 1, coarse.shape[0] - 1)
+    c1 = np.minimum(c0 + 1, coarse.shape[1] - 1)
+    fr = (rows - r0)[:, None]
+    fc = (cols - c0)[None, :]
+    field = (coarse[r0][:, c0] * (1 - fr) * (1 - fc) + coarse[r1][:, c0] * fr * (1 - fc)
+             + coarse[r0][:, c1] * (1 - fr) * fc + coarse[r1][:, c1] * fr * fc)
+    return field > np.quantile(field, nan_frac)
+
+
+def month_keys(start_yyyymm, n_months):
+    y, m = divmod(int(start_yyyymm), 100)
+    keys = []
+    for _ in range(n_months):
+        keys.append(f"{y:04d}{m:02d}")
+        m += 1
+        if m > 12:
+            y, m = y + 1, 1
+    return keys
+
+
+def make_monthly_archive(out_dir, width, height, n_months, variables=("wtd",),
+                         start_yyyymm=200001, nan_frac=0.35, block=512, seed=0,
+                         bounds=NA_BOUNDS):
+    """
+    Write n_months x len(variables) float32 GeoTIFFs into out_dir.
+    Each pixel is a seasonal cycle + trend + noise, so z-scores, rolling
+    sums and correlations have realistic spread.
+    Returns {variable: [(yyyymm, path), ...]}; existing files are reused.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    land = _continent_mask(height, width, nan_frac, rng)
+
+    profile = dict(
+        driver="GTiff", width=width, height=height, count=1, dtype="float32",
+        crs="EPSG:4326", transform=from_bounds(*bounds, width, height),
+        nodata=NODATA, tiled=True, blockxsize=block, blockysize=block, compress="deflate",
+    )
+
+    amp = rng.uniform(0.5, 2.0, size=(height, width)).astype(np.float32)
+    base = rng.uniform(-10.0, 10.0, size=(height, width)).astype(np.float32)
+    trend = rng.normal(0.0, 0.01, size=(height, width)).astype(np.float32)
+
+    out = {v: [] for v in variables}
+    for t, key in enumerate(month_keys(start_yyyymm, n_months)):
+        phase = 2.0 * np.pi * (int(key[4:6]) - 1) / 12.0
+        for vi, var in enumerate(variables):
+            path = os.path.join(out_dir, f"N_America_{key}_{var}.tif")
+            out[var].append((key, path))
+            if os.path.exists(path):
+                continue
+            a = base + amp * np.sin(phase + vi) + trend * t
+            a += rng.standard_normal((height, width)).astype(np.float32)
+            a[~land] = NODATA
+            with rasterio.open(path, "w", **profile) as dst:
+                dst.write(a.astype(np.float32), 1)
+    return out
+
+
+def make_watersheds(n_cols=8, n_rows=5, bounds=NA_BOUNDS, crs="EPSG:4326"):
+    """GeoDataFrame of n_cols x n_rows box basins with a `name` column."""
+    import geopandas as gpd
+    from shapely.geometry import box
+
+    xmin, ymin, xmax, ymax = bounds
+    xs = np.linspace(xmin, xmax, n_cols + 1)
+    ys = np.linspace(ymin, ymax, n_rows + 1)
+    geoms, names = [], []
+    for i in range(n_rows):
+        for j in range(n_cols):
+            geoms.append(box(xs[j], ys[i], xs[j + 1], ys[i + 1]))
+            names.append(f"basin_{i}_{j}")
+    return gpd.GeoDataFrame({"name": names}, geometry=geoms, crs=crs)
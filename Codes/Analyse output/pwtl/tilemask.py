@@ -0,0 +1,114 @@
+"""
+Inside-boundary masks per block window, rasterized once and cached on disk.
+
+The boundary never changes between years or passes, so the mask for a
+(grid, geometry, block size) triple is built once, stored as row-packed bits
+(np.packbits, 1/8 of a bool array) and reopened memory-mapped on later runs.
+A small per-tile state table records which windows are fully outside the
+boundary; callers skip those without opening any raster.
+"""
+
+import hashlib
+import os
+
+import numpy as np
+from rasterio.features import geometry_mask
+from rasterio.windows import Window, transform as window_transform
+
+TILE_OUTSIDE = 0
+TILE_PARTIAL = 1
+TILE_INSIDE = 2
+
+
+def _mask_key(shapes, width, height, transform, block, crs):
+    h = hashlib.sha1()
+    h.update(repr((int(width), int(height), tuple(transform)[:6], int(block),
+                   crs.to_string() if crs is not None else None)).encode())
+    for geom in shapes:
+        h.update(geom.wkb)
+    return h.hexdigest()[:16]
+
+
+class TileMaskCache:
+    def __init__(self, shapes, width, height, transform, block, crs=None, cache_dir=None, tag="inside"):
+        if block % 8:
+            raise ValueError("block must be a multiple of 8 for packed-bit masks")
+        shapes = [g for g in shapes if g is not None and not g.is_empty]
+
+        self.width, self.height = int(width), int(height)
+        self.transform = transform
+        self.block = int(block)
+        self.n_tile_rows = -(-self.height // self.block)
+        self.n_tile_cols = -(-self.width // self.block)
+
+        key = _mask_key(shapes, width, height, transform, block, crs)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            bits_path = os.path.join(cache_dir, f"{tag}_{key}_bits.npy")
+            tiles_path = os.path.join(cache_dir, f"{tag}_{key}_tiles.npy")
+            if os.path.exists(bits_path) and os.path.exists(tiles_path):
+                self.bits = np.load(bits_path, mmap_mode="r")
+                self.tiles = np.load(tiles_path)
+                return
+        else:
+            bits_path = tiles_path = None
+
+        self.bits, self.tiles = self._build(shapes, bits_path)
+        if tiles_path:
+            self.bits.flush()
+            tmp = tiles_path + ".tmp.npy"
+            np.save(tmp, self.tiles)
+            os.replace(tmp, tiles_path)
+
+    def _build(self, shapes, bits_path):
+        packed_shape = (self.height, -(-self.width // 8))
+        if bits_path:
+            bits = np.lib.format.open_memmap(bits_path, mode="w+", dtype=np.uint8, shape=packed_shape)
+        else:
+            bits = np.zeros(packed_shape, dtype=np.uint8)
+        tiles = np.zeros((self.n_tile_rows, self.n_tile_cols), dtype=np.int8)
+
+        for win in self.all_windows():
+            inside = geometry_mask(
+                shapes,
+                out_shape=(int(win.height), int(win.width)),
+                transform=window_transform(win, self.transform),
+                invert=True,
+                all_touched=False
+            )
+            r0, c0 = int(win.row_off), int(win.col_off)
+            bits[r0:r0 + inside.shape[0], c0 // 8:c0 // 8 + -(-inside.shape[1] // 8)] = np.packbits(inside, axis=1)
+
+            n_in = np.count_nonzero(inside)
+            state = TILE_OUTSIDE if n_in == 0 else (TILE_INSIDE if n_in == inside.size else TILE_PARTIAL)
+            tiles[r0 // self.block, c0 // self.block] = state
+
+        return bits, tiles
+
+    def all_windows(self):
+        for r in range(0, self.height, self.block):
+            h = min(self.block, self.height - r)
+            for c in range(0, self.width, self.block):
+                w = min(self.block, self.width - c)
+                yield Window(c, r, w, h)
+
+    def state(self, win):
+        return int(self.tiles[int(win.row_off) // self.block, int(win.col_off) // self.block])
+
+    def is_outside(self, win):
+        return self.state(win) == TILE_OUTSIDE
+
+    def window_mask(self, win):
+        """Boolean array, True for pixels INSIDE the boundary."""
+        r0, c0 = int(win.row_off), int(win.col_off)
+        h, w = int(win.height), int(win.width)
+        if self.state(win) == TILE_INSIDE:
+            return np.ones((h, w), dtype=bool)
+        packed = self.bits[r0:r0 + h, c0 // 8:c0 // 8 + -(-w // 8)]
+        return np.unpackbits(packed, axis=1)[:, :w].astype(bool)
+
+    def summary(self):
+        n = self.tiles.size
+        n_out = int(np.count_nonzero(self.tiles == TILE_OUTSIDE))
+        n_in = int(np.count_nonzero(self.tiles == TILE_INSIDE))
+        return f"{n} tiles: {n_out} outside (skipped), {n_in} fully inside, {n - n_out - n_in} on the boundary"
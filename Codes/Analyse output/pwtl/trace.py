@@ -0,0 +1,208 @@
+"""
+Per-stage timing and I/O counters for the pipeline scripts.
+
+    TRACE = Tracer("IQR")
+    with TRACE.stage("baseline pass"):
+        ...
+    TRACE.begin("rendering")          # module-level scripts: ends the previous begin()
+    ...
+    TRACE.finish(TRACE_DIR, chrome=True)
+
+Each stage records wall time, CPU time (user + system of this process),
+bytes read/written (/proc/self/io: storage-level read_bytes/write_bytes and
+rchar/wchar, which include page-cache hits), files opened (Python open()
+plus rasterio.open) and the peak RSS reached so far. A stage whose CPU time
+is far below its wall time is waiting on I/O. finish() writes a JSON trace
+and, optionally, a Chrome trace (chrome://tracing, ui.perfetto.dev).
+
+Everything is a few syscalls per stage boundary, cheap enough to leave on.
+"""
+
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_ACTIVE = []          # tracers counting file opens
+_HOOKED = False
+
+
+def _audit_hook(event, args):
+    if event == "open" and _ACTIVE:
+        for t in _ACTIVE:
+            t.files_opened += 1
+
+
+def _count_rasterio_opens():
+    try:
+        import rasterio
+    except ImportError:
+        return
+    if getattr(rasterio.open, "_pwtl_counted", False):
+        return
+    _open = rasterio.open
+
+    def counted_open(*args, **kwargs):
+        for t in _ACTIVE:
+            t.files_opened += 1
+        return _open(*args, **kwargs)
+
+    counted_open._pwtl_counted = True
+    counted_open.__wrapped__ = _open
+    counted_open.__doc__ = _open.__doc__
+    rasterio.open = counted_open
+
+
+def _proc_io():
+    """Cumulative I/O counters of this process, {} where unavailable."""
+    try:
+        with open("/proc/self/io", "rb") as f:
+            raw = f.read().decode()
+    except OSError:
+        return {}
+    finally:
+        # do not count our own open
+        for t in _ACTIVE:
+            t.files_opened -= 1
+    out = {}
+    for line in raw.splitlines():
+        key, _, val = line.partition(":")
+        if key in ("rchar", "wchar", "read_bytes", "write_bytes"):
+            out[key] = int(val)
+    return out
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 1024.0 ** 2 if sys.platform == "darwin" else peak / 1024.0
+
+
+class Tracer:
+    def __init__(self, name):
+        global _HOOKED
+        self.name = name
+        self.t0 = time.perf_counter()
+        self.started = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.files_opened = 0
+        self.stages = []
+        self._stack = []
+        self._begun = None
+
+        if not _HOOKED:
+            sys.addaudithook(_audit_hook)
+            _HOOKED = True
+        _count_rasterio_opens()
+        _ACTIVE.append(self)
+
+    def _snapshot(self):
+        return {
+            "wall": time.perf_counter(),
+            "cpu": time.process_time(),
+            "io": _proc_io(),
+            "files": self.files_opened,
+        }
+
+    def _open(self, name):
+        self._stack.append((name, self._snapshot()))
+
+    def _close(self):
+        name, a = self._stack.pop()
+        b = self._snapshot()
+        rec = {
+            "stage": name,
+            "depth": len(self._stack),
+            "start_s": a["wall"] - self.t0,
+            "wall_s": b["wall"] - a["wall"],
+            "cpu_s": b["cpu"] - a["cpu"],
+            "files_opened": b["files"] - a["files"],
+            "peak_rss_mb": _peak_rss_mb(),
+        }
+        for key in ("read_bytes", "write_bytes", "rchar", "wchar"):
+            if key in a["io"] and key in b["io"]:
+                rec[key] = b["io"][key] - a["io"][key]
+        rec["cpu_fraction"] = rec["cpu_s"] / rec["wall_s"] if rec["wall_s"] > 0 else None
+        self.stages.append(rec)
+        return rec
+
+    @contextmanager
+    def stage(self, name):
+        self._open(name)
+        try:
+            yield self
+        finally:
+            self._close()
+
+    def begin(self, name):
+        """Start a top-level stage, ending the one started by the previous begin()."""
+        self.end()
+        self._open(name)
+        self._begun = len(self._stack)
+
+    def end(self):
+        if self._begun is not None:
+            while len(self._stack) >= self._begun:
+                self._close()
+            self._begun = None
+
+    def summary(self):
+        lines = [f"{'stage':<32} {'wall s':>9} {'cpu s':>9} {'cpu%':>5} {'read MB':>9} {'write MB':>9} {'files':>6} {'RSS MB':>8}"]
+        for s in sorted(self.stages, key=lambda s: s["start_s"]):
+            pct = f"{100 * s['cpu_fraction']:.0f}" if s["cpu_fraction"] is not None else "-"
+            rd = s.get("read_bytes", s.get("rchar"))
+            wr = s.get("write_bytes", s.get("wchar"))
+            lines.append(
+                f"{'  ' * s['depth'] + s['stage']:<32} {s['wall_s']:>9.2f} {s['cpu_s']:>9.2f} {pct:>5} "
+                f"{(rd or 0) / 1e6:>9.1f} {(wr or 0) / 1e6:>9.1f} {s['files_opened']:>6} "
+                f"{s['peak_rss_mb'] or 0:>8.0f}"
+            )
+        return "\n".join(lines)
+
+    def chrome_events(self):
+        pid = os.getpid()
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": self.name}}]
+        for s in self.stages:
+            args = {k: v for k, v in s.items() if k not in ("stage", "depth", "start_s", "wall_s")}
+            events.append({
+                "name": s["stage"], "cat": self.name, "ph": "X", "pid": pid, "tid": 0,
+                "ts": s["start_s"] * 1e6, "dur": s["wall_s"] * 1e6, "args": args,
+            })
+        return events
+
+    def finish(self, out_dir, chrome=False, print_summary=True):
+        """Close open stages, write <name>_trace.json (+ .chrome.json). Returns the JSON path."""
+        self.end()
+        while self._stack:
+            self._close()
+        if self in _ACTIVE:
+            _ACTIVE.remove(self)
+
+        os.makedirs(out_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d_%H%M%S")
+        base = os.path.join(out_dir, f"{self.name}_{stamp}_trace")
+        doc = {
+            "script": self.name,
+            "started": self.started,
+            "total_wall_s": time.perf_counter() - self.t0,
+            "peak_rss_mb": _peak_rss_mb(),
+            "argv": sys.argv,
+            "stages": sorted(self.stages, key=lambda s: s["start_s"]),
+        }
+        with open(base + ".json", "w") as f:
+            json.dump(doc, f, indent=2)
+        if chrome:
+            with open(base + ".chrome.json", "w") as f:
+                json.dump({"traceEvents": self.chrome_events(), "displayTimeUnit": "ms"}, f)
+
+        if print_summary:
+            print("\n" + self.summary())
+            print(f"Trace: {base}.json" + (" (+ .chrome.json)" if chrome else ""))
+        return base + ".json"
@@ -0,0 +1,183 @@
+"""
+Per-pixel linear trends without the full time stack in memory.
+
+OLSTrend keeps running sums per pixel (n, sum t, sum t^2, sum y, sum ty,
+sum y^2) and is fed one time step at a time, so a window of the grid needs
+six arrays however long the series. result() gives the OLS slope with its
+standard error and confidence interval (Student t, n - 2 dof per pixel),
+the same statistics linear_trend_with_ci in the "average *" scripts
+computes for one regional series:
+
+    ols = OLSTrend(win_shape, t_ref=1945)
+    for year, y in annual_maps:          # NaN = missing, skipped per pixel
+        ols.update(year, y)
+    res = ols.result(conf=0.95)          # res.slope, res.ci_low, res.ci_high, ...
+
+Times are centred on t_ref (e.g. the middle of the period) before they are
+summed, which keeps sum t^2 - (sum t)^2 / n well conditioned in float64.
+
+theil_sen_slope() is the robust alternative: the median of all pairwise
+slopes, on a time-major (T, rows, cols) chunk. The T(T-1)/2 pair slopes
+are formed for a slice of pixels at a time, sized to max_bytes.
+
+mann_kendall() tests the same chunk for a monotonic trend: the S statistic
+(sum of the pairwise signs), its variance with the tie correction and the
+two-sided p-value of the normal approximation. It loops over the T time
+steps, not over pixels: step i adds the signs of y[i+1:] - y[i] for a whole
+slice of pixels at once.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+from scipy.stats import norm, t as student_t
+
+from pwtl.quantiles import nan_quantiles
+
+# memory for the pairwise slopes / signs of one Theil-Sen or Mann-Kendall pixel slice
+PAIRWISE_MAX_BYTES = 256 * 1024 ** 2
+
+TrendResult = namedtuple("TrendResult", ["slope", "ci_low", "ci_high", "stderr", "intercept", "n"])
+MKResult = namedtuple("MKResult", ["s", "var_s", "z", "p", "n"])
+
+
+def t_critical(n, conf=0.95):
+    """Two-sided Student t quantile for n - 2 dof, per pixel (NaN where n < 3)."""
+    n = np.asarray(n)
+    out = np.full(n.shape, np.nan)
+    for k in np.unique(n[n >= 3]):
+        out[n == k] = student_t.ppf(0.5 + conf / 2.0, df=k - 2)
+    return out
+
+
+class OLSTrend:
+    def __init__(self, shape, t_ref=0.0):
+        self.t_ref = float(t_ref)
+        self.n = np.zeros(shape, dtype=np.int32)
+        self.st = np.zeros(shape, dtype=np.float64)
+        self.stt = np.zeros(shape, dtype=np.float64)
+        self.sy = np.zeros(shape, dtype=np.float64)
+        self.sty = np.zeros(shape, dtype=np.float64)
+        self.syy = np.zeros(shape, dtype=np.float64)
+
+    def update(self, t, y):
+        """Add time step `t` (scalar) with values `y` (NaN = missing)."""
+        m = np.isfinite(y)
+        if not np.any(m):
+            return
+        tc = float(t) - self.t_ref
+        yv = y[m].astype(np.float64)
+        self.n[m] += 1
+        self.st[m] += tc
+        self.stt[m] += tc * tc
+        self.sy[m] += yv
+        self.sty[m] += tc * yv
+        self.syy[m] += yv * yv
+
+    def result(self, conf=0.95, min_n=3):
+        """
+        TrendResult of float32 maps: slope per unit t, CI bounds at `conf`,
+        stderr of the slope, intercept at t_ref, and n used. NaN where
+        n < min_n (at least 3) or t does not vary.
+        """
+        n = self.n.astype(np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            sxx = self.stt - self.st * self.st / n
+            sxy = self.sty - self.st * self.sy / n
+            syy = self.syy - self.sy * self.sy / n
+            slope = sxy / sxx
+            intercept = (self.sy - slope * self.st) / n
+            sse = np.maximum(syy - slope * sxy, 0.0)
+            stderr = np.sqrt(sse / (n - 2) / sxx)
+            half = t_critical(self.n, conf) * stderr
+
+        bad = (self.n < max(3, min_n)) | ~(sxx > 0)
+        out = []
+        for a in (slope, slope - half, slope + half, stderr, intercept):
+            a = a.astype(np.float32)
+            a[bad] = np.nan
+            out.append(a)
+        return TrendResult(*out, n=self.n.copy())
+
+
+def theil_sen_slope(stack, t, max_bytes=PAIRWISE_MAX_BYTES, min_n=3):
+    """
+    Median of the pairwise slopes (y_j - y_i) / (t_j - t_i), i < j, per
+    pixel of a time-major (T, ...) stack; pairs with a missing value are
+    skipped. NaN where fewer than min_n valid time steps.
+    """
+    stack = np.asarray(stack)
+    t = np.asarray(t, dtype=np.float64)
+    n_t = stack.shape[0]
+    if t.shape != (n_t,):
+        raise ValueError(f"{t.size} times for a stack of {n_t} steps")
+
+    y = stack.reshape(n_t, -1).astype(np.float32, copy=False)
+    i, j = np.triu_indices(n_t, k=1)
+    dt = (t[j] - t[i]).astype(np.float32)[:, None]
+
+    out = np.full(y.shape[1], np.nan, dtype=np.float32)
+    if i.size == 0:
+        return out.reshape(stack.shape[1:])
+    # y[j], y[i] and the slopes: three (pairs, slice) float32 arrays
+    step = max(1, int(max_bytes // (3 * 4 * i.size)))
+    for p0 in range(0, y.shape[1], step):
+        yc = y[:, p0:p0 + step]
+        slopes = (yc[j] - yc[i]) / dt
+        out[p0:p0 + step] = nan_quantiles(slopes, (0.5,), overwrite_input=True)[0]
+
+    out[np.count_nonzero(np.isfinite(y), axis=0) < max(2, min_n)] = np.nan
+    return out.reshape(stack.shape[1:])
+
+
+def _tie_sum(y):
+    """Sum of t(t-1)(2t+5) over the groups of tied values, per column of (T, P) `y`."""
+    ys = np.sort(y, axis=0)                      # NaN last, never tied (NaN != NaN)
+    out = np.zeros(y.shape[1], dtype=np.float64)
+    run = np.ones(y.shape[1], dtype=np.float64)
+    for k in range(1, ys.shape[0]):
+        tied = ys[k] == ys[k - 1]
+        done = ~tied & (run > 1)
+        out[done] += run[done] * (run[done] - 1) * (2 * run[done] + 5)
+        run = np.where(tied, run + 1, 1.0)
+    return out + run * (run - 1) * (2 * run + 5)
+
+
+def mann_kendall(stack, max_bytes=PAIRWISE_MAX_BYTES, min_n=3):
+    """
+    Mann-Kendall trend test per pixel of a time-major (T, ...) stack in time
+    order; pairs with a missing value are skipped. MKResult of float32 maps
+    (S, var(S) with the tie correction, Z, two-sided p) and n used. NaN
+    where fewer than min_n valid time steps.
+    """
+    stack = np.asarray(stack)
+    n_t = stack.shape[0]
+    y = stack.reshape(n_t, -1).astype(np.float32, copy=False)
+    n_px = y.shape[1]
+
+    s = np.zeros(n_px, dtype=np.float64)
+    ties = np.zeros(n_px, dtype=np.float64)
+    # y[i+1:] - y[i], its signs and the sorted copy for the ties: three (T, slice) float32 arrays
+    step = max(1, int(max_bytes // (3 * 4 * max(n_t, 1))))
+    for p0 in range(0, n_px, step):
+        yc = y[:, p0:p0 + step]
+        acc = np.zeros(yc.shape[1], dtype=np.float64)
+        for i in range(n_t - 1):
+            acc += np.nansum(np.sign(yc[i + 1:] - yc[i]), axis=0)
+        s[p0:p0 + step] = acc
+        ties[p0:p0 + step] = _tie_sum(yc)
+
+    n_valid = np.count_nonzero(np.isfinite(y), axis=0)
+    n = n_valid.astype(np.float64)
+    var_s = (n * (n - 1) * (2 * n + 5) - ties) / 18.0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = np.where(var_s > 0, (s - np.sign(s)) / np.sqrt(var_s), 0.0)
+    p = 2.0 * norm.sf(np.abs(z))
+
+    bad = n_valid < max(3, min_n)
+    out = []
+    for a in (s, var_s, z, p):
+        a = a.astype(np.float32)
+        a[bad] = np.nan
+        out.append(a.reshape(stack.shape[1:]))
+    return MKResult(*out, n=n_valid.astype(np.int32).reshape(stack.shape[1:]))
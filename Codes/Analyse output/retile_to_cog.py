@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Re-tile GeoTIFF archives as Cloud-Optimized GeoTIFFs.
+
+The monthly N_America_YYYYMM_*.tif inputs may be striped; every windowed
+read in the analysis scripts then decodes whole strips. This converts a
+folder (e.g. the WTD, precipitation or evaporation archive) to internally
+tiled 512x512 COGs with a predictor, multi-threaded deflate and overview
+pyramids. Files that are already tiled with overviews are skipped.
+
+Examples:
+  python retile_to_cog.py "/media/mohammad/My Book/WTM_Result/Monthly/3" --out_dir /media/mohammad/fast/WTD_cog
+  python retile_to_cog.py /home/mohammad/Desktop/1 --pattern "IQR_*_????.tif"      # in place
+  python retile_to_cog.py /home/mohammad/Desktop/1 --pattern "IQR_*_????.tif" --storage int16 --scale 0.001
+
+--storage float16/int16 also re-encodes the values (see pwtl/storage.py);
+readers using pwtl.storage.read_decoded get the same float32 back.
+"""
+
+import os
+import glob
+import time
+import argparse
+
+from rasterio.enums import Resampling
+
+from pwtl.cog import COG_BLOCK, convert_to_cog, is_cog_like
+from pwtl.storage import STORAGE_KINDS, transcode
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("in_dir", help="Folder with GeoTIFFs")
+    ap.add_argument("--pattern", default="N_America_*.tif", help="Glob inside in_dir")
+    ap.add_argument("--out_dir", default=None, help="Write COGs here (default: replace files in place)")
+    ap.add_argument("--resampling", default="average", choices=["average", "nearest", "mode", "bilinear"],
+                    help="Overview resampling (use nearest/mode for class maps)")
+    ap.add_argument("--block", type=int, default=COG_BLOCK, help="Tile size")
+    ap.add_argument("--storage", default=None, choices=STORAGE_KINDS,
+                    help="Re-encode single-band float rasters (default: keep the data type)")
+    ap.add_argument("--scale", type=float, default=0.01, help="int16 storage: value = stored * scale + offset")
+    ap.add_argument("--offset", type=float, default=0.0, help="int16 storage offset")
+    ap.add_argument("--force", action="store_true", help="Convert even if a file already looks like a COG")
+    ap.add_argument("--dry_run", action="store_true", help="Only list what would be converted")
+    args = ap.parse_args()
+
+    files = sorted(glob.glob(os.path.join(args.in_dir, args.pattern)))
+    if not files:
+        raise SystemExit(f"No files matching {args.pattern} in {args.in_dir}")
+
+    resampling = Resampling[args.resampling]
+    print(f"{len(files)} files, writing {'in place' if not args.out_dir else 'to ' + args.out_dir}")
+
+    done = skipped = 0
+    t0 = time.perf_counter()
+    for i, src in enumerate(files, 1):
+        dst = os.path.join(args.out_dir, os.path.basename(src)) if args.out_dir else src
+
+        if not args.force and not args.storage and os.path.exists(dst) and is_cog_like(dst, args.block):
+            skipped += 1
+            continue
+        if args.dry_run:
+            print(f"  would convert: {src}")
+            continue
+
+        size_in = os.path.getsize(src)
+        if args.storage:
+            transcode(src, dst, args.storage, args.scale, args.offset, block=args.block, resampling=resampling)
+        else:
+            convert_to_cog(src, dst, resampling=resampling, block=args.block)
+        done += 1
+        print(f"  [{i}/{len(files)}] {os.path.basename(src)}: "
+              f"{size_in / 1e6:.0f} MB -> {os.path.getsize(dst) / 1e6:.0f} MB")
+
+    print(f"\nConverted {done}, skipped {skipped} (already COG) in {time.perf_counter() - t0:.0f} s")
+
+
+if __name__ == "__main__":
+    main()
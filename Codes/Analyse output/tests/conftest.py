@@ -0,0 +1,24 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS = os.path.dirname(HERE)
+
+# the scripts import pwtl from their own folder
+sys.path.insert(0, SCRIPTS)
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+
+@pytest.fixture
+def load_script():
+    """Import an analysis script (file names have spaces/dashes) as a module."""
+    def load(filename):
+        name = "script_" + "".join(c if c.isalnum() else "_" for c in filename[:-3])
+        spec = importlib.util.spec_from_file_location(name, os.path.join(SCRIPTS, filename))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+    return load
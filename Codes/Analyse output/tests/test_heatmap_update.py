@@ -0,0 +1,43 @@
+import json
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("rasterio")
+pytest.importorskip("matplotlib")
+
+from pwtl.synthetic import make_monthly_archive
+
+
+def run_main(module, monkeypatch, *argv):
+    monkeypatch.setattr(sys, "argv", ["heatmap P-ET.py", *argv])
+    module.main()
+
+
+def test_full_pass_then_update(tmp_path, monkeypatch, load_script):
+    heatmap = load_script("heatmap P-ET.py")
+    wtd_dir = str(tmp_path / "wtd")
+    out_dir = str(tmp_path / "out")
+    args = ["--wtd_dir", wtd_dir, "--out_dir", out_dir, "--baseline_start", "2000",
+            "--baseline_end", "2001", "--block_size", "32", "--dpi", "50"]
+
+    make_monthly_archive(wtd_dir, 64, 48, n_months=36, block=16)
+    run_main(heatmap, monkeypatch, *args)
+
+    meta_path = os.path.join(out_dir, "state", "wtd_dominance", "state.json")
+    with open(meta_path) as f:
+        meta = json.load(f)
+    assert meta["last"] == "200212" and not meta["dirty"]
+    assert all(isinstance(v, int) for c in meta["counts"].values() for v in c)
+
+    # one new month after the baseline
+    make_monthly_archive(wtd_dir, 64, 48, n_months=37, block=16)
+    run_main(heatmap, monkeypatch, *args, "--update")
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+    assert meta["last"] == "200301" and not meta["dirty"]
+    wet, dry, tot = meta["counts"]["200301"]
+    assert tot > 0 and wet + dry <= tot
+    assert os.path.exists(os.path.join(out_dir, "wtd_wet_dry_dominance_heatmap.png"))
@@ -0,0 +1,46 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+rasterio = pytest.importorskip("rasterio")
+shapely_geometry = pytest.importorskip("shapely.geometry")
+
+from rasterio.transform import from_bounds
+
+from pwtl.landcover import reclassify_landcover
+from pwtl.preview import open_raster, set_preview_factor
+
+
+@pytest.fixture
+def landcover_tif(tmp_path):
+    path = str(tmp_path / "landcover.tif")
+    width, height = 101, 77
+    classes = np.random.default_rng(0).integers(0, 20, size=(height, width), dtype=np.uint8)
+    profile = dict(driver="GTiff", width=width, height=height, count=1, dtype="uint8",
+                   crs="EPSG:4326", transform=from_bounds(-130, 20, -60, 60, width, height), nodata=0)
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(classes, 1)
+    return path
+
+
+@pytest.mark.parametrize("factor", [1, 4])
+def test_grouped_raster_on_open_raster_grid(tmp_path, landcover_tif, factor):
+    """The TWSA-WTDA agreement panel c reprojects WTD onto open_raster(LANDCOVER_TIF)'s grid."""
+    set_preview_factor(factor)
+    try:
+        grouped_path = str(tmp_path / f"grouped_x{factor}.tif")
+        reclassify_landcover(
+            landcover_tif, [shapely_geometry.box(-120, 25, -70, 55)], grouped_path,
+            group_classes={1: [1, 2], 2: [3, 4], 3: list(range(5, 20))}, grouped_nodata=255
+        )
+        with open_raster(landcover_tif) as lc_src:
+            lc_shape, lc_transform = (lc_src.height, lc_src.width), lc_src.transform
+        with rasterio.open(grouped_path) as grouped_src:
+            grouped = grouped_src.read(1)
+            assert grouped_src.transform.almost_equals(lc_transform)
+    finally:
+        set_preview_factor(1)
+
+    assert grouped.shape == lc_shape
+    wtd_diff = np.zeros(lc_shape, dtype=np.float32)
+    wtd_diff[grouped == 255] = np.nan
+    assert np.isnan(wtd_diff).any() and np.isfinite(wtd_diff).any()
@@ -0,0 +1,40 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from pwtl.sketch import HistogramSketch
+
+
+@pytest.mark.parametrize("n", [1, 2, 3, 5, 7, 20, 1000])
+def test_quantile_small_n_matches_percentile(n):
+    rng = np.random.default_rng(n)
+    values = rng.uniform(-1.0, 1.0, size=n)
+    sketch = HistogramSketch(-1.0, 1.0, n_bins=4000).update(values)
+
+    qs = [0.0, 0.05, 0.25, 0.5, 0.75, 0.95, 1.0]
+    expected = np.percentile(values, [100 * q for q in qs])
+    np.testing.assert_allclose(sketch.quantile(qs), expected, rtol=0, atol=sketch.bin_width)
+
+
+def test_quantile_merged_equals_single():
+    rng = np.random.default_rng(0)
+    a, b = rng.normal(size=50), rng.normal(size=70)
+    merged = HistogramSketch(-5, 5, 2000).update(a).merge(HistogramSketch(-5, 5, 2000).update(b))
+    single = HistogramSketch(-5, 5, 2000).update(np.concatenate([a, b]))
+    np.testing.assert_allclose(merged.quantile([0.25, 0.5, 0.75]), single.quantile([0.25, 0.5, 0.75]))
+
+
+def test_box_stats_exact_for_small_groups(tmp_path):
+    rng = np.random.default_rng(1)
+    values = rng.uniform(-1.0, 1.0, size=9)
+    sketch = HistogramSketch(-1.0, 1.0, n_bins=4000, exact_max=100)
+    sketch.update(values[:4]).update(values[4:])
+    path = str(tmp_path / "s.npz")
+    sketch.save(path)
+    stats = HistogramSketch.load(path).box_stats()
+
+    q1, med, q3 = np.percentile(values, [25, 50, 75])
+    assert (stats["q1"], stats["med"], stats["q3"]) == pytest.approx((q1, med, q3))
+    lo = values[values >= q1 - 1.5 * (q3 - q1)].min()
+    hi = values[values <= q3 + 1.5 * (q3 - q1)].max()
+    assert (stats["whislo"], stats["whishi"]) == pytest.approx((lo, hi))
@@ -0,0 +1,44 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+
+from pwtl.spi import fit_loglogistic, standardize
+
+
+def calendar(years):
+    return np.tile(np.arange(1, 13), years)
+
+
+@pytest.mark.parametrize("years", [26, 40])
+@pytest.mark.parametrize("dist, sample", [
+    ("gamma", lambda rng, shape: rng.gamma(2.0, 30.0, shape)),
+    ("loglogistic", lambda rng, shape: rng.gamma(2.0, 30.0, shape)),
+    ("loglogistic", lambda rng, shape: rng.normal(0.0, 50.0, shape)),
+    ("loglogistic", lambda rng, shape: -rng.gamma(2.0, 30.0, shape)),
+])
+def test_index_close_to_standard_normal(years, dist, sample):
+    rng = np.random.default_rng(years)
+    x = sample(rng, (12 * years, 30, 30))
+    unfit = np.zeros((30, 30), dtype=bool)
+    z = standardize(x, calendar(years), dist, unfit=unfit)
+
+    assert not unfit.any() and np.isfinite(z).all()
+    assert abs(z.mean()) < 0.05 and abs(z.std() - 1) < 0.05
+    # the log-logistic only approximates the skewed gamma(2) tails (~0.1 in z at the deciles)
+    np.testing.assert_allclose(np.percentile(z, [10, 50, 90]), [-1.2816, 0.0, 1.2816], atol=0.12)
+
+
+@pytest.mark.parametrize("k", [-0.3, 0.0, 0.25])
+def test_loglogistic_recovers_generalized_logistic(k):
+    f = np.random.default_rng(1).uniform(size=(100000, 1))
+    x = 10 + 3 * np.log(f / (1 - f)) if k == 0 else 10 + 3 / k * (1 - ((1 - f) / f) ** k)
+    xi, alpha, shape = fit_loglogistic(x)
+    np.testing.assert_allclose([xi[0], alpha[0], shape[0]], [10, 3, k], atol=0.03)
+
+
+def test_short_calibration_is_nan_not_unfit():
+    x = np.random.default_rng(0).normal(size=(12 * 5, 4, 4))
+    unfit = np.zeros((4, 4), dtype=bool)
+    z = standardize(x, calendar(5), "loglogistic", unfit=unfit)
+    assert np.isnan(z).all() and not unfit.any()
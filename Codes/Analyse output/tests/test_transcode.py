@@ -0,0 +1,28 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+rasterio = pytest.importorskip("rasterio")
+
+from rasterio.enums import Resampling
+from rasterio.transform import from_origin
+
+from pwtl.storage import read_decoded, transcode
+
+
+def test_transcode_keeps_block_and_overview_resampling(tmp_path):
+    src_path, dst_path = str(tmp_path / "classes.tif"), str(tmp_path / "classes_int16.tif")
+    classes = np.random.default_rng(0).choice([1.0, 5.0], size=(700, 900)).astype(np.float32)
+    profile = dict(driver="GTiff", width=900, height=700, count=1, dtype="float32",
+                   crs="EPSG:4326", transform=from_origin(-130, 60, 0.01, 0.01), nodata=np.nan)
+    with rasterio.open(src_path, "w", **profile) as dst:
+        dst.write(classes, 1)
+
+    transcode(src_path, dst_path, "int16", scale=1.0, block=256, resampling=Resampling.nearest)
+
+    with rasterio.open(dst_path) as src:
+        assert src.block_shapes[0] == (256, 256)
+        assert src.overviews(1)
+        np.testing.assert_array_equal(read_decoded(src, 1), classes)
+        ovr = read_decoded(src, 1, out_shape=(src.height // src.overviews(1)[0], src.width // src.overviews(1)[0]))
+    # nearest overviews keep the class values; average would mix them
+    assert set(np.unique(ovr)) <= {1.0, 5.0}
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Per-pixel trend maps of WTD (1875-2015) and P-E (2000-2025).
+
+Each pixel's series (annual means, or the monthly values with --series
+monthly) gets the OLS slope with its confidence interval (what
+linear_trend_with_ci in the "average *" scripts does for the regional mean
+series), the Theil-Sen slope and the Mann-Kendall test. The monthly rasters
+are streamed window by window: the OLS fit only keeps running sums per
+pixel (pwtl/trend.py); Theil-Sen and Mann-Kendall need the window's series
+stack (steps x window), never the full time stack of the grid.
+
+The input is the monthly GeoTIFF archive, or with --cube a file holding one
+band per month (netCDF variable, Zarr, multi-band GeoTIFF, VRT stack) whose
+band descriptions are the YYYYMM labels.
+
+Outputs (GeoTIFF, masked outside NA boundary), per variable, next to the
+IQR and correlation products:
+- trend_<var>_<start>_<end>_slope.tif     OLS slope, units per year
+- trend_<var>_<start>_<end>_ci_low.tif    lower / upper CONF bound of the slope
+- trend_<var>_<start>_<end>_ci_high.tif
+- trend_<var>_<start>_<end>_n.tif         steps used
+- trend_<var>_<start>_<end>_sen.tif       Theil-Sen slope per year (unless --no-sen)
+- trend_<var>_<start>_<end>_mk_s.tif      Mann-Kendall S, var(S) and two-sided p
+- trend_<var>_<start>_<end>_mk_var.tif    (unless --no-mk)
+- trend_<var>_<start>_<end>_mk_p.tif
+- trend_<var>_<start>_<end>_mk_sig.tif    +1 / -1 where p < MK_ALPHA (sign of S), else 0
+Monthly runs add "_monthly" before the product name.
+
+Examples:
+  python trend_maps.py                                 # both variables, default periods
+  python trend_maps.py --variable wtd --max-memory 8G
+  python trend_maps.py --variable pe --start 2001 --end 2024 --no-sen
+  python trend_maps.py --variable pe --series monthly --cube /data/pe_monthly.nc
+"""
+
+import os
+import re
+import argparse
+from contextlib import ExitStack
+from functools import partial
+
+import numpy as np
+import rasterio
+
+import geopandas as gpd
+
+from pwtl.blocks import auto_block_size, describe_budget, parse_memory, raster_block_shape
+from pwtl.cog import open_cog
+from pwtl.points import ARCHIVE_PATTERNS, monthly_files
+from pwtl.prefetch import DEFAULT_DEPTH, prefetch
+from pwtl.preview import open_raster, preview_dir, set_preview_factor
+from pwtl.storage import read_decoded, storage_profile
+from pwtl.tilemask import TileMaskCache
+from pwtl.trace import Tracer
+from pwtl.trend import PAIRWISE_MAX_BYTES, OLSTrend, mann_kendall, theil_sen_slope
+
+
+# =========================
+# USER SETTINGS
+# =========================
+PREC_DIR = "/media/mohammad/My Book/0-2025/Monthly/pr/CMIP6/monthly/downscaled/N_America/1"
+EVAP_DIR = "/media/mohammad/My Book/0-2025/Monthly/evap/CMIP6/monthly/downscaled/N_America/1"
+WTD_DIR  = "/media/mohammad/My Book/WTM_Result/Monthly/3"
+OUT_DIR  = "/home/mohammad/Desktop/1"
+
+# default (start, end) year of each variable's trend
+PERIODS = {
+    "wtd": (1875, 2015),
+    "pe":  (2000, 2025),
+}
+
+# "annual" (annual means) or "monthly" (every month, t = year + (month - 0.5) / 12)
+SERIES = "annual"
+# confidence level of the OLS slope interval
+CONF = 0.95
+# in annual series a year enters a pixel's series only with at least this many valid months
+MIN_MONTHS = 12
+# Theil-Sen slope and Mann-Kendall test as well (need the window's steps x window stack)
+SEN = True
+MK = True
+# significance level of the mk_sig map
+MK_ALPHA = 0.05
+
+BLOCK_SIZE = 512
+# memory budget, e.g. "8G" (or --max-memory 8G): when set, the block size is the
+# largest window that fits, aligned to the input GeoTIFF tiles, and BLOCK_SIZE is ignored
+MAX_MEMORY = None
+# inside-boundary tile masks (packed bits) are built once per grid/boundary/block here
+MASK_CACHE_DIR = os.path.join(OUT_DIR, "mask_cache")
+
+NA_BOUNDARY_SHP = "/home/mohammad/Desktop/N_America_shapefile/N_America_boundery_without_greenland.shp"
+
+# per-stage wall/CPU/I-O trace (JSON; Chrome trace too if TRACE_CHROME)
+TRACE_DIR = os.path.join(OUT_DIR, "traces")
+TRACE_CHROME = False
+
+# Working set for MAX_MEMORY, as (count, dtype) per pixel:
+# per window: OLS sums + count, the year's monthly sum + count, 2 months read ahead
+# per input (P and E for pe), ~6 temporaries, boundary mask; the series stack for
+# Theil-Sen / Mann-Kendall (one float32 per step) is added in main()
+WINDOW_TERMS = [(5, "float64"), (1, "int32"), (1, "float64"), (1, "int16"),
+                (2 * DEFAULT_DEPTH, "float32"), (6, "float32"), (1, "bool")]
+# =========================
+
+
+_YYYYMM = re.compile(r"^\d{6}$")
+
+
+def list_months(variable, cube=None):
+    """
+    Sorted [(yyyymm, (path, ...), band)]: the WTD file, the P and E files of
+    the month (band None), or the month's band of `cube`.
+    """
+    if cube is not None:
+        with rasterio.open(cube) as src:
+            labels = list(src.descriptions)
+        if not all(d and _YYYYMM.match(d) for d in labels):
+            raise SystemExit(f"Band descriptions of {cube} are not all YYYYMM labels: {labels[:3]} ...")
+        return sorted((d, (cube,), b) for b, d in enumerate(labels, start=1))
+    if variable == "wtd":
+        return [(m, (p,), None) for m, p in monthly_files(WTD_DIR, ARCHIVE_PATTERNS["WTD"])]
+    prec = dict(monthly_files(PREC_DIR, ARCHIVE_PATTERNS["P"]))
+    evap = dict(monthly_files(EVAP_DIR, ARCHIVE_PATTERNS["E"]))
+    common = sorted(set(prec) & set(evap))
+    if not common:
+        raise RuntimeError("No common YYYYMM found between precip and evaporation folders.")
+    return [(m, (prec[m], evap[m]), None) for m in common]
+
+
+def read_block(path, window, nodata):
+    with open_raster(path) as src:
+        a = read_decoded(src, 1, window=window)
+    if nodata is not None:
+        a[(a == nodata) | (~np.isfinite(a))] = np.nan
+    else:
+        a[~np.isfinite(a)] = np.nan
+    return a
+
+
+def read_value(item, window, nodata):
+    """WTD, or P - E, of one month for `window` (the prefetch() loader)."""
+    _, paths, _ = item
+    a = read_block(paths[0], window, nodata)
+    if len(paths) == 2:
+        a = a - read_block(paths[1], window, nodata)
+    return a
+
+
+def read_cube(path, window, nodata):
+    """Every band of a cube for `window` in one read: (bands, rows, cols)."""
+    with open_raster(path) as src:
+        a = read_decoded(src, None, window=window)
+    if nodata is not None:
+        a[a == nodata] = np.nan
+    return a
+
+
+def cube_band(item, bands):
+    return bands[item[2] - 1]
+
+
+def series_times(months, series):
+    """Time of each step of the series, in years."""
+    if series == "annual":
+        return np.array(sorted({int(m[0][:4]) for m in months}), dtype=np.float64)
+    return np.array([int(m[0][:4]) + (int(m[0][4:6]) - 0.5) / 12.0 for m in months])
+
+
+def series_steps(months, window, nodata, inside, series):
+    """Yield the window's series in time order: the months, or the annual means."""
+    read = partial(read_value, window=window, nodata=nodata)
+    if months[0][2] is not None:
+        # a cube: the window of all bands is read (and decompressed) once, not once per month
+        read = partial(cube_band, bands=read_cube(months[0][1][0], window, nodata))
+    if series == "monthly":
+        for _, a in prefetch(months, read):
+            a[~inside] = np.nan
+            yield a
+        return
+
+    wh, ww = int(window.height), int(window.width)
+    ysum = np.zeros((wh, ww), dtype=np.float64)
+    ycnt = np.zeros((wh, ww), dtype=np.int16)
+    current = None
+    for (yyyymm, _, _), a in prefetch(months, read):
+        year = int(yyyymm[:4])
+        if current is not None and year != current:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                yield np.where(ycnt >= MIN_MONTHS, ysum / ycnt, np.nan).astype(np.float32)
+            ysum[...] = 0.0
+            ycnt[...] = 0
+        current = year
+        a[~inside] = np.nan
+        valid = np.isfinite(a)
+        ysum[valid] += a[valid]
+        ycnt[valid] += 1
+    if current is not None:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            yield np.where(ycnt >= MIN_MONTHS, ysum / ycnt, np.nan).astype(np.float32)
+
+
+def trend_window(months, times, window, nodata, inside, series, sen=True, mk=True):
+    """
+    Fit the window's series. Returns {product: float32 map} for the products
+    listed in the module docstring.
+    """
+    wh, ww = int(window.height), int(window.width)
+    ols = OLSTrend((wh, ww), t_ref=0.5 * (times[0] + times[-1]))
+    stack = np.full((len(times), wh, ww), np.nan, dtype=np.float32) if (sen or mk) else None
+
+    for k, y in enumerate(series_steps(months, window, nodata, inside, series)):
+        ols.update(times[k], y)
+        if stack is not None:
+            stack[k] = y
+
+    res = ols.result(conf=CONF)
+    out = {"slope": res.slope, "ci_low": res.ci_low, "ci_high": res.ci_high,
+           "n": res.n.astype(np.float32)}
+    if sen:
+        out["sen"] = theil_sen_slope(stack, times)
+    if mk:
+        test = mann_kendall(stack)
+        sig = np.where(test.p < MK_ALPHA, np.sign(test.s), 0.0).astype(np.float32)
+        sig[~np.isfinite(test.p)] = np.nan
+        out.update(mk_s=test.s, mk_var=test.var_s, mk_p=test.p, mk_sig=sig)
+    for arr in out.values():
+        arr[~inside] = np.nan
+    return out
+
+
+def trend_maps(variable, start, end, out_dir, tiles, series="annual", cube=None, sen=True, mk=True):
+    months = [m for m in list_months(variable, cube) if start <= int(m[0][:4]) <= end]
+    if not months:
+        raise SystemExit(f"No {variable} months in {start}-{end}.")
+    times = series_times(months, series)
+    print(f"{variable}: {len(months)} months, {len(times)} {series} steps ({months[0][0]}-{months[-1][0]})")
+    if len(times) < 3:
+        raise SystemExit(f"Need at least 3 steps for a trend, found {len(times)}.")
+
+    with open_raster(months[0][1][0]) as ref:
+        profile = ref.profile.copy()
+        nodata = ref.nodata
+    profile = storage_profile(dict(profile, count=1), "float32")
+
+    tag = "" if series == "annual" else "_monthly"
+    base = os.path.join(out_dir, f"trend_{variable}_{start}_{end}{tag}")
+    products = (["slope", "ci_low", "ci_high", "n"] + (["sen"] if sen else [])
+                + (["mk_s", "mk_var", "mk_p", "mk_sig"] if mk else []))
+    paths = {name: f"{base}_{name}.tif" for name in products}
+
+    n_windows = sum(1 for _ in tiles.all_windows())
+    n_valid = n_sig = n_mk_sig = 0
+    slope_sum = 0.0
+    with ExitStack() as stack:
+        dsts = {name: stack.enter_context(open_cog(path, profile)) for name, path in paths.items()}
+        for i, win in enumerate(tiles.all_windows(), start=1):
+            wh, ww = int(win.height), int(win.width)
+
+            if tiles.is_outside(win):
+                empty = np.full((wh, ww), np.nan, dtype=np.float32)
+                for dst in dsts.values():
+                    dst.write(empty, 1, window=win)
+                continue
+
+            inside = tiles.window_mask(win)
+            out = trend_window(months, times, win, nodata, inside, series, sen=sen, mk=mk)
+            for name, dst in dsts.items():
+                dst.write(out[name], 1, window=win)
+
+            valid = np.isfinite(out["slope"])
+            n_valid += int(valid.sum())
+            n_sig += int(((out["ci_low"] > 0) | (out["ci_high"] < 0)).sum())
+            slope_sum += float(out["slope"][valid].astype(np.float64).sum())
+            if mk:
+                n_mk_sig += int(np.count_nonzero(np.nan_to_num(out["mk_sig"])))
+            if i % 50 == 0 or i == n_windows:
+                print(f"  window {i}/{n_windows}")
+
+    for path in paths.values():
+        print(f"Saved tif: {path}")
+    if n_valid:
+        print(f"  mean slope {slope_sum / n_valid:.4g}/yr over {n_valid} pixels, "
+              f"{100.0 * n_sig / n_valid:.1f}% with a CI excluding 0")
+        if mk:
+            print(f"  Mann-Kendall p < {MK_ALPHA}: {100.0 * n_mk_sig / n_valid:.1f}% of pixels")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--variable", choices=sorted(PERIODS), action="append",
+                    help="wtd or pe; repeat for both (default: both)")
+    ap.add_argument("--start", type=int, help="first year (default: PERIODS)")
+    ap.add_argument("--end", type=int, help="last year (default: PERIODS)")
+    ap.add_argument("--series", choices=["annual", "monthly"], default=SERIES,
+                    help="fit annual means or every month")
+    ap.add_argument("--cube", help="read the variable from this cube (one band per month, "
+                                   "descriptions YYYYMM) instead of the monthly GeoTIFFs")
+    ap.add_argument("--no-sen", action="store_true", help="skip the Theil-Sen slope")
+    ap.add_argument("--no-mk", action="store_true", help="skip the Mann-Kendall test")
+    ap.add_argument("--max-memory", default=MAX_MEMORY, help="memory budget, e.g. 8G (sets the block size)")
+    ap.add_argument("--preview-factor", type=int, default=1,
+                    help="read inputs at 1/N resolution (~N^2 faster); outputs go to preview_xN")
+    args = ap.parse_args()
+
+    set_preview_factor(args.preview_factor)
+    out_dir = preview_dir(OUT_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+    sen = SEN and not args.no_sen
+    mk = MK and not args.no_mk
+    variables = args.variable or sorted(PERIODS)
+    if args.cube and len(variables) > 1:
+        raise SystemExit("--cube holds one variable; pick it with --variable.")
+
+    trace = Tracer("trend_maps")
+    trace.begin("setup")
+    if not os.path.exists(NA_BOUNDARY_SHP):
+        raise SystemExit(f"NA boundary shapefile not found: {NA_BOUNDARY_SHP}")
+    na_gdf = gpd.read_file(NA_BOUNDARY_SHP)
+    if na_gdf.crs is None:
+        raise SystemExit("NA boundary shapefile has no CRS. Please define it (e.g., EPSG:4326) then rerun.")
+
+    for variable in variables:
+        start = args.start if args.start is not None else PERIODS[variable][0]
+        end = args.end if args.end is not None else PERIODS[variable][1]
+        print(f"\n=== {variable}: {start}-{end} ({args.series}) ===")
+        trace.begin(f"{variable} boundary mask")
+
+        ref_path = list_months(variable, args.cube)[0][1][0]
+        with open_raster(ref_path) as ref:
+            raster_crs, ref_transform = ref.crs, ref.transform
+            ref_width, ref_height = ref.width, ref.height
+
+        block = BLOCK_SIZE
+        if args.max_memory:
+            budget = parse_memory(args.max_memory)
+            n_steps = (end - start + 1) * (12 if args.series == "monthly" else 1)
+            terms = WINDOW_TERMS + ([(n_steps, "float32")] if (sen or mk) else [])
+            if args.cube:
+                # the window of every band of the cube
+                terms = terms + [(len(list_months(variable, args.cube)), "float32")]
+            # Theil-Sen / Mann-Kendall work on pixel slices of PAIRWISE_MAX_BYTES whatever the window
+            budget -= PAIRWISE_MAX_BYTES if (sen or mk) else 0
+            block = auto_block_size(
+                budget, terms, (), shape=(ref_height, ref_width),
+                block_shape=raster_block_shape(ref_path)
+            )
+            print("Memory budget:", describe_budget(block, budget, terms, (), (ref_height, ref_width)))
+
+        na_shapes = [geom for geom in na_gdf.to_crs(raster_crs).geometry if geom is not None]
+        tiles = TileMaskCache(
+            na_shapes, ref_width, ref_height, ref_transform, block,
+            crs=raster_crs, cache_dir=MASK_CACHE_DIR
+        )
+        print(f"Boundary mask: {tiles.summary()}")
+
+        trace.begin(f"{variable} trend pass")
+        trend_maps(variable, start, end, out_dir, tiles, series=args.series, cube=args.cube, sen=sen, mk=mk)
+
+    trace.finish(TRACE_DIR, chrome=TRACE_CHROME)
+    print("\nDone.")
+
+
+if __name__ == "__main__":
+    main()